@@ -0,0 +1,9 @@
+"""Нагрузочные замеры бота. Запуск из корня репозитория: python -m benchmarks.<имя>
+
+Основные пути кода на синтетических данных с результатом в JSON и
+сравнением прогонов - benchmarks.suite и benchmarks.compare.
+"""
+import os
+
+# config.py требует токен, а замерам настоящий бот не нужен
+os.environ.setdefault('BOT_TOKEN', 'benchmark')
@@ -0,0 +1,114 @@
+"""Снижение нагрузки на базу от кэша списков на воспроизведённом трафике.
+
+Трасса - JSON Lines с событиями {"user_id": 1, "op": "today"}; op одно из
+today, tomorrow, all, weekly (просмотры) и add, delete, add_weekly,
+complete_weekly (изменения). Без --trace генерируется синтетическая трасса,
+где активные пользователи нажимают кнопки чаще (распределение Ципфа).
+Запросы считаются на фейковой базе, PostgreSQL не нужен.
+
+    python -m benchmarks.cache_replay --events 100000
+    python -m benchmarks.cache_replay --trace trace.jsonl
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import Counter
+from datetime import date, timedelta
+
+from cache import TaskCache
+from database import AsyncDatabase
+
+VIEWS = ['today', 'tomorrow', 'all', 'weekly']
+WRITES = ['add', 'delete', 'add_weekly', 'complete_weekly']
+
+
+class CountingDatabase:
+    """Заглушка Database, которая только считает обращения"""
+
+    maxconn = 4
+
+    def __init__(self):
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls[name] += 1
+            return [] if name.startswith('get_') else 1
+        return method
+
+    def close(self):
+        pass
+
+
+def synthetic_trace(events: int, users: int, write_share: float):
+    weights = [1 / rank for rank in range(1, users + 1)]
+    user_ids = random.choices(range(1, users + 1), weights, k=events)
+    for user_id in user_ids:
+        op = random.choice(WRITES) if random.random() < write_share else random.choice(VIEWS)
+        yield {'user_id': user_id, 'op': op}
+
+
+async def replay(db: AsyncDatabase, trace) -> int:
+    today = date.today()
+    tomorrow = today + timedelta(days=1)
+    week = today - timedelta(days=today.weekday())
+    events = 0
+
+    for event in trace:
+        user_id, op = event['user_id'], event['op']
+        if op == 'today':
+            await db.get_user_tasks(user_id, today.isoformat())
+        elif op == 'tomorrow':
+            await db.get_user_tasks(user_id, tomorrow.isoformat())
+        elif op == 'all':
+            await db.get_user_tasks(user_id)
+        elif op == 'weekly':
+            await db.get_weekly_tasks(user_id, week.isoformat())
+        elif op == 'add':
+            await db.add_task(user_id, 'задача', today.isoformat(), '12:00')
+        elif op == 'delete':
+            await db.delete_task(1, user_id)
+        elif op == 'add_weekly':
+            await db.add_weekly_task(user_id, 'задача', week.isoformat())
+        elif op == 'complete_weekly':
+            await db.complete_weekly_task(1, user_id)
+        events += 1
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trace', help='файл трассы (JSON Lines)')
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--write-share', type=float, default=0.1)
+    parser.add_argument('--max-entries', type=int, default=10000)
+    parser.add_argument('--ttl', type=float, default=300)
+    args = parser.parse_args()
+
+    def load_trace():
+        if args.trace:
+            with open(args.trace, encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        random.seed(1)
+        return list(synthetic_trace(args.events, args.users, args.write_share))
+
+    trace = load_trace()
+    reads = sum(1 for event in trace if event['op'] in VIEWS)
+
+    counting = CountingDatabase()
+    db = AsyncDatabase(counting, TaskCache(args.max_entries, args.ttl))
+    events = asyncio.run(replay(db, trace))
+    db.close()
+
+    db_reads = counting.calls['get_user_tasks'] + counting.calls['get_weekly_tasks']
+    stats = db.cache.stats()
+    print(f"событий: {events}, просмотров списков: {reads}")
+    print(f"запросов списков к базе: {db_reads} (без кэша было бы {reads})")
+    print(f"попаданий: {stats['hits']}, промахов: {stats['misses']}, доля попаданий: {stats['hit_rate']:.1%}")
+    print(f"снижение нагрузки чтения: {1 - db_reads / reads:.1%}" if reads else "просмотров нет")
+
+
+if __name__ == '__main__':
+    main()
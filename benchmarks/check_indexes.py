@@ -0,0 +1,94 @@
+"""Проверка по EXPLAIN, что горячие запросы Database используют индексы миграций.
+
+Запросы берутся из самих методов Database: _fetchall подменяется на EXPLAIN,
+а последовательное сканирование запрещается, чтобы на маленькой базе
+планировщик не выбрал seq scan только из-за размера таблиц.
+
+tasks секционирована по месяцам: индексы секций называются по столбцам
+(tasks_202401_user_id_task_date_task_time_id_idx), а горячие запросы не
+должны читать секции прошедших месяцев - проверяется и то, сколько секций
+попало в план.
+
+    DATABASE_URL=postgresql://localhost/planner python -m benchmarks.check_indexes
+"""
+import re
+import sys
+from datetime import datetime, timedelta
+
+from config import TASKS_PAGE_SIZE
+from database import Database
+from timezones import utc_now
+
+# Индексы секций tasks по столбцам индекса на самой tasks
+TASKS_USER_DUE = 'user_id_task_date_task_time_id_idx'
+TASKS_DUE_AT = '_due_at_idx'
+TASKS_NEXT_REMIND = '_next_remind_at_idx'
+PARTITION_RE = re.compile(r'\btasks_(?:\d{6}|default)\b')
+
+
+class ExplainingDatabase(Database):
+    """Database, которая вместо выполнения SELECT возвращает его план"""
+
+    def __init__(self):
+        self.plans = []
+        super().__init__(minconn=1, maxconn=1)
+
+    def _fetchall(self, query, params=None):
+        def explain(cursor):
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + query, params or ())
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.plans.append(self._run(explain))
+        return []
+
+    def _stream(self, query, params=None, batch_size=500):
+        self._fetchall(query, params)
+        return iter(())
+
+    def plan_of(self, method, *args):
+        self.plans.clear()
+        method(*args)
+        return self.plans[-1] if self.plans else ''
+
+
+def _drain(generator_method):
+    """Генераторный метод выполняет запрос только при переборе"""
+    return lambda *args: list(generator_method(*args))
+
+
+def main():
+    db = ExplainingDatabase()
+    now = datetime.now()
+    today = now.strftime('%Y-%m-%d')
+    utc = utc_now()
+
+    # (название, индекс, сколько секций tasks может попасть в план, метод, аргументы)
+    checks = [
+        ("Сегодня/Завтра", TASKS_USER_DUE, 1, db.get_user_tasks, 1, today),
+        ("Мои задачи", TASKS_USER_DUE, None, db.get_user_tasks_page, 1, None, False, TASKS_PAGE_SIZE, now),
+        ("Мои задачи, следующая страница", TASKS_USER_DUE, None, db.get_user_tasks_page,
+         1, (now.date(), now.time(), 1), False, TASKS_PAGE_SIZE, now),
+        ("Загрузка планировщика", TASKS_DUE_AT, 2, db.get_upcoming_tasks, utc, utc + timedelta(days=1)),
+        ("Обход напоминаний", TASKS_NEXT_REMIND, 2, db.get_due_reminders, utc),
+        ("Недельные задачи", 'weekly_tasks_user_week_idx', None, db.get_weekly_tasks, 1, today),
+        ("Напоминание в 10:00", 'weekly_tasks_open_idx', None, _drain(db.iter_weekly_tasks_by_user), today),
+    ]
+
+    failed = 0
+    for title, index, max_partitions, method, *args in checks:
+        plan = db.plan_of(method, *args)
+        partitions = set(PARTITION_RE.findall(plan))
+        ok = index in plan and (max_partitions is None or len(partitions) <= max_partitions)
+        failed += not ok
+        scanned = f" (секции: {', '.join(sorted(partitions))})" if partitions else ''
+        print(f"{'✅' if ok else '❌'} {title}: {index}{scanned}")
+        if not ok:
+            print(plan)
+
+    db.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Сравнение двух прогонов benchmarks.suite: регрессии по порогам.
+
+Сравнивается p95 каждого сценария. Регрессия - замедление больше порога
+сценария (THRESHOLDS, по умолчанию --threshold) и больше MIN_DELTA_MS,
+чтобы шум в доли миллисекунды не ронял проверку. Код выхода 1, если есть
+хоть одна регрессия.
+
+    python -m benchmarks.compare bench-abc1234.json bench-def5678.json
+"""
+import argparse
+import json
+
+METRIC = 'p95_ms'
+DEFAULT_THRESHOLD = 0.2
+# Сценарии, которые на общей машине заметно шумят, - с запасом
+THRESHOLDS = {
+    'daily_sweep': 0.3,
+    'weekly_fanout': 0.3,
+    'week_rollover': 0.5,
+}
+MIN_DELTA_MS = 1.0
+
+
+def load(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline: dict, current: dict, default_threshold: float = DEFAULT_THRESHOLD):
+    """(строки отчёта, названия сценариев с регрессией)"""
+    lines = [f"{'сценарий':<16}{'было, мс':>11}{'стало, мс':>11}{'изменение':>11}  порог"]
+    regressions = []
+    for name, result in current['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            lines.append(f"{name:<16}{'-':>11}{result[METRIC]:>11.2f}{'новый':>11}")
+            continue
+        before, after = base[METRIC], result[METRIC]
+        change = (after - before) / before if before else 0.0
+        threshold = THRESHOLDS.get(name, default_threshold)
+        regressed = change > threshold and after - before > MIN_DELTA_MS
+        if regressed:
+            regressions.append(name)
+        lines.append(
+            f"{name:<16}{before:>11.2f}{after:>11.2f}{change:>+10.0%} {'❌' if regressed else '✅'} {threshold:.0%}"
+        )
+    return lines, regressions
+
+
+def report(baseline: dict, current: dict, default_threshold: float = DEFAULT_THRESHOLD) -> bool:
+    """Напечатать сравнение; True, если регрессий нет"""
+    print(f"{baseline['commit']} -> {current['commit']} ({METRIC})")
+    if baseline['params'] != current['params']:
+        print("⚠️ Прогоны с разными параметрами, сравнение приблизительное")
+    lines, regressions = compare(baseline, current, default_threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f"❌ Регрессии: {', '.join(regressions)}")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='допустимое замедление для сценариев без своего порога')
+    args = parser.parse_args()
+    if not report(load(args.baseline), load(args.current), args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
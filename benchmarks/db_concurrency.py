@@ -0,0 +1,73 @@
+"""Пропускная способность обработки параллельных обновлений: до и после пула.
+
+"До" - синхронные вызовы Database на одном соединении прямо из корутин
+(как раньше делали обработчики PlannerBot). "После" - AsyncDatabase с пулом.
+В обоих случаях запрос идёт в базу: кэш списков AsyncDatabase обходится,
+иначе "после" замеряло бы попадания в кэш, а не пул.
+
+    DATABASE_URL=postgresql://localhost/planner python -m benchmarks.db_concurrency --updates 2000
+"""
+import argparse
+import asyncio
+import time
+
+from database import Database, AsyncDatabase
+
+BENCH_USER_ID = 1
+
+
+async def run_blocking(db: Database, updates: int, concurrency: int, slow_ms: int) -> float:
+    async def handle():
+        db.get_user_tasks(BENCH_USER_ID)
+        if slow_ms:
+            db._fetchone("SELECT pg_sleep(%s)", (slow_ms / 1000,))
+
+    return await _drive(handle, updates, concurrency)
+
+
+async def run_async(db: AsyncDatabase, updates: int, concurrency: int, slow_ms: int) -> float:
+    async def handle():
+        await db.run(db.db.get_user_tasks, BENCH_USER_ID)
+        if slow_ms:
+            await db.run(db.db._fetchone, "SELECT pg_sleep(%s)", (slow_ms / 1000,))
+
+    return await _drive(handle, updates, concurrency)
+
+
+async def _drive(handle, updates: int, concurrency: int) -> float:
+    """Обработать updates обновлений, не больше concurrency одновременно; вернуть обновлений/с"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handle()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(updates)))
+    return updates / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--pool', type=int, default=10, help='размер пула соединений')
+    parser.add_argument('--slow-ms', type=int, default=5, help='имитация медленного запроса')
+    args = parser.parse_args()
+
+    single = Database(minconn=1, maxconn=1)
+    single.add_user(BENCH_USER_ID, 'bench', 'Bench')
+    before = asyncio.run(run_blocking(single, args.updates, args.concurrency, args.slow_ms))
+    single.close()
+
+    pooled = AsyncDatabase(Database(minconn=1, maxconn=args.pool))
+    after = asyncio.run(run_async(pooled, args.updates, args.concurrency, args.slow_ms))
+    pooled.close()
+
+    print(f"до (одно блокирующее соединение): {before:8.1f} обновлений/с")
+    print(f"после (пул из {args.pool}):        {after:8.1f} обновлений/с")
+    print(f"ускорение: x{after / before:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Стоимость выбора обработчика для обновления: цепочка фильтров против routing.Router.
+
+Обе раскладки собираются из настоящих обработчиков PTB с пустыми колбэками,
+как в PlannerBot.setup_handlers до и после перехода на Router. Замеряется
+только выбор обработчика (check_update по порядку, как в Application, плюс
+поиск в таблице Router), сами обработчики не вызываются. Смесь обновлений -
+в основном кнопки меню, затем команды, свободный текст и удаление по ID.
+
+    python -m benchmarks.dispatch --updates 200000
+"""
+import argparse
+import random
+import time
+import warnings
+from datetime import datetime
+
+from telegram import Chat, Message, MessageEntity, Update, User
+from telegram.ext import CommandHandler, ConversationHandler, MessageHandler, filters
+
+from routing import Router
+
+MENU = [
+    "📋 Мои задачи", "📅 Сегодня", "📆 Завтра", "ℹ️ Помощь", "🗑 Удалить задачу",
+    "⬅️ Назад", "🗓 Недельные задачи", "📋 Мои недельные задачи",
+]
+COMMANDS = [
+    "start", "help", "tasks", "today", "tomorrow", "delete", "clear",
+    "timezone", "repeat", "unrepeat", "import", "export",
+]
+
+# (доля, генератор текста)
+MIX = [
+    (0.60, lambda: random.choice(MENU)),
+    (0.15, lambda: '/' + random.choice(['today', 'tomorrow', 'tasks', 'start'])),
+    (0.05, lambda: '/add завтра 15:30 позвонить маме'),
+    (0.10, lambda: 'купить молоко'),
+    (0.05, lambda: str(random.randint(1, 5000))),
+    (0.05, lambda: '/unknown'),
+]
+
+
+class BenchBot:
+    """Вместо Bot: CommandHandler спрашивает у сообщения только имя бота"""
+
+    username = 'planner_bot'
+
+
+async def noop(update, context):
+    pass
+
+
+def conversations():
+    """Диалоги добавления задачи - одинаковые в обеих раскладках"""
+    not_menu = filters.TEXT & ~filters.Text(["❌ Отмена", "⬅️ Назад"])
+    fallbacks = [MessageHandler(filters.Text("❌ Отмена"), noop), MessageHandler(filters.Text("⬅️ Назад"), noop)]
+    return [
+        ConversationHandler(
+            entry_points=[MessageHandler(filters.Text("📝 Добавить задачу"), noop), CommandHandler("add", noop)],
+            states={0: [MessageHandler(not_menu, noop)], 1: [MessageHandler(not_menu, noop)], 2: [MessageHandler(not_menu, noop)]},
+            fallbacks=fallbacks + [CommandHandler("cancel", noop)],
+        ),
+        ConversationHandler(
+            entry_points=[MessageHandler(filters.Text("➕ Добавить недельную задачу"), noop)],
+            states={4: [MessageHandler(not_menu, noop)], 5: [MessageHandler(not_menu, noop)]},
+            fallbacks=fallbacks,
+        ),
+    ]
+
+
+def chain_layout():
+    """Раскладка до Router: по обработчику на команду и кнопку"""
+    return (
+        [CommandHandler(name, noop) for name in COMMANDS]
+        + conversations()
+        + [MessageHandler(filters.Text(text), noop) for text in MENU + ["➕ Добавить недельную задачу"]]
+        + [
+            MessageHandler(filters.Regex(r'^\d+(?:[\s,]+\d+)*$'), noop),
+            MessageHandler(filters.COMMAND, noop),
+            MessageHandler(filters.TEXT, noop),
+        ]
+    )
+
+
+def router_layout():
+    router = Router(
+        texts={text: noop for text in MENU},
+        commands={name: noop for name in COMMANDS},
+        task_ids=noop, unknown_command=noop, default=noop,
+    )
+    command_handler = MessageHandler(filters.Regex(router.command_re), noop)
+    text_handler = MessageHandler(filters.TEXT, noop)
+    return router, [command_handler] + conversations() + [text_handler], command_handler
+
+
+def make_update(update_id, text):
+    user = User(update_id % 1000 + 1, 'Bench', False)
+    entities = None
+    if text.startswith('/'):
+        entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split()[0]))]
+    message = Message(update_id, datetime.now(), Chat(user.id, Chat.PRIVATE), from_user=user, text=text, entities=entities)
+    message.set_bot(BenchBot())
+    return Update(update_id, message=message)
+
+
+def select_chain(handlers, update):
+    for handler in handlers:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler
+    return None
+
+
+def select_router(router, handlers, command_handler, update):
+    handler = select_chain(handlers, update)
+    if handler is command_handler:
+        # То же, что делает PlannerBot.dispatch_command с context.match
+        return router.resolve_command(router.command_re.match(update.message.text), BenchBot.username)[0]
+    if handler is handlers[-1]:
+        return router.resolve_text(update.message.text)
+    return handler
+
+
+def measure(select, updates):
+    started = time.perf_counter()
+    for update in updates:
+        select(update)
+    return (time.perf_counter() - started) / len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    shares, makers = zip(*MIX)
+    updates = [make_update(i + 1, random.choices(makers, shares)[0]()) for i in range(args.updates)]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # Предупреждения PTB о настройках ConversationHandler
+        chain = chain_layout()
+        router, handlers, command_handler = router_layout()
+
+    chain_cost = measure(lambda update: select_chain(chain, update), updates)
+    router_cost = measure(lambda update: select_router(router, handlers, command_handler, update), updates)
+
+    print(f"обновлений: {len(updates)}, обработчиков: {len(chain)} -> {len(handlers)}")
+    print(f"цепочка фильтров: {chain_cost * 1e6:.2f} мкс на обновление")
+    print(f"Router:           {router_cost * 1e6:.2f} мкс на обновление ({chain_cost / router_cost:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Доставка напоминаний несколькими экземплярами планировщика на одной базе.
+
+Каждый экземпляр - отдельный Scheduler со своим пулом соединений, как у
+отдельного процесса бота. Все одновременно обходят одни и те же должные
+напоминания; проверяется, что каждое отправлено ровно один раз.
+
+    DATABASE_URL=postgresql://localhost/planner python -m benchmarks.multi_replica --replicas 4 --tasks 2000
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import timedelta
+
+from database import Database, AsyncDatabase
+from reminders import DEFAULT_MASK, describe_mask, offsets_of
+from scheduler import Scheduler
+from timezones import utc_now
+
+BENCH_USER_ID = 3
+
+
+class RecordingSender:
+    """Вместо очереди отправки запоминает, кому что отправлено"""
+
+    def __init__(self, sent: Counter):
+        self.sent = sent
+
+    async def send(self, chat_id, text, **kwargs):
+        self.sent[text] += 1
+
+
+def seed(db: Database, tasks: int):
+    """Задачи через минуту: у каждой должны все напоминания сразу"""
+    db.add_user(BENCH_USER_ID, 'bench', 'Bench')
+    db.set_reminder_mask(BENCH_USER_ID, DEFAULT_MASK)
+    db._execute_query('DELETE FROM tasks WHERE user_id = %s', (BENCH_USER_ID,))
+    due_at = utc_now() + timedelta(minutes=1)
+
+    def insert(cursor):
+        cursor.execute('''
+            INSERT INTO tasks (user_id, task_text, task_date, task_time, due_at, next_remind_at)
+            SELECT %s, 'Задача ' || n, %s, %s, %s, %s
+            FROM generate_series(1, %s) AS n
+        ''', (BENCH_USER_ID, due_at.date(), due_at.time(), due_at,
+              due_at - timedelta(minutes=offsets_of(DEFAULT_MASK)[-1]), tasks))
+
+    db._run(insert)
+
+
+async def run(args):
+    sent = Counter()
+    replicas = [
+        Scheduler(RecordingSender(sent), AsyncDatabase(Database(minconn=1, maxconn=args.pool)))
+        for _ in range(args.replicas)
+    ]
+    for scheduler in replicas:
+        scheduler._sweep_lock = asyncio.Lock()
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        await asyncio.gather(*(scheduler.sweep() for scheduler in replicas))
+    elapsed = time.perf_counter() - started
+
+    for scheduler in replicas:
+        scheduler.db.close()
+    return sent, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replicas', type=int, default=4)
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=3, help='сколько раз каждый экземпляр обходит напоминания')
+    parser.add_argument('--pool', type=int, default=2)
+    args = parser.parse_args()
+
+    db = Database(minconn=1, maxconn=1)
+    seed(db, args.tasks)
+
+    sent, elapsed = asyncio.run(run(args))
+
+    left = db._fetchone('''
+        SELECT count(*) FROM tasks WHERE user_id = %s AND reminded = FALSE
+    ''', (BENCH_USER_ID,))[0]
+    db._execute_query('DELETE FROM tasks WHERE user_id = %s', (BENCH_USER_ID,))
+    db.close()
+
+    duplicates = sum(count - 1 for count in sent.values() if count > 1)
+    print(f"экземпляров: {args.replicas}, задач: {args.tasks}, напоминания {describe_mask(DEFAULT_MASK)}")
+    print(f"отправлено: {sum(sent.values())}, дублей: {duplicates}, не отправлено: {args.tasks - len(sent)}")
+    print(f"не отмечены: {left}, время: {elapsed:.2f} с")
+    if duplicates or len(sent) != args.tasks or left:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Скорость и точность разбора задачи одной строкой (quickadd.parse_quick_add).
+
+Корпус - типичные сообщения с ожидаемым результатом относительно
+фиксированного "сейчас": среда, 10.01.2024, 12:00.
+
+    python -m benchmarks.quick_add --repeat 2000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from quickadd import parse_quick_add
+
+NOW = datetime(2024, 1, 10, 12, 0)
+TODAY = NOW.date()
+
+def day(offset):
+    return TODAY + timedelta(days=offset)
+
+# (строка, (описание, дата, время))
+CORPUS = [
+    ("завтра 15:30 позвонить маме", ("позвонить маме", day(1), "15:30")),
+    ("в пятницу в 9 отчёт", ("отчёт", day(2), "09:00")),
+    ("позвонить маме завтра в 15:30", ("позвонить маме", day(1), "15:30")),
+    ("сегодня в 18:00 спортзал", ("спортзал", day(0), "18:00")),
+    ("послезавтра 10:00 стоматолог", ("стоматолог", day(2), "10:00")),
+    ("в 9 вечера созвон", ("созвон", day(0), "21:00")),
+    ("в 8 утра пробежка", ("пробежка", day(1), "08:00")),
+    ("в 3 дня встреча с командой", ("встреча с командой", day(0), "15:00")),
+    ("11:00 купить хлеб", ("купить хлеб", day(1), "11:00")),
+    ("через 30 минут выключить духовку", ("выключить духовку", day(0), "12:30")),
+    ("через час проверить почту", ("проверить почту", day(0), "13:00")),
+    ("через 2 часа забрать посылку", ("забрать посылку", day(0), "14:00")),
+    ("через 3 дня в 12:00 оплатить счёт", ("оплатить счёт", day(3), "12:00")),
+    ("через неделю в 10 планёрка", ("планёрка", day(7), "10:00")),
+    ("15.01 в 14:00 защита проекта", ("защита проекта", day(5), "14:00")),
+    ("20.02.2024 09:30 техосмотр", ("техосмотр", datetime(2024, 2, 20).date(), "09:30")),
+    ("25 декабря в 19:00 корпоратив", ("корпоратив", datetime(2024, 12, 25).date(), "19:00")),
+    ("1 марта 8:00 поздравить коллег", ("поздравить коллег", datetime(2024, 3, 1).date(), "08:00")),
+    ("в понедельник в 9:15 летучка", ("летучка", day(5), "09:15")),
+    ("во вторник 17:00 английский", ("английский", day(6), "17:00")),
+    ("в среду в 11 ревью", ("ревью", day(7), "11:00")),
+    ("в среду в 13 обед с Ирой", ("обед с Ирой", day(0), "13:00")),
+    ("в сб в 10 рынок", ("рынок", day(3), "10:00")),
+    ("в воскресенье в полдень бранч", ("бранч", day(4), "12:00")),
+    ("отчёт в пятницу в 9", ("отчёт", day(2), "09:00")),
+    ("завтра купить подарок", ("купить подарок", day(1), None)),
+    ("в четверг сдать отчёт", ("сдать отчёт", day(1), None)),
+    ("просто заметка", ("просто заметка", None, None)),
+    ("в 10ч созвон с клиентом", ("созвон с клиентом", day(1), "10:00")),
+    ("Завтра В 7:05 Поезд", ("Поезд", day(1), "07:05")),
+    ("сб 10:00 уборка", ("уборка", day(3), "10:00")),
+    ("пт в 9 купить 1.5 л молока", ("купить 1.5 л молока", day(2), "09:00")),
+    ("купить 2.5 кг яблок", ("купить 2.5 кг яблок", None, None)),
+    ("завтра отдать 3,25 руб", ("отдать 3,25 руб", day(1), None)),
+    ("обновить до 1.10.2 в 18:00", ("обновить до 1.10.2", day(0), "18:00")),
+    ("5.3.2024 в 12 ТО", ("ТО", datetime(2024, 3, 5).date(), "12:00")),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=1000, help='сколько раз разобрать корпус')
+    parser.add_argument('--verbose', action='store_true', help='показать все ошибки разбора')
+    args = parser.parse_args()
+
+    wrong = []
+    for text, expected in CORPUS:
+        result = parse_quick_add(text, NOW)
+        if result != expected:
+            wrong.append((text, expected, result))
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text, _ in CORPUS:
+            parse_quick_add(text, NOW)
+    elapsed = time.perf_counter() - started
+    parsed = args.repeat * len(CORPUS)
+
+    print(f"точность: {len(CORPUS) - len(wrong)}/{len(CORPUS)} ({1 - len(wrong) / len(CORPUS):.0%})")
+    print(f"скорость: {parsed / elapsed:,.0f} строк/с ({elapsed / parsed * 1e6:.1f} мкс на строку)")
+    for text, expected, result in wrong if args.verbose else wrong[:5]:
+        print(f"  ❌ {text!r}: ожидалось {expected}, получено {result}")
+
+
+if __name__ == '__main__':
+    main()
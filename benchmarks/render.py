@@ -0,0 +1,114 @@
+"""Память и время на ответ: готовые клавиатуры и шаблоны против сборки на каждый ответ.
+
+Старые варианты - как было в bot.py и scheduler.py: новый ReplyKeyboardMarkup
+и его to_dict() на каждый ответ, текст списка через +=. Новые - keyboards.*
+и templates.render_*. Для каждого случая печатаются время вызова и пик
+памяти (tracemalloc) одного вызова.
+
+    python -m benchmarks.render --tasks 50 --repeat 20000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from telegram import ReplyKeyboardMarkup
+
+from keyboards import MAIN_KEYBOARD, week_choice_keyboard
+from templates import render_tasks, render_weekly
+
+TODAY = date(2024, 1, 10)
+
+
+def legacy_main_keyboard():
+    keyboard = [
+        ["📝 Добавить задачу", "📋 Мои задачи"],
+        ["🗑 Удалить задачу", "📅 Сегодня"],
+        ["📆 Завтра", "🗓 Недельные задачи"],
+        ["ℹ️ Помощь"]
+    ]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True).to_dict()
+
+
+def legacy_week_choice_keyboard(today):
+    current_week_start = today - timedelta(days=today.weekday())
+    next_week_start = current_week_start + timedelta(days=7)
+    keyboard = [
+        [f"📅 Текущая неделя ({current_week_start.strftime('%d.%m')})"],
+        [f"📅 Следующая неделя ({next_week_start.strftime('%d.%m')})"],
+        ["❌ Отмена"]
+    ]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True).to_dict()
+
+
+def legacy_tasks_text(tasks):
+    tasks_text = ""
+    for task_id, task_text, task_date, task_time in tasks:
+        display_date = task_date.strftime("%d.%m.%Y")
+        tasks_text += f"🆔 {task_id}: {task_text}\n"
+        tasks_text += f"   📅 {display_date} 🕐 {task_time.strftime('%H:%M')}\n\n"
+    return tasks_text
+
+
+def legacy_weekly_text(tasks, week_start):
+    week_end = week_start + timedelta(days=6)
+    message = f"🗓 Задачи на неделю ({week_start.strftime('%d.%m')} - {week_end.strftime('%d.%m.%Y')}):\n\n"
+    completed_count = 0
+    for task_id, task_text, completed in tasks:
+        if completed:
+            message += f"✅ {task_text}\n"
+            completed_count += 1
+        else:
+            message += f"📝 {task_text}\n"
+    message += f"\n📊 Прогресс: {completed_count}/{len(tasks)} выполнено"
+    return message
+
+
+def measure(func, repeat):
+    """(мкс на вызов, пик памяти одного вызова в байтах)"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1e6, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=20, help='задач в списке')
+    parser.add_argument('--repeat', type=int, default=10000)
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 10, 9, 0)
+    tasks = [
+        (i + 1, f"задача номер {i + 1}", (start + timedelta(hours=i)).date(), (start + timedelta(hours=i)).time())
+        for i in range(args.tasks)
+    ]
+    weekly = [(i + 1, f"недельная задача {i + 1}", i % 3 == 0) for i in range(args.tasks)]
+    week_start = TODAY - timedelta(days=TODAY.weekday())
+    assert legacy_tasks_text(tasks) == render_tasks(tasks)
+    assert legacy_weekly_text(weekly, week_start) == render_weekly(weekly, week_start)
+
+    cases = [
+        ("главная клавиатура", legacy_main_keyboard, MAIN_KEYBOARD.to_dict),
+        ("выбор недели", lambda: legacy_week_choice_keyboard(TODAY), lambda: week_choice_keyboard(TODAY).to_dict()),
+        (f"список из {args.tasks} задач", lambda: legacy_tasks_text(tasks), lambda: render_tasks(tasks)),
+        (f"недельное напоминание ({args.tasks})", lambda: legacy_weekly_text(weekly, week_start),
+         lambda: render_weekly(weekly, week_start)),
+    ]
+    for name, legacy, current in cases:
+        legacy_time, legacy_peak = measure(legacy, args.repeat)
+        current_time, current_peak = measure(current, args.repeat)
+        print(f"{name}:")
+        print(f"  было:  {legacy_time:7.2f} мкс, пик {legacy_peak:7d} байт")
+        print(f"  стало: {current_time:7.2f} мкс, пик {current_peak:7d} байт")
+
+
+if __name__ == '__main__':
+    main()
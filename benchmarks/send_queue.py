@@ -0,0 +1,68 @@
+"""Устойчивая скорость отправки OutboundQueue на локальном фейковом боте.
+
+Фейковый бот отвечает с задержкой сети и иногда возвращает RetryAfter или
+TimedOut, поэтому замер учитывает и повторы.
+
+    python -m benchmarks.send_queue --messages 3000 --rate 30
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from telegram.error import RetryAfter, TimedOut
+
+from sender import OutboundQueue
+
+
+class FakeBot:
+    def __init__(self, latency: float, error_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.delivered = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        roll = random.random()
+        if roll < self.error_rate / 2:
+            raise TimedOut()
+        if roll < self.error_rate:
+            raise RetryAfter(1)
+        self.delivered += 1
+
+
+async def run(args) -> None:
+    bot = FakeBot(args.latency, args.error_rate)
+    queue = OutboundQueue(
+        bot, rate=args.rate, concurrency=args.concurrency,
+        chat_interval=args.chat_interval, maxsize=args.messages
+    )
+    await queue.start()
+
+    started = time.perf_counter()
+    for i in range(args.messages):
+        await queue.send(i % args.chats, f"Сообщение {i}")
+    # Ждём, пока доставятся все сообщения, включая повторы
+    while bot.delivered + queue.failed < args.messages:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+
+    print(f"доставлено: {bot.delivered}, не доставлено: {queue.failed}")
+    print(f"время: {elapsed:.2f} с, скорость: {bot.delivered / elapsed:.1f} сообщений/с (лимит {args.rate})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--chats', type=int, default=1000, help='сколько разных получателей')
+    parser.add_argument('--rate', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--chat-interval', type=float, default=1.0)
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа Telegram, с')
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Набор замеров настоящих путей кода бота на синтетических данных.
+
+База засевается benchmarks.synthetic, затем по очереди замеряются:
+списки "Сегодня", "Завтра" и "Мои задачи" (построители ответов PlannerBot
+с кэшем, как в боте), добавление и удаление задачи (база и планировщик),
+обход напоминаний планировщиком за сутки (Scheduler.sweep на сдвигаемых
+часах), недельные напоминания в 10:00 и перенос недели. Сообщения не
+уходят в Telegram, а только считаются. Результат - JSON с коммитом,
+параметрами и p50/p95/p99 каждого сценария; с --baseline он сравнивается
+с прошлым прогоном (benchmarks.compare), регрессия даёт код выхода 1.
+
+Запускать на отдельной базе: обход напоминаний, недельные напоминания и
+перенос недели работают со всеми пользователями, а не только тестовыми.
+
+    DATABASE_URL=postgresql://localhost/planner_bench python -m benchmarks.suite --users 100000 --tasks 5000000
+    DATABASE_URL=... python -m benchmarks.suite --no-seed --baseline bench-abc1234.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import scheduler as scheduler_module
+from bot import PlannerBot
+from config import INSTANCE_ID, TIMEZONE
+from database import Database, LAST_ROLLED_WEEK
+from scheduler import Scheduler
+from timezones import local_now, to_utc, utc_now
+
+from benchmarks import compare, synthetic
+from benchmarks.synthetic import BENCH_USER_BASE
+
+
+class RecordingSender:
+    """Вместо очереди отправки только считает сообщения"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, chat_id, text, scheduled_at=None, **kwargs):
+        self.sent += 1
+
+
+class SimulatedClock:
+    """Часы планировщика, которые бенчмарк двигает сам"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+def summarize(latencies) -> dict:
+    """Сводка по длительностям в мс"""
+    return {
+        'runs': len(latencies),
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': max(latencies),
+    }
+
+
+async def timed(call) -> float:
+    started = time.perf_counter()
+    await call()
+    return (time.perf_counter() - started) * 1000
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('+dirty' if dirty else '')
+
+
+async def bench_lists(bot: PlannerBot, users: int, repeat: int) -> dict:
+    """Построение ответов на кнопки списков для случайных тестовых пользователей"""
+    views = {
+        'list_today': lambda user_id: bot.get_day_tasks(user_id, 0),
+        'list_tomorrow': lambda user_id: bot.get_day_tasks(user_id, 1),
+        'list_all': lambda user_id: bot.get_tasks_page(user_id),
+    }
+    results = {}
+    for name, view in views.items():
+        latencies = []
+        for _ in range(repeat):
+            user_id = BENCH_USER_BASE + random.randint(1, users)
+            latencies.append(await timed(lambda: view(user_id)))
+        results[name] = summarize(latencies)
+    return results
+
+
+async def bench_add_delete(bot: PlannerBot, scheduler: Scheduler, users: int, repeat: int) -> dict:
+    """Добавление и удаление задачи: то, что делают save_task и удаление кнопкой, кроме ответа"""
+    today = local_now().date()
+    added = []
+
+    async def add(user_id):
+        task_date = today + timedelta(days=random.randint(0, 14))
+        task_time = f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}"
+        task_id = await bot.db.add_task(user_id, 'Задача бенчмарка', task_date.isoformat(), task_time)
+        due_at = to_utc(datetime.strptime(f"{task_date} {task_time}", "%Y-%m-%d %H:%M"), TIMEZONE)
+        scheduler.add_task(task_id, user_id, due_at, await bot.db.get_reminder_mask(user_id))
+        added.append((task_id, user_id))
+
+    async def delete(task_id, user_id):
+        if await bot.db.delete_task(task_id, user_id):
+            scheduler.remove_task(task_id, user_id)
+
+    add_latencies = []
+    for _ in range(repeat):
+        user_id = BENCH_USER_BASE + random.randint(1, users)
+        add_latencies.append(await timed(lambda: add(user_id)))
+    delete_latencies = [await timed(lambda: delete(*task)) for task in added]
+    return {'add_task': summarize(add_latencies), 'delete_task': summarize(delete_latencies)}
+
+
+async def bench_daily_sweep(scheduler: Scheduler, hours: int, step_minutes: int) -> dict:
+    """Обходы напоминаний с шагом step_minutes на протяжении hours часов вперёд от сейчас"""
+    clock = SimulatedClock(utc_now())
+    original = scheduler_module.utc_now
+    scheduler_module.utc_now = clock
+    latencies = []
+    try:
+        for _ in range(hours * 60 // step_minutes):
+            clock.now += timedelta(minutes=step_minutes)
+            latencies.append(await timed(scheduler.sweep))
+    finally:
+        scheduler_module.utc_now = original
+    return {'daily_sweep': summarize(latencies)}
+
+
+async def bench_weekly_fanout(db, scheduler: Scheduler, runs: int) -> dict:
+    """Недельные напоминания в 10:00; отметка запуска в job_runs снимается перед каждым"""
+    run_key = local_now().date().isoformat()
+    original = await db.run(db.db._fetchone, '''
+        SELECT claimed_by, claimed_at, progress, heartbeat_at, completed_at
+        FROM job_runs WHERE job = 'weekly_reminder' AND run_key = %s
+    ''', (run_key,))
+    latencies = []
+    try:
+        for _ in range(runs):
+            await db.run(db.db._execute_query, '''
+                DELETE FROM job_runs WHERE job = 'weekly_reminder' AND run_key = %s
+            ''', (run_key,))
+            latencies.append(await timed(scheduler._check_weekly_reminders))
+    finally:
+        await db.run(db.db._execute_query, '''
+            DELETE FROM job_runs WHERE job = 'weekly_reminder' AND run_key = %s AND claimed_by = %s
+        ''', (run_key, INSTANCE_ID))
+        if original:
+            await db.run(db.db._execute_query, '''
+                INSERT INTO job_runs (job, run_key, claimed_by, claimed_at, progress, heartbeat_at, completed_at)
+                VALUES ('weekly_reminder', %s, %s, %s, %s, %s, %s)
+                ON CONFLICT DO NOTHING
+            ''', (run_key, *original))
+    return {'weekly_fanout': summarize(latencies)}
+
+
+async def bench_week_rollover(db, scheduler: Scheduler, runs: int) -> dict:
+    """Перенос недели; перед каждым запуском задачи тестовых пользователей возвращаются на прошлую неделю"""
+    week_start = local_now().date() - timedelta(days=local_now().weekday())
+    last_week = week_start - timedelta(days=7)
+    past_ids = (await db.run(db.db._fetchone, '''
+        SELECT coalesce(array_agg(id), '{}') FROM weekly_tasks
+        WHERE user_id > %s AND week_start < %s AND completed = FALSE
+    ''', (BENCH_USER_BASE, week_start)))[0]
+    watermark = await db.run(db.db._fetchone, 'SELECT value FROM app_state WHERE key = %s', (LAST_ROLLED_WEEK,))
+    latencies = []
+    try:
+        for _ in range(runs):
+            await db.run(db.db._execute_query, 'UPDATE weekly_tasks SET week_start = %s WHERE id = ANY(%s)',
+                         (last_week, past_ids))
+            await db.run(db.db._execute_query, 'DELETE FROM app_state WHERE key = %s', (LAST_ROLLED_WEEK,))
+            latencies.append(await timed(scheduler._check_week_transition))
+    finally:
+        if watermark:
+            await db.run(db.db._execute_query, '''
+                INSERT INTO app_state (key, value) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+            ''', (LAST_ROLLED_WEEK, watermark[0]))
+    return {'week_rollover': summarize(latencies)}
+
+
+async def run(args) -> dict:
+    bot = PlannerBot()
+    sender = RecordingSender()
+    scheduler = Scheduler(sender, bot.db)
+    scheduler._sweep_lock = asyncio.Lock()
+    scenarios = {}
+    try:
+        scenarios.update(await bench_lists(bot, args.users, args.repeat))
+        scenarios.update(await bench_add_delete(bot, scheduler, args.users, args.repeat))
+        scenarios.update(await bench_daily_sweep(scheduler, args.sweep_hours, args.sweep_step))
+        scenarios.update(await bench_weekly_fanout(bot.db, scheduler, args.runs))
+        scenarios.update(await bench_week_rollover(bot.db, scheduler, args.runs))
+    finally:
+        bot.db.close()
+    print(f"сообщений поставлено бы в очередь: {sender.sent}")
+    return scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--tasks', type=int, default=5000000)
+    parser.add_argument('--weekly', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=1000, help='вызовов на сценарий списков и изменений')
+    parser.add_argument('--runs', type=int, default=5, help='запусков недельных напоминаний и переноса')
+    parser.add_argument('--sweep-hours', type=int, default=24)
+    parser.add_argument('--sweep-step', type=int, default=1, help='минут между обходами напоминаний')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-seed', action='store_true', help='не пересевать базу, данные уже есть')
+    parser.add_argument('--keep', action='store_true', help='не удалять тестовые данные после прогона')
+    parser.add_argument('--output', help='файл результата, по умолчанию bench-<коммит>.json')
+    parser.add_argument('--baseline', help='прошлый результат для сравнения')
+    parser.add_argument('--threshold', type=float, default=compare.DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    db = Database(minconn=1, maxconn=1)
+    try:
+        if not args.no_seed:
+            started = time.perf_counter()
+            synthetic.seed(db, args.users, args.tasks, args.weekly, seed=args.seed)
+            print(f"засеяно за {time.perf_counter() - started:.0f} с")
+        scenarios = asyncio.run(run(args))
+    finally:
+        if not args.keep:
+            synthetic.clear(db)
+        db.close()
+
+    commit = git_commit()
+    result = {
+        'commit': commit,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'params': {name: getattr(args, name) for name in ('users', 'tasks', 'weekly', 'repeat', 'runs',
+                                                           'sweep_hours', 'sweep_step', 'seed')},
+        'scenarios': scenarios,
+    }
+    output = args.output or f"bench-{commit}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'сценарий':<16}{'запусков':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, summary in scenarios.items():
+        print(f"{name:<16}{summary['runs']:>9}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}")
+    print(f"\nрезультат: {output}")
+
+    if args.baseline and not compare.report(compare.load(args.baseline), result, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
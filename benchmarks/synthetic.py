@@ -0,0 +1,110 @@
+"""Синтетические данные планировщика: пользователи, задачи и недельные задачи.
+
+Тестовые пользователи получают id больше BENCH_USER_BASE и удаляются вместе
+со всеми своими задачами (ON DELETE CASCADE). Задачи распределены по
+пользователям неравномерно: доля задач пользователя с номером k убывает
+со степенью --skew, как у настоящих активных и редких пользователей. Даты
+задач равномерно покрывают --days-back дней до сегодня и --days-ahead
+после, время - любая минута суток. Недельные задачи - на текущую неделю,
+а доля --weekly-past лежит невыполненной на прошлой неделе (для переноса).
+Одинаковый --seed даёт одинаковые данные.
+
+    DATABASE_URL=postgresql://localhost/planner_bench python -m benchmarks.synthetic --users 100000 --tasks 5000000
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from config import TIMEZONE
+from database import OPTIONS_SQL, Database, _add_months
+from reminders import DEFAULT_MASK
+from timezones import local_now
+
+BENCH_USER_BASE = 900000000
+
+
+def clear(db: Database):
+    """Удалить тестовых пользователей со всеми их задачами"""
+    db._execute_query('DELETE FROM users WHERE user_id > %s', (BENCH_USER_BASE,))
+    db._execute_query('DELETE FROM tasks_history WHERE user_id > %s', (BENCH_USER_BASE,))
+
+
+def seed(db: Database, users: int, tasks: int, weekly: int, days_back: int = 30, days_ahead: int = 30,
+         skew: float = 2.0, weekly_past: float = 0.3, weekly_done: float = 0.3, seed: int = 1,
+         today: date = None):
+    """Заменить тестовые данные новыми; вернуть {таблица: строк}"""
+    today = today or local_now().date()
+    first_day = today - timedelta(days=days_back)
+    week_start = today - timedelta(days=today.weekday())
+
+    def insert(cursor):
+        # random() в этой транзакции повторяется от запуска к запуску
+        cursor.execute('SELECT setseed(%s)', (seed % 1000 / 1000,))
+        cursor.execute('''
+            INSERT INTO users (user_id, username, first_name, timezone, reminder_mask)
+            SELECT %s + n, 'bench' || n, 'Bench', %s, %s FROM generate_series(1, %s) AS n
+        ''', (BENCH_USER_BASE, TIMEZONE, DEFAULT_MASK, users))
+        month = first_day.replace(day=1)
+        while month <= today + timedelta(days=days_ahead):
+            cursor.execute('SELECT create_task_partition(%s)', (month,))
+            month = _add_months(month, 1)
+        cursor.execute(f'''
+            INSERT INTO tasks (user_id, task_text, task_date, task_time, due_at, reminded, next_remind_at)
+            SELECT user_id, 'Задача ' || n, day, moment, due_at, due_at < now(),
+                   CASE WHEN due_at > now() THEN task_next_reminder(due_at, %s, ARRAY[]::int[], {OPTIONS_SQL}) END
+            FROM (
+                SELECT *, (day + moment) AT TIME ZONE %s AS due_at
+                FROM (
+                SELECT n,
+                       %s + 1 + floor(%s * power(random(), %s))::bigint AS user_id,
+                       %s::date + floor(random() * %s)::int AS day,
+                       make_time(floor(random() * 24)::int, floor(random() * 60)::int, 0) AS moment
+                FROM generate_series(1, %s) AS n
+                ) AS generated
+            ) AS moments
+        ''', (DEFAULT_MASK, TIMEZONE, BENCH_USER_BASE, users, skew, first_day, days_back + days_ahead + 1, tasks))
+        cursor.execute('''
+            INSERT INTO weekly_tasks (user_id, task_text, week_start, completed)
+            SELECT %s + 1 + floor(%s * power(random(), %s))::bigint, 'Недельная задача ' || n,
+                   CASE WHEN past THEN %s::date ELSE %s::date END,
+                   NOT past AND random() < %s
+            FROM (SELECT n, random() < %s AS past FROM generate_series(1, %s) AS n) AS generated
+        ''', (BENCH_USER_BASE, users, skew, week_start - timedelta(days=7), week_start,
+              weekly_done, weekly_past, weekly))
+
+    clear(db)
+    db._run(insert)
+    for table in ('users', 'tasks', 'weekly_tasks'):
+        db._execute_query(f'ANALYZE {table}')
+    return {'users': users, 'tasks': tasks, 'weekly_tasks': weekly}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--tasks', type=int, default=5000000)
+    parser.add_argument('--weekly', type=int, default=300000)
+    parser.add_argument('--days-back', type=int, default=30)
+    parser.add_argument('--days-ahead', type=int, default=30)
+    parser.add_argument('--skew', type=float, default=2.0, help='1 - поровну, больше - сильнее перекос к первым')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--clear', action='store_true', help='только удалить тестовые данные')
+    args = parser.parse_args()
+
+    db = Database(minconn=1, maxconn=1)
+    try:
+        if args.clear:
+            clear(db)
+            print("🧹 Тестовые данные удалены")
+            return
+        started = time.perf_counter()
+        counts = seed(db, args.users, args.tasks, args.weekly, args.days_back, args.days_ahead,
+                      args.skew, seed=args.seed)
+        print(", ".join(f"{table}: {count:,}" for table, count in counts.items()))
+        print(f"засеяно за {time.perf_counter() - started:.0f} с")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
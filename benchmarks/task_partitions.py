@@ -0,0 +1,119 @@
+"""Задержка списков и обхода напоминаний при росте истории задач (1M, 10M строк).
+
+Для каждого размера база засевается задачами за --months прошедших месяцев и
+ближайшую неделю, поровну на --users пользователей. Замеры - до и после
+Database.maintain_task_partitions: сначала вся история лежит в секциях tasks,
+потом прошедшие месяцы уходят в tasks_history. Горячие запросы читают только
+секции текущих дней, поэтому их задержка не должна расти с размером истории.
+
+Запускать на отдельной базе: обслуживание переносит в архив старые месяцы
+всех пользователей, а не только тестовых.
+
+    DATABASE_URL=postgresql://localhost/planner_bench python -m benchmarks.task_partitions --rows 1000000 10000000
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from database import OPTIONS_SQL, Database, _add_months
+from reminders import DEFAULT_MASK
+from timezones import local_now, utc_now
+
+from benchmarks.synthetic import BENCH_USER_BASE
+
+
+def seed(db: Database, rows: int, users: int, months: int, today: date):
+    """rows задач с датами от начала месяца months назад до недели вперёд"""
+    start = _add_months(today.replace(day=1), -months)
+    span = (today + timedelta(days=7) - start).days
+
+    def insert(cursor):
+        cursor.execute('DELETE FROM users WHERE user_id > %s', (BENCH_USER_BASE,))
+        cursor.execute('DELETE FROM tasks_history WHERE user_id > %s', (BENCH_USER_BASE,))
+        cursor.execute('''
+            INSERT INTO users (user_id, username, first_name)
+            SELECT %s + n, 'bench', 'Bench' FROM generate_series(1, %s) AS n
+        ''', (BENCH_USER_BASE, users))
+        for offset in range(months + 2):
+            cursor.execute('SELECT create_task_partition(%s)', (_add_months(start, offset),))
+        # Даты и время разбросаны детерминированно, чтобы размеры были сравнимы
+        cursor.execute(f'''
+            INSERT INTO tasks (user_id, task_text, task_date, task_time, due_at, reminded, next_remind_at)
+            SELECT %s + 1 + n %% %s, 'Задача ' || n, day, moment, due_at, day < %s,
+                   CASE WHEN day >= %s THEN task_next_reminder(due_at, %s, ARRAY[]::int[], {OPTIONS_SQL}) END
+            FROM (
+                SELECT n, day, moment, (day + moment) AT TIME ZONE 'UTC' AS due_at
+                FROM (
+                    SELECT n, %s::date + (n * 7919 %% %s) AS day,
+                           make_time((n * 31 %% 24)::int, (n * 17 %% 60)::int, 0) AS moment
+                    FROM generate_series(1, %s) AS n
+                ) AS generated
+            ) AS moments
+        ''', (BENCH_USER_BASE, users, today, today, DEFAULT_MASK, start, span, rows))
+
+    started = time.perf_counter()
+    db._run(insert)
+    db._execute_query('ANALYZE tasks')
+    print(f"  засеяно {rows:,} задач за {time.perf_counter() - started:.0f} с")
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+def measure(db: Database, users: int, repeat: int):
+    """{запрос: (p50, p99) в мс} для горячих запросов случайных тестовых пользователей"""
+    now = local_now()
+    today = now.strftime('%Y-%m-%d')
+    queries = {
+        'Сегодня': lambda user_id: db.get_user_tasks(user_id, today),
+        'Мои задачи': lambda user_id: db.get_user_tasks_page(user_id, since=now),
+        'Обход напоминаний': lambda user_id: db.get_due_reminders(utc_now()),
+    }
+    results = {}
+    for title, query in queries.items():
+        latencies = []
+        for _ in range(repeat):
+            user_id = BENCH_USER_BASE + random.randint(1, users)
+            started = time.perf_counter()
+            query(user_id)
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[title] = (percentile(latencies, 0.50), percentile(latencies, 0.99))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--months', type=int, default=24, help='месяцев истории')
+    parser.add_argument('--repeat', type=int, default=500, help='запросов на замер')
+    args = parser.parse_args()
+
+    db = Database(minconn=1, maxconn=1)
+    today = local_now().date()
+    report = []
+    try:
+        for rows in args.rows:
+            print(f"{rows:,} задач:")
+            seed(db, rows, args.users, args.months, today)
+            report.append((rows, 'вся история в tasks', measure(db, args.users, args.repeat)))
+            created, archived = db.maintain_task_partitions(today) or (0, 0)
+            db._execute_query('ANALYZE tasks')
+            print(f"  в архив перенесено {archived:,} задач")
+            report.append((rows, 'после архивации', measure(db, args.users, args.repeat)))
+    finally:
+        db._execute_query('DELETE FROM users WHERE user_id > %s', (BENCH_USER_BASE,))
+        db._execute_query('DELETE FROM tasks_history WHERE user_id > %s', (BENCH_USER_BASE,))
+        db.close()
+
+    print(f"\n{'строк':>12}  {'состояние':<22}{'запрос':<20}{'p50, мс':>9}{'p99, мс':>9}")
+    for rows, stage, results in report:
+        for title, (p50, p99) in results.items():
+            print(f"{rows:>12,}  {stage:<22}{title:<20}{p50:>9.2f}{p99:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Нагрузочный тест webhook-режима: POST синтетических Update с заданной частотой.
+
+Бот запускается отдельно (BOT_MODE=webhook, WEBHOOK_URL=http://127.0.0.1:8443,
+METRICS_PORT=9464), желательно с тестовым токеном. Харнесс шлёт ему
+обновления с правильным секретом и печатает p50/p99 двух задержек:
+
+- обработки - из гистограммы planner_handler_seconds на /metrics бота,
+  разница до и после прогона; это время обработчиков до конца, включая ответ;
+- приёма webhook - HTTP-ответа бота. PTB отвечает, как только обновление
+  принято в очередь, поэтому она показывает только насыщение приёма.
+
+Перцентили обработки оцениваются по границам корзин гистограммы с
+линейной интерполяцией внутри корзины, как histogram_quantile в Prometheus.
+
+    python -m benchmarks.webhook_load --url http://127.0.0.1:8443/telegram --rate 500 --seconds 20
+"""
+import argparse
+import asyncio
+import random
+import re
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+from config import WEBHOOK_SECRET
+
+HANDLER_BUCKET_RE = re.compile(r'^planner_handler_seconds_bucket\{.*le="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+TEXTS = ['📅 Сегодня', '📆 Завтра', '📋 Мои задачи', '🗓 Недельные задачи', 'ℹ️ Помощь', '/start']
+
+
+def synthetic_update(update_id: int, users: int) -> dict:
+    user_id = random.randint(1, users)
+    text = random.choice(TEXTS)
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': 'Load'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+async def handler_buckets(client, url) -> dict:
+    """{граница корзины: обработок не дольше неё} по всем обработчикам вместе"""
+    response = await client.get(url)
+    response.raise_for_status()
+    buckets = defaultdict(float)
+    for le, count in HANDLER_BUCKET_RE.findall(response.text):
+        buckets[float(le)] += float(count)
+    return buckets
+
+
+def bucket_percentile(before: dict, after: dict, share: float):
+    """Перцентиль по приросту накопительной гистограммы; None, если обработок не было"""
+    bounds = sorted(after)
+    cumulative = [after[bound] - before.get(bound, 0) for bound in bounds]
+    if not cumulative or not cumulative[-1]:
+        return None
+    rank = cumulative[-1] * share
+    lower, below = 0.0, 0.0
+    for bound, count in zip(bounds, cumulative):
+        if count >= rank:
+            if bound == float('inf'):
+                return lower  # Дольше самой большой границы - точнее не сказать
+            return lower + (bound - lower) * (rank - below) / max(count - below, 1)
+        lower, below = bound, count
+    return lower
+
+
+async def wait_until_handled(client, url, before: dict, expected: float, timeout: float = 60):
+    """Дождаться, пока бот обработает все принятые обновления (или timeout)"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        after = await handler_buckets(client, url)
+        handled = after.get(float('inf'), 0) - before.get(float('inf'), 0)
+        if handled >= expected or time.perf_counter() > deadline:
+            return after
+        await asyncio.sleep(0.5)
+
+
+async def run(args):
+    latencies = []
+    errors = 0
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret}
+    limits = httpx.Limits(max_connections=args.connections)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        before = await handler_buckets(client, args.metrics)
+
+        async def post(update_id):
+            nonlocal errors
+            started = time.perf_counter()
+            try:
+                response = await client.post(args.url, json=synthetic_update(update_id, args.users), headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+                    return
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+        tasks = []
+        interval = 1 / args.rate
+        started = time.perf_counter()
+        for update_id in range(int(args.rate * args.seconds)):
+            # Равномерный поток: следующее обновление - по расписанию, а не по готовности
+            delay = started + update_id * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(post(update_id + 1)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        after = await wait_until_handled(client, args.metrics, before, len(latencies))
+
+    print(f"отправлено: {len(tasks)} за {elapsed:.1f} с ({len(tasks) / elapsed:.0f}/с), ошибок: {errors}")
+    handled = after.get(float('inf'), 0) - before.get(float('inf'), 0)
+    if handled:
+        print(f"обработка ({handled:.0f}): p50 {bucket_percentile(before, after, 0.50) * 1000:.1f} мс, "
+              f"p99 {bucket_percentile(before, after, 0.99) * 1000:.1f} мс")
+    else:
+        print("обработка: бот не отчитался ни об одном обработчике - включены ли метрики?")
+    if latencies:
+        print(f"приём webhook: p50 {percentile(latencies, 0.50) * 1000:.1f} мс, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс, "
+              f"среднее {statistics.mean(latencies) * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8443/telegram')
+    parser.add_argument('--secret', default=WEBHOOK_SECRET)
+    parser.add_argument('--metrics', default='http://127.0.0.1:9464/metrics', help='адрес /metrics бота')
+    parser.add_argument('--rate', type=float, default=200, help='обновлений в секунду')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,48 @@
+import asyncio
+import inspect
 import logging
 import os
-from telegram import Update, ReplyKeyboardMarkup
+from telegram import Update, InlineKeyboardButton
+from telegram.error import BadRequest
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, 
-    ContextTypes, ConversationHandler, filters
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
+    ContextTypes, ConversationHandler, PicklePersistence, filters
 )
 from datetime import datetime, timedelta
 import re
+import signal
+import tempfile
 
-from config import BOT_TOKEN
-from database import Database
+from config import (
+    BOT_TOKEN, BOT_MODE, MAX_CONCURRENT_UPDATES,
+    IMPORT_MAX_TASKS, IMPORT_MAX_FILE_SIZE, EXPORT_SPOOL_SIZE,
+    PERSISTENCE, PERSISTENCE_FILE, PERSISTENCE_INTERVAL,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS, METRICS_LISTEN, METRICS_PORT, ADMIN_IDS
+)
+import metrics
+from querystats import STATS as QUERY_STATS
+from database import AsyncDatabase
 from scheduler import Scheduler
+from sender import OutboundQueue
+from updates import PerUserUpdateProcessor
+from persistence import PostgresPersistence
+from timezones import is_valid_timezone, local_now, to_utc, utc_now
+from keyboards import (
+    PAGE, DELETE_TASK, COMPLETE_WEEKLY, REMINDER_USER, REMINDER_TASK, REMINDER_DEFAULT,
+    VIEW_TODAY, VIEW_TOMORROW, VIEW_DELETE, VIEW_PAGE,
+    MAIN_KEYBOARD, CANCEL_KEYBOARD, QUICK_DATES_KEYBOARD, TIME_KEYBOARD, BACK_KEYBOARD, WEEKLY_KEYBOARD,
+    task_key, page_view, task_buttons, weekly_buttons, reminder_buttons, inline_markup, week_choice_keyboard
+)
+from reminders import describe_mask, parse_offset, toggle
+from templates import render_tasks, render_recurring, render_weekly
+from routing import Router
+from quickadd import parse_quick_add, TIME_RE, QUICK_DATES
+from recurrence import parse_rule, describe_rule, occurrences, next_occurrence
+from bulk import (
+    parse_lines, parse_csv, parse_ics, csv_line, csv_task, ics_event,
+    CSV_HEADER, ICS_HEADER, ICS_FOOTER
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,102 +55,244 @@ logger = logging.getLogger(__name__)
 WAITING_TASK, WAITING_DATE, WAITING_TIME = range(3)
 WAITING_WEEKLY_TASK, WAITING_WEEKLY_WEEK = range(4, 6)
 
+# Обработчики, которые только передают обновление дальше по таблицам Router и
+# callback_routes: время замеряется у тех, кому они передают
+ROUTING_HANDLERS = {'dispatch_command', 'dispatch_text', 'callback_router'}
+
 class PlannerBot:
     def __init__(self):
-        self.db = Database()
-        self.application = Application.builder().token(BOT_TOKEN).build()
-        self.scheduler = None
-        
+        self.db = AsyncDatabase()
+        builder = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+        )
+        persistence = self.get_persistence()
+        if persistence:
+            builder = builder.persistence(persistence)
+        self.application = builder.build()
+        self.sender = OutboundQueue(self.application.bot)
+        self.scheduler = Scheduler(self.sender, self.db)
+        self.metrics_server = None
+        self.instrument_handlers()
+    
+    def instrument_handlers(self):
+        """Обернуть обработчики обновлений замером времени (metrics.HANDLER_SECONDS).
+
+        Обработчик - корутина, принимающая (update, context, ...). Обёртки
+        ставятся на экземпляр до setup_handlers, поэтому в PTB, Router и
+        callback_routes попадают уже они. Обработчик, вызванный из другого,
+        отдельно не замеряется: обновление считается один раз.
+        """
+        for name, method in inspect.getmembers(self, inspect.iscoroutinefunction):
+            if name in ROUTING_HANDLERS:
+                continue
+            if list(inspect.signature(method).parameters)[:2] == ['update', 'context']:
+                setattr(self, name, metrics.timed_handler(name, method))
+        
+    def get_persistence(self):
+        """Хранилище состояния диалогов, чтобы они переживали перезапуск"""
+        if PERSISTENCE == 'postgres':
+            return PostgresPersistence(self.db)
+        if PERSISTENCE == 'pickle':
+            return PicklePersistence(PERSISTENCE_FILE, update_interval=PERSISTENCE_INTERVAL)
+        return None
+    
     def get_main_keyboard(self):
         """Основная клавиатура меню"""
-        keyboard = [
-            ["📝 Добавить задачу", "📋 Мои задачи"],
-            ["🗑 Удалить задачу", "📅 Сегодня"],
-            ["📆 Завтра", "🗓 Недельные задачи"],
-            ["ℹ️ Помощь"]
-        ]
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        return MAIN_KEYBOARD
     
     def get_cancel_keyboard(self):
         """Клавиатура для отмены"""
-        return ReplyKeyboardMarkup([["❌ Отмена"]], resize_keyboard=True)
+        return CANCEL_KEYBOARD
     
     def get_quick_dates_keyboard(self):
         """Быстрый выбор дат"""
-        keyboard = [
-            ["📅 Сегодня", "📆 Завтра"],
-            ["🗓 Послезавтра", "❌ Отмена"]
-        ]
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        return QUICK_DATES_KEYBOARD
     
     def get_time_keyboard(self):
         """Быстрый выбор времени"""
-        keyboard = [
-            ["⏰ Сейчас", "🕐 Через 1 час"],
-            ["🕑 Через 2 часа", "❌ Отмена"]
-        ]
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        return TIME_KEYBOARD
     
     def get_back_keyboard(self):
         """Клавиатура с кнопкой Назад"""
-        return ReplyKeyboardMarkup([["⬅️ Назад"]], resize_keyboard=True)
+        return BACK_KEYBOARD
     
     def get_weekly_keyboard(self):
         """Клавиатура для недельных задач"""
-        keyboard = [
-            ["📋 Мои недельные задачи", "➕ Добавить недельную задачу"],
-            ["⬅️ Назад"]
-        ]
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        return WEEKLY_KEYBOARD
     
-    def get_week_choice_keyboard(self):
+    def get_week_choice_keyboard(self, today):
         """Выбор недели для добавления задачи"""
-        today = datetime.now().date()
-        current_week_start = self._get_week_start(today)
-        next_week_start = current_week_start + timedelta(days=7)
-        
-        keyboard = [
-            [f"📅 Текущая неделя ({current_week_start.strftime('%d.%m')})"],
-            [f"📅 Следующая неделя ({next_week_start.strftime('%d.%m')})"],
-            ["❌ Отмена"]
-        ]
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        return week_choice_keyboard(today)
     
     def _get_week_start(self, date):
         """Получить дату начала недели (понедельник)"""
         return date - timedelta(days=date.weekday())
     
-    def get_tasks_with_delete_buttons(self, tasks):
-        """Формирует список задач с кнопками удаления"""
+    async def user_now(self, user_id):
+        """Текущее время в часовом поясе пользователя"""
+        return local_now(await self.db.get_user_timezone(user_id))
+    
+    def get_tasks_text(self, tasks):
+        """Формирует список задач; удаляются они inline-кнопками под ним"""
+        return render_tasks(tasks)
+    
+    async def get_tasks_page(self, user_id, cursor=None, backward=False):
+        """Страница предстоящих задач с кнопками удаления и листания; (None, None), если задач нет"""
+        tasks, has_prev, has_next = await self.db.get_user_tasks_page(
+            user_id, cursor, backward, since=await self.user_now(user_id)
+        )
+        if not tasks:
+            return None, None
+        
+        tasks_text = "📋 Ваши предстоящие задачи:\n\n"
+        tasks_text += self.get_tasks_text(tasks)
+        
+        buttons = []
+        if has_prev:
+            buttons.append(InlineKeyboardButton("◀️ Раньше", callback_data=self._page_callback_data(tasks[0], True)))
+        if has_next:
+            buttons.append(InlineKeyboardButton("Позже ▶️", callback_data=self._page_callback_data(tasks[-1], False)))
+        
+        return tasks_text, inline_markup(task_buttons(tasks, page_view(tasks[0])) + [buttons])
+    
+    async def get_day_tasks(self, user_id, days_ahead):
+        """Задачи и повторения на сегодня (0) или завтра (1) с кнопками удаления; (None, None), если их нет"""
+        day = (await self.user_now(user_id) + timedelta(days=days_ahead)).date()
+        tasks = await self.db.get_user_tasks(user_id, day.strftime("%Y-%m-%d"))
+        recurring = await self.get_recurring_on(user_id, day)
+        if not tasks and not recurring:
+            return None, None
+        
+        tasks_text = "📅 Задачи на сегодня:\n\n" if days_ahead == 0 else "📆 Задачи на завтра:\n\n"
+        if tasks:
+            tasks_text += self.get_tasks_text(tasks)
+        tasks_text += self.get_recurring_text(recurring)
+        
+        view = VIEW_TODAY if days_ahead == 0 else VIEW_TOMORROW
+        return tasks_text, inline_markup(task_buttons(tasks, view))
+    
+    async def get_delete_list(self, user_id):
+        """Ближайшие задачи с кнопками удаления; (None, None), если задач нет"""
+        tasks, _, has_next = await self.db.get_user_tasks_page(user_id, since=await self.user_now(user_id))
         if not tasks:
-            return "📭 Задач нет!"
-        
-        tasks_text = ""
-        for task in tasks:
-            if len(task) == 4:  # Все задачи (id, text, date, time)
-                task_id, task_text, task_date, task_time = task
-                display_date = datetime.strptime(task_date, "%Y-%m-%d").strftime("%d.%m.%Y")
-                tasks_text += f"🆔 {task_id}: {task_text}\n"
-                tasks_text += f"   📅 {display_date} 🕐 {task_time}\n"
-                tasks_text += f"   🗑 Удалить_{task_id}\n\n"
-            else:  # Задачи на сегодня/завтра (id, text, time)
-                task_id, task_text, task_time = task
-                tasks_text += f"🆔 {task_id}: {task_text}\n"
-                tasks_text += f"   🕐 {task_time}\n"
-                tasks_text += f"   🗑 Удалить_{task_id}\n\n"
+            return None, None
+        
+        tasks_text = "🗑 Выберите задачу для удаления:\n\n"
+        tasks_text += self.get_tasks_text(tasks)
+        if has_next:
+            tasks_text += "…остальные задачи - в разделе «📋 Мои задачи»\n"
+        tasks_text += "\n📝 Или введите ID задачи (можно несколько через запятую) для удаления:"
+        
+        return tasks_text, inline_markup(task_buttons(tasks, VIEW_DELETE))
+    
+    async def get_weekly_list(self, user_id):
+        """Недельные задачи текущей недели с кнопками выполнения; (None, None), если задач нет"""
+        today = (await self.user_now(user_id)).date()
+        current_week_start = self._get_week_start(today)
         
+        tasks = await self.db.get_weekly_tasks(user_id, current_week_start.strftime("%Y-%m-%d"))
+        if not tasks:
+            return None, None
+        
+        tasks_text = render_weekly(tasks, current_week_start)
+        if all(completed for _, _, completed in tasks):
+            tasks_text += "\n\n🎉 Все задачи выполнены! Отличная работа!"
+        
+        return tasks_text, inline_markup(weekly_buttons(tasks))
+    
+    async def get_recurring_on(self, user_id, day):
+        """Повторения серий пользователя в день day: [(id серии, текст, время)]"""
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1) - timedelta(seconds=1)
+        found = []
+        for series_id, task_text, rrule, dtstart in await self.db.get_recurring_tasks(user_id):
+            for occurrence in occurrences(rrule, dtstart, start, end):
+                found.append((series_id, task_text, occurrence.time()))
+        return sorted(found, key=lambda item: item[2])
+    
+    def get_recurring_text(self, recurring):
+        """Формирует список повторений на день"""
+        return render_recurring(recurring)
+    
+    async def get_series_summary(self, user_id):
+        """Список серий пользователя с ближайшим повторением; пустая строка, если серий нет"""
+        series = await self.db.get_recurring_tasks(user_id)
+        if not series:
+            return ""
+        
+        now = await self.user_now(user_id)
+        tasks_text = "🔁 Повторяющиеся задачи:\n\n"
+        for series_id, task_text, rrule, dtstart in series:
+            upcoming = next_occurrence(rrule, dtstart, now)
+            tasks_text += f"R{series_id}: {task_text}\n"
+            tasks_text += f"   {describe_rule(rrule)}"
+            if upcoming:
+                tasks_text += f", следующая {upcoming.strftime('%d.%m.%Y %H:%M')}"
+            tasks_text += "\n\n"
         return tasks_text
+    
+    def _page_callback_data(self, task, backward):
+        """Ключ страницы в callback_data: tp:<n|p>:ГГГГММДД:ЧЧММСС:id"""
+        task_id, _, task_date, task_time = task
+        direction = 'p' if backward else 'n'
+        return f"{PAGE}:{direction}:{task_key(task_date, task_time, task_id)}"
+    
+    def _parse_task_key(self, key):
+        """Курсор (дата, время, id) из ключа ГГГГММДД:ЧЧММСС:id"""
+        date_text, time_text, task_id = key.split(':')
+        return (
+            datetime.strptime(date_text, '%Y%m%d').date(),
+            datetime.strptime(time_text, '%H%M%S').time(),
+            int(task_id)
+        )
         
     def setup_handlers(self):
         """Настройка обработчиков команд"""
         
-        # Обработчики команд
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("tasks", self.all_tasks_command))
-        self.application.add_handler(CommandHandler("today", self.today_tasks_command))
-        self.application.add_handler(CommandHandler("tomorrow", self.tomorrow_tasks_command))
-        self.application.add_handler(CommandHandler("delete", self.delete_command))
+        # Команды и кнопки меню - одна таблица вместо цепочки фильтров (routing.Router)
+        self.router = Router(
+            texts={
+                "📋 Мои задачи": self.all_tasks_button,
+                "📅 Сегодня": self.today_tasks_button,
+                "📆 Завтра": self.tomorrow_tasks_button,
+                "ℹ️ Помощь": self.help_button,
+                "⚙️ Напоминания": self.reminders_button,
+                "🗑 Удалить задачу": self.delete_task_button,
+                "⬅️ Назад": self.back_to_main,
+                "🗓 Недельные задачи": self.weekly_tasks_menu,
+                "📋 Мои недельные задачи": self.show_weekly_tasks,
+            },
+            commands={
+                "start": self.start_command,
+                "help": self.help_command,
+                "tasks": self.all_tasks_command,
+                "today": self.today_tasks_command,
+                "tomorrow": self.tomorrow_tasks_command,
+                "delete": self.delete_command,
+                "clear": self.clear_past_command,
+                "timezone": self.timezone_command,
+                "remind": self.reminders_command,
+                "repeat": self.repeat_command,
+                "unrepeat": self.unrepeat_command,
+                "import": self.import_command,
+                "export": self.export_command,
+                "dbstats": self.dbstats_command,
+            },
+            task_ids=self.delete_by_id,
+            unknown_command=self.unknown_command,
+            default=self.handle_any_text,
+        )
+        
+        # Известные команды проверяются до диалогов: /today посреди добавления задачи - команда, а не текст
+        self.application.add_handler(MessageHandler(filters.Regex(self.router.command_re), self.dispatch_command))
+        self.application.add_handler(MessageHandler(
+            filters.Document.FileExtension("csv") | filters.Document.FileExtension("ics"),
+            self.import_file
+        ))
         
         # Обработчик для добавления ежедневных задач через ConversationHandler
         add_conv_handler = ConversationHandler(
@@ -142,6 +316,8 @@ class PlannerBot:
                 CommandHandler("cancel", self.cancel_command),
                 MessageHandler(filters.Text("⬅️ Назад"), self.back_to_main)
             ],
+            name="add_task",
+            persistent=PERSISTENCE != 'none',
         )
         self.application.add_handler(add_conv_handler)
         
@@ -162,44 +338,39 @@ class PlannerBot:
                 MessageHandler(filters.Text("❌ Отмена"), self.cancel_command),
                 MessageHandler(filters.Text("⬅️ Назад"), self.back_to_main)
             ],
+            name="add_weekly_task",
+            persistent=PERSISTENCE != 'none',
         )
         self.application.add_handler(weekly_conv_handler)
         
-        # Обработчики для кнопок главного меню
-        main_menu_handlers = [
-            MessageHandler(filters.Text("📋 Мои задачи"), self.all_tasks_button),
-            MessageHandler(filters.Text("📅 Сегодня"), self.today_tasks_button),
-            MessageHandler(filters.Text("📆 Завтра"), self.tomorrow_tasks_button),
-            MessageHandler(filters.Text("ℹ️ Помощь"), self.help_button),
-            MessageHandler(filters.Text("🗑 Удалить задачу"), self.delete_task_button),
-            MessageHandler(filters.Text("⬅️ Назад"), self.back_to_main),
-            MessageHandler(filters.Text("🗓 Недельные задачи"), self.weekly_tasks_menu),
-            MessageHandler(filters.Text("📋 Мои недельные задачи"), self.show_weekly_tasks),
-            MessageHandler(filters.Text("➕ Добавить недельную задачу"), self.start_add_weekly_task)
-        ]
-        
-        for handler in main_menu_handlers:
-            self.application.add_handler(handler)
-        
-        # Обработчик для удаления задач через кнопки
-        self.application.add_handler(MessageHandler(filters.Regex(r'^🗑 Удалить_\d+$'), self.quick_delete_task))
-        
-        # Обработчик для отметки выполнения недельных задач
-        self.application.add_handler(MessageHandler(filters.Regex(r'^✓ Выполнить_\d+$'), self.complete_weekly_task))
-        
-        # Обработчик для удаления по ID (простой текст)
-        self.application.add_handler(MessageHandler(filters.Regex(r'^\d+$'), self.delete_by_id))
-        
-        # Обработчик неизвестных команд
-        self.application.add_handler(MessageHandler(filters.COMMAND, self.unknown_command))
-        
-        # Обработчик любых текстовых сообщений (если не попали в другие обработчики)
-        self.application.add_handler(MessageHandler(filters.TEXT, self.handle_any_text))
+        # Все inline-кнопки: листание, удаление, выполнение недельных задач
+        self.callback_routes = {
+            PAGE: self.tasks_page_callback,
+            DELETE_TASK: self.delete_task_callback,
+            COMPLETE_WEEKLY: self.complete_weekly_callback,
+            REMINDER_USER: self.reminder_user_callback,
+            REMINDER_TASK: self.reminder_task_callback,
+        }
+        self.application.add_handler(CallbackQueryHandler(self.callback_router))
+        
+        # Кнопки меню, удаление по ID, неизвестные команды и любой другой текст вне диалогов
+        self.application.add_handler(MessageHandler(filters.TEXT, self.dispatch_text))
+    
+    async def dispatch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Известная команда: аргументы в context.args, как у CommandHandler"""
+        handler, args = self.router.resolve_command(context.match, context.bot.username)
+        if handler is None:
+            return
+        context.args = args
+        await handler(update, context)
+    
+    async def dispatch_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.router.resolve_text(update.effective_message.text)(update, context)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
-        self.db.add_user(user.id, user.username, user.first_name)
+        await self.db.add_user(user.id, user.username, user.first_name)
         
         welcome_text = (
             f"Привет, {user.first_name}! 👋\n"
@@ -226,12 +397,60 @@ class PlannerBot:
         # Очищаем предыдущие данные
         context.user_data.clear()
         
+        if context.args:
+            return await self.quick_add_task(update, context)
+        
         await update.message.reply_text(
             "📝 Введите описание вашей задачи:",
             reply_markup=self.get_cancel_keyboard()
         )
         return WAITING_TASK
     
+    async def quick_add_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Добавление задачи одним сообщением: /add завтра 15:30 позвонить маме.
+
+        Если в строке нет даты или времени, диалог продолжается с нужного шага.
+        """
+        user_id = update.effective_user.id
+        timezone = await self.db.get_user_timezone(user_id)
+        now = local_now(timezone)
+        task_text, task_date, task_time = parse_quick_add(' '.join(context.args), now)
+        
+        if not task_text:
+            await update.message.reply_text(
+                "📝 Введите описание вашей задачи:",
+                reply_markup=self.get_cancel_keyboard()
+            )
+            return WAITING_TASK
+        context.user_data['task_text'] = task_text
+        
+        if task_date is None or task_date < now.date():
+            await update.message.reply_text(
+                f"📝 {task_text}\n\n📅 Выберите дату задачи или введите в формате ДД.ММ.ГГГГ:",
+                reply_markup=self.get_quick_dates_keyboard()
+            )
+            return WAITING_DATE
+        context.user_data['task_date'] = task_date.strftime("%Y-%m-%d")
+        context.user_data['display_date'] = task_date.strftime("%d.%m.%Y")
+        
+        if task_time is None:
+            await update.message.reply_text(
+                f"📝 {task_text}\n📅 {task_date.strftime('%d.%m.%Y')}\n\n🕐 Выберите время или введите в формате ЧЧ:ММ:",
+                reply_markup=self.get_time_keyboard()
+            )
+            return WAITING_TIME
+        
+        # Время без даты парсер сам переносит на завтра; здесь остаётся
+        # явно названный сегодняшний день с уже прошедшим временем
+        if task_date == now.date() and task_time <= now.strftime('%H:%M'):
+            await update.message.reply_text(
+                f"❌ {task_time} сегодня уже прошло.\n\n📝 {task_text}\n📅 {task_date.strftime('%d.%m.%Y')}\n\n🕐 Выберите время или введите в формате ЧЧ:ММ:",
+                reply_markup=self.get_time_keyboard()
+            )
+            return WAITING_TIME
+        
+        return await self.save_task(update, context, task_time, timezone)
+    
     async def get_task_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получение текста задачи"""
         task_text = update.message.text.strip()
@@ -243,8 +462,7 @@ class PlannerBot:
             return WAITING_TASK
         
         # Проверяем, что это не время (формат ЧЧ:ММ)
-        time_pattern = r'^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$'
-        if re.match(time_pattern, task_text):
+        if TIME_RE.match(task_text):
             await update.message.reply_text(
                 "❌ Вы ввели время вместо описания задачи! Пожалуйста, введите текстовое описание задачи:",
                 reply_markup=self.get_cancel_keyboard()
@@ -262,14 +480,11 @@ class PlannerBot:
     async def get_task_date(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получение даты задачи"""
         date_text = update.message.text
+        today = (await self.user_now(update.effective_user.id)).date()
         
         # Обработка быстрого выбора дат
-        if date_text == "📅 Сегодня":
-            task_date = datetime.now().date()
-        elif date_text == "📆 Завтра":
-            task_date = (datetime.now() + timedelta(days=1)).date()
-        elif date_text == "🗓 Послезавтра":
-            task_date = (datetime.now() + timedelta(days=2)).date()
+        if date_text in QUICK_DATES:
+            task_date = today + timedelta(days=QUICK_DATES[date_text])
         else:
             # Парсим введенную дату
             try:
@@ -282,7 +497,7 @@ class PlannerBot:
                 return WAITING_DATE
         
         # Проверяем, что дата не в прошлом
-        if task_date < datetime.now().date():
+        if task_date < today:
             await update.message.reply_text(
                 "❌ Нельзя добавлять задачи на прошедшие даты! Выберите другую дату:",
                 reply_markup=self.get_quick_dates_keyboard()
@@ -301,18 +516,20 @@ class PlannerBot:
     async def get_task_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получение времени задачи и сохранение"""
         time_text = update.message.text
+        user_id = update.effective_user.id
+        timezone = await self.db.get_user_timezone(user_id)
+        now = local_now(timezone)
         
         # Обработка быстрого выбора времени
         if time_text == "⏰ Сейчас":
-            now = datetime.now() + timedelta(minutes=1)
-            task_time = now.strftime("%H:%M")
+            task_time = (now + timedelta(minutes=1)).strftime("%H:%M")
         elif time_text == "🕐 Через 1 час":
-            task_time = (datetime.now() + timedelta(hours=1)).strftime("%H:%M")
+            task_time = (now + timedelta(hours=1)).strftime("%H:%M")
         elif time_text == "🕑 Через 2 часа":
-            task_time = (datetime.now() + timedelta(hours=2)).strftime("%H:%M")
+            task_time = (now + timedelta(hours=2)).strftime("%H:%M")
         else:
             # Парсим введенное время
-            if not re.match(r'^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$', time_text):
+            if not TIME_RE.match(time_text):
                 await update.message.reply_text(
                     "❌ Неверный формат времени! Пожалуйста, введите время в формате ЧЧ:ММ (например: 14:30) или выберите из кнопок:",
                     reply_markup=self.get_time_keyboard()
@@ -320,8 +537,13 @@ class PlannerBot:
                 return WAITING_TIME
             task_time = time_text
         
-        # Получаем данные из контекста
+        return await self.save_task(update, context, task_time, timezone)
+    
+    async def save_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE, task_time, timezone):
+        """Сохранение задачи из context.user_data и планирование напоминаний"""
         user_id = update.effective_user.id
+        
+        # Получаем данные из контекста
         task_text = context.user_data['task_text']
         task_date = context.user_data['task_date']
         display_date = context.user_data['display_date']
@@ -329,7 +551,7 @@ class PlannerBot:
         print(f"🔍 DEBUG: Сохранение задачи - user_id: {user_id}, text: {task_text}, date: {task_date}, time: {task_time}")
         
         # Сохраняем задачу в базу
-        task_id = self.db.add_task(user_id, task_text, task_date, task_time)
+        task_id = await self.db.add_task(user_id, task_text, task_date, task_time)
         
         print(f"🔍 DEBUG: Полученный task_id: {task_id}")
         
@@ -358,29 +580,25 @@ class PlannerBot:
         # Очищаем user_data
         context.user_data.clear()
         
+        due_at = to_utc(datetime.strptime(f"{task_date} {task_time}", "%Y-%m-%d %H:%M"), timezone)
+        self.scheduler.add_task(task_id, user_id, due_at, await self.db.get_reminder_mask(user_id))
+        
         logger.info(f"Задача {task_id} добавлена для пользователя {user_id}")
         return ConversationHandler.END
     
     async def delete_task_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик кнопки удаления задачи - показывает список для удаления по ID"""
         user_id = update.effective_user.id
-        tasks = self.db.get_user_tasks(user_id)
+        tasks_text, markup = await self.get_delete_list(user_id)
         
-        if not tasks:
+        if not tasks_text:
             await update.message.reply_text(
                 "📭 У вас пока нет задач для удаления!",
                 reply_markup=self.get_main_keyboard()
             )
             return
         
-        tasks_text = "🗑 Выберите задачу для удаления:\n\n"
-        tasks_text += self.get_tasks_with_delete_buttons(tasks)
-        tasks_text += "\n📝 Или введите ID задачи для удаления:"
-        
-        await update.message.reply_text(
-            tasks_text,
-            reply_markup=self.get_back_keyboard()
-        )
+        await update.message.reply_text(tasks_text, reply_markup=markup)
     
     async def delete_by_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Удаление задачи по введенному ID"""
@@ -393,53 +611,425 @@ class PlannerBot:
             return
         
         user_id = update.effective_user.id
-        task_id_text = update.message.text
         
-        try:
-            task_id = int(task_id_text)
-        except ValueError:
+        # Можно ввести несколько ID через пробел или запятую
+        task_ids = list(dict.fromkeys(int(task_id) for task_id in re.findall(r'\d+', update.message.text)))
+        if not task_ids:
             await update.message.reply_text(
                 "❌ Неверный формат ID! Введите число (ID задачи):",
                 reply_markup=self.get_back_keyboard()
             )
             return
         
-        # Проверяем, существует ли задача у этого пользователя
-        user_tasks = self.db.get_user_tasks(user_id)
-        task_exists = any(task[0] == task_id for task in user_tasks)
+        # Удаление с проверкой владельца одним запросом
+        deleted_ids = [task_id for task_id, _ in await self.db.delete_tasks(user_id, task_ids)]
+        for task_id in deleted_ids:
+            self.scheduler.remove_task(task_id, user_id)
         
-        if not task_exists:
+        missing_ids = [task_id for task_id in task_ids if task_id not in deleted_ids]
+        if not deleted_ids:
             await update.message.reply_text(
-                f"❌ Задача с ID {task_id} не найдена или не принадлежит вам!",
+                f"❌ Задача с ID {', '.join(map(str, missing_ids))} не найдена или не принадлежит вам!",
                 reply_markup=self.get_back_keyboard()
             )
             return
         
-        # Удаляем задачу
-        self.db.delete_task(task_id, user_id)
+        reply_text = f"✅ Удалено задач: {len(deleted_ids)} (ID {', '.join(map(str, deleted_ids))})"
+        if missing_ids:
+            reply_text += f"\n❌ Не найдены или не принадлежат вам: {', '.join(map(str, missing_ids))}"
+        
+        await update.message.reply_text(
+            reply_text,
+            reply_markup=self.get_main_keyboard()
+        )
+    
+    async def callback_router(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Единая точка для inline-кнопок: обработчик выбирается по префиксу callback_data"""
+        query = update.callback_query
+        prefix, _, payload = query.data.partition(':')
+        handler = self.callback_routes.get(prefix)
+        if handler is None:
+            await query.answer("Кнопка устарела")
+            return
+        await handler(update, context, payload)
+    
+    async def delete_task_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+        """Удаление задачи inline-кнопкой: список перерисовывается в том же сообщении"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        task_id, view = payload.split(':', 1)
+        task_id = int(task_id)
+        
+        if await self.db.delete_task(task_id, user_id):
+            self.scheduler.remove_task(task_id, user_id)
+            await query.answer(f"✅ Задача {task_id} удалена")
+        else:
+            await query.answer(f"❌ Задача {task_id} не найдена или уже удалена")
+        
+        if view == VIEW_TODAY or view == VIEW_TOMORROW:
+            tasks_text, markup = await self.get_day_tasks(user_id, 0 if view == VIEW_TODAY else 1)
+        elif view == VIEW_DELETE:
+            tasks_text, markup = await self.get_delete_list(user_id)
+        else:
+            tasks_text, markup = await self.get_tasks_page(user_id, self._parse_task_key(view[len(VIEW_PAGE) + 1:]))
+            if not tasks_text:
+                tasks_text, markup = await self.get_tasks_page(user_id)
+        
+        await self._edit(query, tasks_text or "📭 Задач больше нет!", markup)
+    
+    async def _edit(self, query, text, markup):
+        """Заменить текст и кнопки сообщения; повторное нажатие может ничего не изменить"""
+        try:
+            await query.edit_message_text(text, reply_markup=markup)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                raise
+    
+    async def delete_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /delete"""
+        await self.delete_task_button(update, context)
+    
+    async def clear_past_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /clear - удаление всех прошедших задач"""
+        user_id = update.effective_user.id
+        count = await self.db.delete_past_tasks(user_id, await self.user_now(user_id))
         
         await update.message.reply_text(
-            f"✅ Задача с ID {task_id} успешно удалена!",
+            f"🧹 Удалено прошедших задач: {count}" if count else "📭 Прошедших задач нет!",
             reply_markup=self.get_main_keyboard()
         )
     
-    async def quick_delete_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Быстрое удаление задачи через кнопку в списке"""
+    async def timezone_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /timezone [пояс] - показать или сменить часовой пояс"""
         user_id = update.effective_user.id
-        button_text = update.message.text
-        task_id = int(button_text.split('_')[1])
+        if not context.args:
+            timezone = await self.db.get_user_timezone(user_id)
+            await update.message.reply_text(
+                f"🌍 Ваш часовой пояс: {timezone}\n"
+                f"Сейчас у вас {local_now(timezone).strftime('%d.%m.%Y %H:%M')}\n\n"
+                f"Сменить: /timezone Europe/Kaliningrad",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
         
-        # Удаляем задачу
-        self.db.delete_task(task_id, user_id)
+        timezone = context.args[0]
+        if not is_valid_timezone(timezone):
+            await update.message.reply_text(
+                "❌ Неизвестный часовой пояс! Укажите его в формате Континент/Город, например: Asia/Novosibirsk",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        user = update.effective_user
+        await self.db.add_user(user.id, user.username, user.first_name)
+        if not await self.db.set_user_timezone(user_id, timezone):
+            await update.message.reply_text(
+                "❌ Не удалось сменить часовой пояс!",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        # Моменты задач пересчитаны в базе, напоминания нужно перепланировать
+        await self.scheduler.reschedule_user(user_id)
         
         await update.message.reply_text(
-            f"✅ Задача с ID {task_id} успешно удалена!",
+            f"✅ Часовой пояс изменён на {timezone}\n"
+            f"Сейчас у вас {local_now(timezone).strftime('%d.%m.%Y %H:%M')}",
             reply_markup=self.get_main_keyboard()
         )
     
-    async def delete_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /delete"""
-        await self.delete_task_button(update, context)
+    async def reminders_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик кнопки 'Напоминания'"""
+        await self.reminders_command(update, context)
+    
+    async def reminders_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /remind [ID] - за сколько напоминать обо всех задачах или об одной"""
+        user = update.effective_user
+        if not context.args:
+            await self.db.add_user(user.id, user.username, user.first_name)
+            text, markup = await self.get_user_reminders(user.id)
+            await update.message.reply_text(text, reply_markup=markup)
+            return
+        
+        if not context.args[0].isdigit():
+            await update.message.reply_text(
+                "❌ Укажите ID задачи, например: /remind 42",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        result = await self.get_task_reminders_view(int(context.args[0]), user.id)
+        if result is None:
+            await update.message.reply_text(
+                f"❌ Задача {context.args[0]} не найдена или не принадлежит вам!",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        await update.message.reply_text(result[0], reply_markup=result[1])
+    
+    async def get_user_reminders(self, user_id):
+        """Текст и переключатели общих напоминаний пользователя"""
+        mask = await self.db.get_reminder_mask(user_id)
+        text = (
+            f"⚙️ Напоминания о задачах: {describe_mask(mask)}\n\n"
+            f"Отметьте, за сколько до задачи напоминать.\n"
+            f"Для одной задачи: /remind <ID>"
+        )
+        return text, inline_markup(reminder_buttons(mask, REMINDER_USER))
+    
+    async def get_task_reminders_view(self, task_id, user_id):
+        """Текст и переключатели напоминаний задачи; None, если задачи нет"""
+        task = await self.db.get_task_reminders(task_id, user_id)
+        if not task:
+            return None
+        task_text, due_at, task_mask, user_mask = task
+        mask = user_mask if task_mask is None else task_mask
+        text = (
+            f"🔔 Напоминания о задаче {task_id}: {describe_mask(mask)}"
+            f"{' (как в настройках)' if task_mask is None else ''}\n\n"
+            f"📝 {task_text}"
+        )
+        return text, inline_markup(reminder_buttons(mask, f"{REMINDER_TASK}:{task_id}"))
+    
+    async def reminder_user_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+        """Переключить смещение в общих напоминаниях и перепланировать задачи пользователя"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        offset = parse_offset(payload)
+        if offset is None:
+            await query.answer("Кнопка устарела")
+            return
+        mask = toggle(await self.db.get_reminder_mask(user_id), offset)
+        
+        if not await self.db.set_reminder_mask(user_id, mask):
+            await query.answer("❌ Не удалось сохранить настройки!")
+            return
+        await self.scheduler.reschedule_user(user_id)
+        await query.answer(f"✅ Напоминания: {describe_mask(mask)}")
+        
+        text, markup = await self.get_user_reminders(user_id)
+        await self._edit(query, text, markup)
+    
+    async def reminder_task_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+        """Переключить смещение в напоминаниях одной задачи или вернуть ей общие"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        task_id, _, value = payload.partition(':')
+        offset = parse_offset(value)
+        if not task_id.isdigit() or (offset is None and value != REMINDER_DEFAULT):
+            await query.answer("Кнопка устарела")
+            return
+        task_id = int(task_id)
+        
+        task = await self.db.get_task_reminders(task_id, user_id)
+        if not task:
+            await query.answer(f"❌ Задача {task_id} не найдена или уже удалена")
+            return
+        task_text, due_at, task_mask, user_mask = task
+        if value == REMINDER_DEFAULT:
+            task_mask = None
+        else:
+            task_mask = toggle(user_mask if task_mask is None else task_mask, offset)
+        
+        if not await self.db.set_task_reminder_mask(task_id, user_id, task_mask):
+            await query.answer("❌ Не удалось сохранить настройки!")
+            return
+        mask = user_mask if task_mask is None else task_mask
+        self.scheduler.reschedule_task(task_id, user_id, due_at, mask)
+        await query.answer(f"✅ Напоминания: {describe_mask(mask)}")
+        
+        text, markup = await self.get_task_reminders_view(task_id, user_id)
+        await self._edit(query, text, markup)
+    
+    async def repeat_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /repeat <правило> <ЧЧ:ММ> <текст> - повторяющаяся задача"""
+        user = update.effective_user
+        usage = (
+            "Добавить: /repeat <правило> <ЧЧ:ММ> <описание>\n"
+            "Правила: ежедневно, будни, еженедельно или RRULE, "
+            "например FREQ=WEEKLY;BYDAY=MO,TH\n"
+            "Удалить: /unrepeat R<номер>"
+        )
+        if len(context.args) < 3:
+            series_text = await self.get_series_summary(user.id) or "📭 Повторяющихся задач нет!\n\n"
+            await update.message.reply_text(series_text + usage, reply_markup=self.get_main_keyboard())
+            return
+        
+        rrule = parse_rule(context.args[0])
+        time_text = context.args[1]
+        task_text = ' '.join(context.args[2:])
+        if not rrule:
+            await update.message.reply_text(f"❌ Неизвестное правило повторения!\n\n{usage}")
+            return
+        if not TIME_RE.match(time_text):
+            await update.message.reply_text(f"❌ Неверный формат времени!\n\n{usage}")
+            return
+        
+        await self.db.add_user(user.id, user.username, user.first_name)
+        timezone = await self.db.get_user_timezone(user.id)
+        now = local_now(timezone)
+        dtstart = datetime.combine(now.date(), datetime.strptime(time_text, "%H:%M").time())
+        series_id = await self.db.add_recurring_task(user.id, task_text, rrule, dtstart)
+        if not series_id:
+            await update.message.reply_text(
+                "❌ Ошибка при сохранении задачи в базу данных!",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        self.scheduler.add_series(
+            series_id, user.id, task_text, rrule, dtstart, timezone, user.first_name,
+            await self.db.get_reminder_mask(user.id)
+        )
+        
+        upcoming = next_occurrence(rrule, dtstart, now)
+        await update.message.reply_text(
+            f"✅ Повторяющаяся задача R{series_id} добавлена!\n\n"
+            f"📝 {task_text}\n"
+            f"🔁 {describe_rule(rrule)}, в {time_text}\n"
+            + (f"📅 Ближайшая: {upcoming.strftime('%d.%m.%Y %H:%M')}\n" if upcoming else ""),
+            reply_markup=self.get_main_keyboard()
+        )
+    
+    async def unrepeat_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /unrepeat R<номер> - удалить повторяющуюся задачу"""
+        user_id = update.effective_user.id
+        series_text = context.args[0].upper().lstrip('R') if context.args else ''
+        if not series_text.isdigit():
+            await update.message.reply_text(
+                "❌ Укажите номер повторяющейся задачи, например: /unrepeat R5",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        series_id = int(series_text)
+        if not await self.db.delete_recurring_task(series_id, user_id):
+            await update.message.reply_text(
+                f"❌ Повторяющаяся задача R{series_id} не найдена!",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        self.scheduler.remove_series(series_id, user_id)
+        
+        await update.message.reply_text(
+            f"✅ Повторяющаяся задача R{series_id} удалена!",
+            reply_markup=self.get_main_keyboard()
+        )
+    
+    async def import_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /import - много задач одним сообщением"""
+        lines = re.sub(r'^/import(@\w+)?', '', update.message.text, count=1).strip()
+        now = await self.user_now(update.effective_user.id)
+        if not lines:
+            tomorrow = (now + timedelta(days=1)).strftime("%d.%m.%Y")
+            await update.message.reply_text(
+                "📥 Отправьте задачи по одной в строке после /import:\n\n"
+                "/import\n"
+                f"{tomorrow} 09:00 Планёрка\n"
+                f"{tomorrow} 18:30 Спортзал\n\n"
+                "Или пришлите файл .csv (дата, время, описание) или .ics из календаря.",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        tasks, errors = parse_lines(lines, now)
+        await self._save_imported(update, tasks, errors)
+    
+    async def import_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Импорт задач из присланного файла CSV или ICS"""
+        document = update.message.document
+        if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+            await update.message.reply_text(
+                f"❌ Файл слишком большой! Максимум {IMPORT_MAX_FILE_SIZE // 1024} КБ.",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        file = await document.get_file()
+        data = (await file.download_as_bytearray()).decode('utf-8-sig', errors='replace')
+        timezone = await self.db.get_user_timezone(update.effective_user.id)
+        now = local_now(timezone)
+        if document.file_name.lower().endswith('.ics'):
+            tasks, errors = parse_ics(data, now, timezone)
+        else:
+            tasks, errors = parse_csv(data, now)
+        await self._save_imported(update, tasks, errors)
+    
+    async def _save_imported(self, update, tasks, errors):
+        """Сохранить импортированные задачи одной транзакцией, если в них нет ошибок"""
+        if errors:
+            errors_text = "\n".join(errors[:10])
+            if len(errors) > 10:
+                errors_text += f"\n... и ещё {len(errors) - 10}"
+            await update.message.reply_text(
+                f"❌ Задачи не добавлены, исправьте ошибки:\n\n{errors_text}",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        if not tasks:
+            await update.message.reply_text("📭 Не найдено ни одной задачи!", reply_markup=self.get_main_keyboard())
+            return
+        if len(tasks) > IMPORT_MAX_TASKS:
+            await update.message.reply_text(
+                f"❌ Слишком много задач! За раз можно добавить не больше {IMPORT_MAX_TASKS}.",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        user = update.effective_user
+        await self.db.add_user(user.id, user.username, user.first_name)
+        added = await self.db.add_tasks(user.id, tasks)
+        if not added:
+            await update.message.reply_text(
+                "❌ Ошибка при сохранении задач в базу данных!",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        mask = await self.db.get_reminder_mask(user.id)
+        for task_id, task_date, task_time, due_at in added:
+            self.scheduler.add_task(task_id, user.id, due_at, mask)
+        
+        logger.info(f"Импортировано {len(added)} задач для пользователя {user.id}")
+        await update.message.reply_text(
+            f"✅ Добавлено задач: {len(added)}\nЯ напомню о каждой заранее! 🔔",
+            reply_markup=self.get_main_keyboard()
+        )
+    
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /export [csv|ics] - выгрузка всех задач файлом"""
+        export_format = context.args[0].lower() if context.args else 'csv'
+        if export_format not in ('csv', 'ics'):
+            await update.message.reply_text(
+                "❌ Укажите формат: /export csv или /export ics",
+                reply_markup=self.get_main_keyboard()
+            )
+            return
+        
+        # Задачи читаются из базы пачками и сразу пишутся в файл
+        user_id = update.effective_user.id
+        stamp = utc_now()
+        count = 0
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as export_file:
+            export_file.write((csv_line(CSV_HEADER) if export_format == 'csv' else ICS_HEADER).encode('utf-8'))
+            async for batch in self.db.iter_user_tasks(user_id):
+                if export_format == 'csv':
+                    chunk = ''.join(csv_task(row) for row in batch)
+                else:
+                    chunk = ''.join(ics_event(row, stamp) for row in batch)
+                export_file.write(chunk.encode('utf-8'))
+                count += len(batch)
+            if export_format == 'ics':
+                export_file.write(ICS_FOOTER.encode('utf-8'))
+            
+            if not count:
+                await update.message.reply_text("📭 У вас пока нет задач!", reply_markup=self.get_main_keyboard())
+                return
+            
+            export_file.seek(0)
+            await update.message.reply_document(
+                document=export_file,
+                filename=f"tasks.{export_format}",
+                caption=f"📤 Выгружено задач: {count}"
+            )
     
     async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отмена добавления задачи"""
@@ -467,21 +1057,38 @@ class PlannerBot:
         await self.all_tasks_command(update, context)
     
     async def all_tasks_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Показать все задачи пользователя"""
+        """Показать предстоящие задачи пользователя постранично"""
         user_id = update.effective_user.id
-        tasks = self.db.get_user_tasks(user_id)
+        tasks_text, markup = await self.get_tasks_page(user_id)
+        series_text = await self.get_series_summary(user_id)
         
-        if not tasks:
+        if not tasks_text and not series_text:
             await update.message.reply_text(
-                "📭 У вас пока нет задач!",
+                "📭 У вас нет предстоящих задач!",
                 reply_markup=self.get_main_keyboard()
             )
             return
         
-        tasks_text = "📋 Все ваши задачи:\n\n"
-        tasks_text += self.get_tasks_with_delete_buttons(tasks)
-        
-        await update.message.reply_text(tasks_text, reply_markup=self.get_main_keyboard())
+        # Серии показываются отдельным сообщением, чтобы листание не затирало их
+        if series_text:
+            await update.message.reply_text(series_text, reply_markup=self.get_main_keyboard())
+        if tasks_text:
+            await update.message.reply_text(tasks_text, reply_markup=markup or self.get_main_keyboard())
+    
+    async def tasks_page_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+        """Листание списка задач: заменяет страницу в том же сообщении"""
+        query = update.callback_query
+        await query.answer()
+        
+        direction, key = payload.split(':', 1)
+        cursor = self._parse_task_key(key)
+        user_id = query.from_user.id
+        tasks_text, markup = await self.get_tasks_page(user_id, cursor, direction == 'p')
+        if not tasks_text:
+            # Задачи на той странице уже удалены или прошли - показываем первую
+            tasks_text, markup = await self.get_tasks_page(user_id)
+        
+        await self._edit(query, tasks_text or "📭 У вас нет предстоящих задач!", markup)
     
     async def today_tasks_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать задачи на сегодня через кнопку"""
@@ -489,21 +1096,16 @@ class PlannerBot:
     
     async def today_tasks_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать задачи на сегодня"""
-        user_id = update.effective_user.id
-        today = datetime.now().strftime("%Y-%m-%d")
-        tasks = self.db.get_user_tasks(user_id, today)
+        tasks_text, markup = await self.get_day_tasks(update.effective_user.id, 0)
         
-        if not tasks:
+        if not tasks_text:
             await update.message.reply_text(
                 "🎉 На сегодня задач нет! Можете отдыхать!",
                 reply_markup=self.get_main_keyboard()
             )
             return
         
-        tasks_text = "📅 Задачи на сегодня:\n\n"
-        tasks_text += self.get_tasks_with_delete_buttons(tasks)
-        
-        await update.message.reply_text(tasks_text, reply_markup=self.get_main_keyboard())
+        await update.message.reply_text(tasks_text, reply_markup=markup or self.get_main_keyboard())
     
     async def tomorrow_tasks_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать задачи на завтра через кнопку"""
@@ -511,21 +1113,16 @@ class PlannerBot:
     
     async def tomorrow_tasks_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать задачи на завтра"""
-        user_id = update.effective_user.id
-        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-        tasks = self.db.get_user_tasks(user_id, tomorrow)
+        tasks_text, markup = await self.get_day_tasks(update.effective_user.id, 1)
         
-        if not tasks:
+        if not tasks_text:
             await update.message.reply_text(
                 "📭 На завтра задач пока нет!",
                 reply_markup=self.get_main_keyboard()
             )
             return
         
-        tasks_text = "📆 Задачи на завтра:\n\n"
-        tasks_text += self.get_tasks_with_delete_buttons(tasks)
-        
-        await update.message.reply_text(tasks_text, reply_markup=self.get_main_keyboard())
+        await update.message.reply_text(tasks_text, reply_markup=markup or self.get_main_keyboard())
     
     # === МЕТОДЫ ДЛЯ НЕДЕЛЬНЫХ ЗАДАЧ ===
     
@@ -558,7 +1155,7 @@ class PlannerBot:
         
         context.user_data['weekly_task_text'] = task_text
         
-        today = datetime.now().date()
+        today = (await self.user_now(update.effective_user.id)).date()
         current_week_start = self._get_week_start(today)
         next_week_start = current_week_start + timedelta(days=7)
         
@@ -566,7 +1163,7 @@ class PlannerBot:
             f"📅 Выберите неделю для задачи:\n\n"
             f"• Текущая: {current_week_start.strftime('%d.%m')} - {(current_week_start + timedelta(days=6)).strftime('%d.%m.%Y')}\n"
             f"• Следующая: {next_week_start.strftime('%d.%m')} - {(next_week_start + timedelta(days=6)).strftime('%d.%m.%Y')}",
-            reply_markup=self.get_week_choice_keyboard()
+            reply_markup=self.get_week_choice_keyboard(today)
         )
         return WAITING_WEEKLY_WEEK
     
@@ -576,7 +1173,7 @@ class PlannerBot:
         user_id = update.effective_user.id
         task_text = context.user_data['weekly_task_text']
         
-        today = datetime.now().date()
+        today = (await self.user_now(user_id)).date()
         
         if "Текущая неделя" in week_choice:
             week_start = self._get_week_start(today)
@@ -587,7 +1184,7 @@ class PlannerBot:
             return WAITING_WEEKLY_WEEK
         
         # Сохраняем задачу
-        task_id = self.db.add_weekly_task(user_id, task_text, week_start.strftime("%Y-%m-%d"))
+        task_id = await self.db.add_weekly_task(user_id, task_text, week_start.strftime("%Y-%m-%d"))
         
         week_end = week_start + timedelta(days=6)
         success_text = (
@@ -607,54 +1204,29 @@ class PlannerBot:
     
     async def show_weekly_tasks(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать недельные задачи пользователя"""
-        user_id = update.effective_user.id
-        today = datetime.now().date()
-        current_week_start = self._get_week_start(today)
-        
-        tasks = self.db.get_weekly_tasks(user_id, current_week_start.strftime("%Y-%m-%d"))
+        tasks_text, markup = await self.get_weekly_list(update.effective_user.id)
         
-        if not tasks:
+        if not tasks_text:
             await update.message.reply_text(
                 "📭 На эту неделю задач нет!",
                 reply_markup=self.get_weekly_keyboard()
             )
             return
         
-        week_end = current_week_start + timedelta(days=6)
-        tasks_text = f"🗓 Задачи на неделю ({current_week_start.strftime('%d.%m')} - {week_end.strftime('%d.%m.%Y')}):\n\n"
-        
-        completed_count = 0
-        for task_id, task_text, completed in tasks:
-            if completed:
-                tasks_text += f"✅ {task_text}\n"
-                completed_count += 1
-            else:
-                tasks_text += f"📝 {task_text}\n"
-                tasks_text += f"   ✓ Выполнить_{task_id}\n\n"
-        
-        total_count = len(tasks)
-        tasks_text += f"\n📊 Прогресс: {completed_count}/{total_count} выполнено"
-        
-        if completed_count == total_count:
-            tasks_text += "\n\n🎉 Все задачи выполнены! Отличная работа!"
-        
-        await update.message.reply_text(
-            tasks_text,
-            reply_markup=self.get_weekly_keyboard()
-        )
+        await update.message.reply_text(tasks_text, reply_markup=markup or self.get_weekly_keyboard())
     
-    async def complete_weekly_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Отметить недельную задачу как выполненную"""
-        user_id = update.effective_user.id
-        button_text = update.message.text
-        task_id = int(button_text.split('_')[1])
+    async def complete_weekly_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+        """Отметить недельную задачу выполненной inline-кнопкой и перерисовать список"""
+        query = update.callback_query
+        user_id = query.from_user.id
         
-        self.db.complete_weekly_task(task_id, user_id)
+        if await self.db.complete_weekly_task(int(payload), user_id):
+            await query.answer("✅ Задача отмечена как выполненная!")
+        else:
+            await query.answer("❌ Задача не найдена или уже удалена!")
         
-        await update.message.reply_text(
-            f"✅ Задача отмечена как выполненная!",
-            reply_markup=self.get_weekly_keyboard()
-        )
+        tasks_text, markup = await self.get_weekly_list(user_id)
+        await self._edit(query, tasks_text or "📭 На эту неделю задач нет!", markup)
     
     async def help_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик кнопки 'Помощь'"""
@@ -665,8 +1237,16 @@ class PlannerBot:
         help_text = (
             "📖 Помощь по использованию бота:\n\n"
             "🔸 📝 Добавить задачу - задача с конкретным временем\n"
+            "🔸 /add завтра 15:30 позвонить маме - добавить задачу одним сообщением\n"
             "🔸 📋 Мои задачи - все запланированные задачи\n"
             "🔸 🗑 Удалить задачу - удалить задачу по ID\n"
+            "🔸 /clear - удалить все прошедшие задачи\n"
+            "🔸 /timezone - часовой пояс (например, /timezone Asia/Yekaterinburg)\n"
+            "🔸 ⚙️ Напоминания - за сколько напоминать о задачах, /remind 42 - для одной задачи\n"
+            "🔸 /repeat будни 09:00 Планёрка - повторяющаяся задача\n"
+            "🔸 /unrepeat R5 - удалить повторяющуюся задачу\n"
+            "🔸 /import - много задач сразу: строки ДД.ММ.ГГГГ ЧЧ:ММ описание или файл CSV/ICS\n"
+            "🔸 /export csv или /export ics - выгрузить все задачи файлом\n"
             "🔸 📅 Сегодня - задачи на сегодня\n"
             "🔸 📆 Завтра - задачи на завтра\n"
             "🔸 🗓 Недельные задачи - задачи на всю неделю\n\n"
@@ -679,6 +1259,26 @@ class PlannerBot:
         )
         await update.message.reply_text(help_text, reply_markup=self.get_main_keyboard())
     
+    async def dbstats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /dbstats [N|reset] - самые затратные запросы к базе (только для ADMIN_IDS)"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await self.unknown_command(update, context)
+            return
+        
+        if context.args and context.args[0].lower() == 'reset':
+            QUERY_STATS.reset()
+            await update.message.reply_text("🧹 Статистика запросов сброшена")
+            return
+        
+        limit = int(context.args[0]) if context.args and context.args[0].isdigit() else 10
+        report = QUERY_STATS.report(min(limit, 20))
+        # Сообщение Telegram - не длиннее 4096 символов
+        await update.message.reply_text(f"🗄 Запросы к базе по общему времени:\n\n{report}"[:4096])
+    
+    def dump_db_stats(self):
+        """Записать самые затратные запросы в журнал (по сигналу SIGUSR1)"""
+        logger.info(f"🗄 Запросы к базе по общему времени:\n{QUERY_STATS.report(20, query_width=300)}")
+    
     async def unknown_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик неизвестных команд"""
         await update.message.reply_text(
@@ -698,23 +1298,52 @@ class PlannerBot:
             reply_markup=self.get_main_keyboard()
         )
     
+    async def on_startup(self, application: Application):
+        """Запуск очереди отправки и планировщика напоминаний в event loop приложения"""
+        await self.sender.start()
+        await self.scheduler.start()
+        if METRICS_PORT:
+            # Занятый порт не должен мешать боту работать - только без метрик
+            try:
+                self.metrics_server = await metrics.serve(METRICS_LISTEN, METRICS_PORT)
+            except OSError as e:
+                logger.error(f"Метрики не запущены на {METRICS_LISTEN}:{METRICS_PORT}: {e}")
+        # kill -USR1 <pid> - статистика запросов в журнал; на Windows сигнала нет
+        if hasattr(signal, 'SIGUSR1'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.dump_db_stats)
+    
+    async def on_shutdown(self, application: Application):
+        """Остановка планировщика, досылка очереди и закрытие пула соединений"""
+        if hasattr(signal, 'SIGUSR1'):
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+        if self.metrics_server:
+            self.metrics_server.close()
+            await self.metrics_server.wait_closed()
+        await self.scheduler.stop()
+        await self.sender.stop()
+        self.db.close()
+    
     def run(self):
         """Запуск бота"""
         print("🚀 Запуск Telegram бота...")
         self.setup_handlers()
         
-        # Запускаем планировщик напоминаний
-        self.scheduler = Scheduler(self.application.bot)
-        self.scheduler.start()
-        
-        print("✅ Бот запущен! Нажмите Ctrl+C для остановки.")
-        
-        # Запускаем бота
-        self.application.run_polling()
-        
-        # При остановке останавливаем планировщик
-        if self.scheduler:
-            self.scheduler.stop()
+        print(f"✅ Бот запущен в режиме {BOT_MODE}! Нажмите Ctrl+C для остановки.")
+        
+        # Запускаем бота; планировщик стартует вместе с приложением (on_startup)
+        if BOT_MODE == 'webhook':
+            # Telegram сам присылает обновления; PTB проверяет секрет в заголовке
+            self.application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        else:
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     bot = PlannerBot()
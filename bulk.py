@@ -0,0 +1,166 @@
+"""Массовый импорт задач (строки, CSV, ICS) и выгрузка в CSV и ICS.
+
+Разбор возвращает задачи в виде (текст, ГГГГ-ММ-ДД, ЧЧ:ММ), как их
+принимает Database.add_tasks, и список ошибок по строкам. Даты и время -
+локальные для пользователя; now - его текущее время без tzinfo.
+"""
+import csv
+import io
+import re
+from datetime import datetime
+from typing import List, Tuple
+
+import pytz
+
+from quickadd import TIME_RE
+from timezones import is_valid_timezone, to_local
+
+LINE_RE = re.compile(r'^(\d{1,2}\.\d{1,2}\.\d{4})\s+(\d{1,2}:\d{2})\s+(.+)$')
+ICS_DATETIME_RE = re.compile(r'^(\d{8}T\d{6})(Z?)$')
+DATE_FORMATS = ('%d.%m.%Y', '%Y-%m-%d')
+
+CSV_HEADER = ('дата', 'время', 'задача')
+ICS_HEADER = 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//telegram-planner-bot//RU\r\n'
+ICS_FOOTER = 'END:VCALENDAR\r\n'
+
+def parse_lines(text: str, now: datetime) -> Tuple[List[Tuple], List[str]]:
+    """Задачи из строк вида "ДД.ММ.ГГГГ ЧЧ:ММ описание" """
+    tasks, errors = [], []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        match = LINE_RE.match(line)
+        if not match:
+            errors.append(f"строка {number}: нужен формат ДД.ММ.ГГГГ ЧЧ:ММ описание")
+            continue
+        _add(tasks, errors, number, *match.groups(), now)
+    return tasks, errors
+
+def parse_csv(data: str, now: datetime) -> Tuple[List[Tuple], List[str]]:
+    """Задачи из CSV со столбцами дата, время, описание (разделитель , или ;)"""
+    try:
+        dialect = csv.Sniffer().sniff(data[:4096], delimiters=',;')
+    except csv.Error:
+        dialect = csv.excel
+
+    tasks, errors = [], []
+    for number, row in enumerate(csv.reader(io.StringIO(data), dialect), 1):
+        if not any(cell.strip() for cell in row):
+            continue
+        if number == 1 and _parse_date(row[0].strip()) is None:
+            continue  # Заголовок
+        if len(row) < 3:
+            errors.append(f"строка {number}: нужны столбцы дата, время, описание")
+            continue
+        _add(tasks, errors, number, row[0].strip(), row[1].strip(), row[2].strip(), now)
+    return tasks, errors
+
+def parse_ics(data: str, now: datetime, tz_name: str) -> Tuple[List[Tuple], List[str]]:
+    """Задачи из событий VEVENT: DTSTART и SUMMARY; время переводится в пояс tz_name"""
+    tasks, errors = [], []
+    event = None
+    for number, line in _unfold(data):
+        head, _, value = line.partition(':')
+        name, *params = head.split(';')
+        name = name.upper()
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {'number': number}
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            _add_event(tasks, errors, event, now, tz_name)
+            event = None
+        elif event is not None and name in ('DTSTART', 'SUMMARY'):
+            event[name] = (params, value)
+    return tasks, errors
+
+def csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+def csv_task(row) -> str:
+    """Строка CSV для задачи (id, текст, дата, время, due_at) - в том же виде, что принимает импорт"""
+    task_id, task_text, task_date, task_time, due_at = row
+    return csv_line((task_date.strftime('%d.%m.%Y'), task_time.strftime('%H:%M'), task_text))
+
+def ics_event(row, stamp: datetime) -> str:
+    """VEVENT для задачи (id, текст, дата, время, due_at); время - в UTC"""
+    task_id, task_text, task_date, task_time, due_at = row
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:task-{task_id}@telegram-planner-bot',
+        f"DTSTAMP:{stamp.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')}",
+        f"DTSTART:{due_at.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')}",
+        'SUMMARY:' + _ics_escape(task_text),
+        'END:VEVENT',
+    ]
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+def _add(tasks, errors, number, date_text, time_text, task_text, now):
+    task_date = _parse_date(date_text)
+    if task_date is None:
+        errors.append(f"строка {number}: неверная дата {date_text}")
+    elif not TIME_RE.match(time_text):
+        errors.append(f"строка {number}: неверное время {time_text}")
+    elif not task_text:
+        errors.append(f"строка {number}: пустое описание")
+    elif datetime.combine(task_date, datetime.strptime(time_text, '%H:%M').time()) < now:
+        errors.append(f"строка {number}: дата и время уже прошли")
+    else:
+        tasks.append((task_text, task_date.strftime('%Y-%m-%d'), time_text))
+
+def _add_event(tasks, errors, event, now, tz_name):
+    number = event['number']
+    params, value = event.get('DTSTART', ([], ''))
+    match = ICS_DATETIME_RE.match(value.strip())
+    if not match:
+        errors.append(f"строка {number}: у события нет даты и времени начала")
+        return
+
+    start = datetime.strptime(match.group(1), '%Y%m%dT%H%M%S')
+    event_tz = next((param[len('TZID='):] for param in params if param.upper().startswith('TZID=')), None)
+    if match.group(2):
+        start = to_local(pytz.utc.localize(start), tz_name)
+    elif event_tz and is_valid_timezone(event_tz):
+        start = to_local(pytz.timezone(event_tz).localize(start), tz_name)
+
+    summary = _ics_unescape(event.get('SUMMARY', ([], ''))[1]).strip()
+    _add(tasks, errors, number, start.strftime('%d.%m.%Y'), start.strftime('%H:%M'), summary, now)
+
+def _parse_date(text):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+def _unfold(data):
+    """Строки ICS с номерами; строки продолжения (с пробелом в начале) склеиваются"""
+    number, current = 0, None
+    for index, line in enumerate(data.splitlines(), 1):
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield number, current
+        number, current = index, line
+    if current is not None:
+        yield number, current
+
+def _ics_escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def _ics_unescape(text):
+    return re.sub(r'\\([\\;,nN])', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), text)
+
+def _fold(line, limit=75):
+    """Перенос строк ICS длиннее limit байт (RFC 5545)"""
+    parts, current = [], ''
+    for char in line:
+        if len((current + char).encode('utf-8')) > limit - (1 if parts else 0):
+            parts.append(current)
+            current = ''
+        current += char
+    parts.append(current)
+    return '\r\n '.join(parts)
@@ -0,0 +1,118 @@
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Hashable, Tuple
+
+from config import CACHE_MAX_ENTRIES, CACHE_TTL
+
+# Виды списков в кэше
+VIEW_DAY = 'day'    # задачи на дату (Сегодня / Завтра)
+VIEW_ALL = 'all'    # все задачи (Мои задачи)
+VIEW_WEEK = 'week'  # недельные задачи
+VIEW_RECURRING = 'recurring'  # повторяющиеся задачи
+VIEW_SETTINGS = 'settings'  # настройки пользователя (часовой пояс, напоминания)
+
+class TaskCache:
+    """Кэш списков задач по ключу (user_id, вид списка, дата/неделя).
+
+    Хранит не больше max_entries списков, вытесняя давно не читанные
+    (LRU), и не дольше ttl секунд. Изменения задач сбрасывают только
+    затронутые списки пользователя.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # ключ -> (истекает, значение)
+        self._by_user = defaultdict(set)  # user_id -> ключи его списков
+        # Номер сброса растёт при каждом сбросе. Список, прочитанный из базы во
+        # время изменения, не должен попасть в кэш устаревшим, поэтому put
+        # сверяет номер последнего сброса его пользователя до и после чтения.
+        # Сброс у одного пользователя не мешает заполнять кэш остальным
+        self._resets = 0
+        self._reset_all_at = 0  # последний сброс у всех пользователей
+        self._user_reset_at = {}  # user_id -> последний сброс его списков
+
+    def generation(self, user_id: int) -> int:
+        """Номер последнего сброса, касавшегося списков пользователя"""
+        return max(self._reset_all_at, self._user_reset_at.get(user_id, 0))
+
+    def get(self, user_id: int, view: str, key: Hashable = None) -> Tuple[bool, Any]:
+        """(найдено ли, значение)"""
+        entry_key = (user_id, view, key)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(entry_key)
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(entry_key)
+        self.hits += 1
+        return True, value
+
+    def put(self, user_id: int, view: str, key: Hashable, value: Any, generation: int = None):
+        """Сохранить список; generation - значение self.generation(user_id) до чтения из базы"""
+        if generation is not None and generation != self.generation(user_id):
+            return
+
+        entry_key = (user_id, view, key)
+        self._entries[entry_key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(entry_key)
+        self._by_user[user_id].add(entry_key)
+
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def invalidate(self, user_id: int, view: str, key: Hashable = None, any_key: bool = False):
+        """Сбросить список пользователя; any_key - все списки этого вида"""
+        self._resets += 1
+        if len(self._user_reset_at) >= self.max_entries:
+            # Не копим номера всех когда-либо менявшихся пользователей: забытые
+            # номера заменяет общий, и идущие чтения просто не попадут в кэш
+            self._user_reset_at.clear()
+            self._reset_all_at = self._resets
+        self._user_reset_at[user_id] = self._resets
+        if any_key:
+            for entry_key in [k for k in self._by_user.get(user_id, ()) if k[1] == view]:
+                self._remove(entry_key)
+        else:
+            self._remove((user_id, view, key))
+
+    def invalidate_view(self, view: str):
+        """Сбросить списки этого вида у всех пользователей (перенос недели)"""
+        self._resets += 1
+        self._reset_all_at = self._resets
+        for entry_key in [k for k in self._entries if k[1] == view]:
+            self._remove(entry_key)
+
+    def clear(self):
+        self._resets += 1
+        self._reset_all_at = self._resets
+        self._user_reset_at.clear()
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, entry_key):
+        if self._entries.pop(entry_key, None) is None:
+            return
+        user_keys = self._by_user.get(entry_key[0])
+        if user_keys is not None:
+            user_keys.discard(entry_key)
+            if not user_keys:
+                del self._by_user[entry_key[0]]
@@ -1,4 +1,6 @@
 import os
+import hashlib
+import socket
 
 # Получаем токен из переменных окружения
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
@@ -7,6 +9,87 @@ if not BOT_TOKEN:
     raise ValueError("❌ BOT_TOKEN не найден в переменных окружения!")
 
 TIMEZONE = "Europe/Moscow"
-REMINDER_TIMES = [5, 15, 30, 60]  # За сколько минут напоминать
+REMINDER_TIMES = [5, 15, 30, 60]  # За сколько минут напоминать, если пользователь не выбрал сам
+# Из чего можно выбирать в настройках. Номер в списке - бит маски в базе
+# (users.reminder_mask, tasks.reminder_mask), поэтому варианты только дописываются в конец,
+# а next_remind_at уже запланированных задач пересчитывает новая миграция
+REMINDER_OPTIONS = [5, 15, 30, 60, 10, 120, 180, 1440]
+TASKS_PAGE_SIZE = 10  # Задач на одной странице списка
+
+# Массовый импорт: сколько задач за раз и наибольший размер файла CSV/ICS
+IMPORT_MAX_TASKS = int(os.environ.get('IMPORT_MAX_TASKS', 500))
+IMPORT_MAX_FILE_SIZE = int(os.environ.get('IMPORT_MAX_FILE_SIZE', 1024 * 1024))
+# Выгрузка держится в памяти до этого размера, дальше - во временном файле
+EXPORT_SPOOL_SIZE = int(os.environ.get('EXPORT_SPOOL_SIZE', 1024 * 1024))
+
+# Секции задач по месяцам: на сколько месяцев вперёд создавать и сколько
+# прошедших месяцев держать в tasks, прежде чем перенести их в tasks_history
+TASK_PARTITIONS_AHEAD = int(os.environ.get('TASK_PARTITIONS_AHEAD', 3))
+TASK_RETENTION_MONTHS = int(os.environ.get('TASK_RETENTION_MONTHS', 1))
+
+# Имя экземпляра бота в job_runs, когда запущено несколько экземпляров
+INSTANCE_ID = os.environ.get('INSTANCE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+# Через сколько секунд без отметки о ходе незавершённый запуск в job_runs
+# может подхватить другой экземпляр (упавший посреди рассылки)
+JOB_LEASE = int(os.environ.get('JOB_LEASE', 600))
+
+# Пул соединений с PostgreSQL
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+# Сколько секунд ждать свободного соединения, прежде чем вернуть ошибку
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+# Запросы дольше стольких миллисекунд пишутся в журнал с планом EXPLAIN; 0 - не писать
+DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 200))
+
+# Telegram id администраторов через запятую: им доступна /dbstats
+ADMIN_IDS = {int(admin_id) for admin_id in os.environ.get('ADMIN_IDS', '').split(',') if admin_id.strip()}
+
+# Исходящие сообщения: лимиты Telegram ~30 сообщений/с на бота и ~1/с в один чат
+SEND_RATE = float(os.environ.get('SEND_RATE', 25))
+SEND_CHAT_INTERVAL = float(os.environ.get('SEND_CHAT_INTERVAL', 1.0))
+SEND_CONCURRENCY = int(os.environ.get('SEND_CONCURRENCY', 8))
+SEND_MAX_RETRIES = int(os.environ.get('SEND_MAX_RETRIES', 5))
+SEND_QUEUE_SIZE = int(os.environ.get('SEND_QUEUE_SIZE', 1000))
+
+# Кэш списков задач: сколько списков хранить и сколько секунд
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+
+# Метрики в формате Prometheus на http://METRICS_LISTEN:METRICS_PORT/metrics; 0 - выключены.
+# По умолчанию выключены: привычный 9100 обычно занят node_exporter
+METRICS_LISTEN = os.environ.get('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+
+# Хранение состояния диалогов между перезапусками: postgres, pickle (файл) или none
+PERSISTENCE = os.environ.get('PERSISTENCE', 'postgres')
+PERSISTENCE_FILE = os.environ.get('PERSISTENCE_FILE', 'planner_state.pickle')
+# PTB сохраняет изменения раз в PERSISTENCE_INTERVAL секунд; запись в базу
+# откладывается ещё на PERSISTENCE_DEBOUNCE секунд, чтобы собрать их в один запрос
+PERSISTENCE_INTERVAL = float(os.environ.get('PERSISTENCE_INTERVAL', 10))
+PERSISTENCE_DEBOUNCE = float(os.environ.get('PERSISTENCE_DEBOUNCE', 0.5))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+# Сколько обновлений обрабатывать одновременно (1 - строго по очереди); обновления
+# одного пользователя всегда идут по очереди (updates.PerUserUpdateProcessor)
+MAX_CONCURRENT_UPDATES = int(os.environ.get('MAX_CONCURRENT_UPDATES', 16))
+
+# Webhook: публичный адрес, порт (Railway передаёт его в PORT) и секрет,
+# который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('PORT', 8443))
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', 40))
+
+if PERSISTENCE not in ('postgres', 'pickle', 'none'):
+    raise ValueError(f"❌ Неизвестный PERSISTENCE: {PERSISTENCE} (ожидается postgres, pickle или none)")
+
+if BOT_MODE not in ('polling', 'webhook'):
+    raise ValueError(f"❌ Неизвестный BOT_MODE: {BOT_MODE} (ожидается polling или webhook)")
+
+if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+    raise ValueError("❌ Для BOT_MODE=webhook нужен WEBHOOK_URL!")
 
 print("✅ Конфигурация загружена успешно")
@@ -1,281 +1,1177 @@
 import os
+import asyncio
+import functools
+import itertools
+import threading
+import time
 import psycopg2
-from datetime import datetime, timedelta
+from psycopg2 import pool, sql
+from psycopg2.extras import execute_values
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from typing import List, Tuple, Optional
 import logging
 
+from config import (
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, TASKS_PAGE_SIZE, TIMEZONE, JOB_LEASE,
+    TASK_PARTITIONS_AHEAD, TASK_RETENTION_MONTHS, REMINDER_OPTIONS
+)
+from migrations import migrate
+from metrics import DB_ERRORS, DB_SECONDS
+from querystats import ProfilingCursor
+from cache import TaskCache, VIEW_DAY, VIEW_ALL, VIEW_WEEK, VIEW_RECURRING, VIEW_SETTINGS
+from reminders import DEFAULT_MASK, MAX_OFFSET, offsets_of
+
 logger = logging.getLogger(__name__)
 
+# Ошибки, после которых соединение считается оборванным
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Ключ app_state: неделя, на которую последний раз переносились задачи
+LAST_ROLLED_WEEK = 'last_rolled_week'
+
+# config.REMINDER_OPTIONS для task_next_reminder (migrations, v13) в тексте запроса:
+# execute_values не принимает других параметров, кроме строк VALUES
+OPTIONS_SQL = 'ARRAY[{}]'.format(', '.join(map(str, REMINDER_OPTIONS)))
+
+# Должные напоминания: (задача, за сколько минут), момент которых наступил.
+# Задачи выбираются по индексу next_remind_at - моменту их ближайшего
+# напоминания; так как due_at > now, он не раньше now - MAX_OFFSET. Смещения -
+# все варианты REMINDER_OPTIONS с номером бита, из них остаются включённые в
+# маске задачи или её владельца: один запрос при любом числе вариантов.
+# Условие на task_date оставляет только секции tasks за эти дни
+DUE_REMINDERS_QUERY = '''
+    SELECT t.id, t.user_id, t.task_text, t.task_date, t.task_time, u.first_name, t.due_at, o.offset_min,
+           COALESCE(t.reminder_mask, u.reminder_mask)
+    FROM tasks t
+    JOIN users u ON t.user_id = u.user_id
+    CROSS JOIN unnest(%s::int[]) WITH ORDINALITY AS o(offset_min, bit)
+    WHERE t.reminded = FALSE
+      AND t.next_remind_at > %s
+      AND t.next_remind_at <= %s
+      AND t.task_date BETWEEN %s AND %s
+      AND t.due_at > %s
+      AND t.due_at <= %s
+      AND COALESCE(t.reminder_mask, u.reminder_mask) & (1 << (o.bit::int - 1)) <> 0
+      AND t.due_at - make_interval(mins => o.offset_min) <= %s
+      AND NOT o.offset_min = ANY(t.reminded_offsets)
+    ORDER BY t.id, o.offset_min
+'''
+
+def _task_dates(since, until):
+    """Границы task_date для задач с due_at в (since, until]: локальная дата
+    задачи отличается от даты в UTC не больше чем на сутки"""
+    return (since - timedelta(days=1)).date(), (until + timedelta(days=1)).date()
+
+def _due_reminders_params(now):
+    until = now + timedelta(minutes=MAX_OFFSET)
+    return (REMINDER_OPTIONS, now - timedelta(minutes=MAX_OFFSET), now,
+            *_task_dates(now, until), now, until, now)
+
+def _add_months(month, count):
+    """Первое число месяца через count месяцев от month"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def _mark_reminders(cursor, delivered):
+    if delivered:
+        execute_values(cursor, f'''
+            UPDATE tasks AS t
+            SET reminded_offsets = t.reminded_offsets || v.offsets,
+                reminded = t.reminded OR v.done,
+                next_remind_at = task_next_reminder(t.due_at, v.mask, t.reminded_offsets || v.offsets, {OPTIONS_SQL})
+            FROM (VALUES %s) AS v(id, offsets, done, mask)
+            WHERE t.id = v.id
+        ''', delivered, template='(%s, %s::int[], %s, %s)')
+
 class Database:
-    def __init__(self):
-        self.conn = None
+    def __init__(self, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.pool = None
+        # Ограничивает число одновременно взятых соединений: при исчерпании
+        # пула потоки ждут, а не получают PoolError
+        self._slots = threading.BoundedSemaphore(maxconn)
         self.init_db()
-    
+
+    def _get_database_url(self) -> Optional[str]:
+        # Railway автоматически предоставляет DATABASE_URL
+        database_url = os.environ.get('DATABASE_URL')
+
+        # Railway использует postgres://, но psycopg2 требует postgresql://
+        if database_url and database_url.startswith('postgres://'):
+            database_url = database_url.replace('postgres://', 'postgresql://', 1)
+        return database_url
+
     def init_db(self):
-        """Инициализация базы данных для Railway"""
+        """Инициализация пула соединений для Railway"""
         try:
-            # Railway автоматически предоставляет DATABASE_URL
-            database_url = os.environ.get('DATABASE_URL')
-            
+            database_url = self._get_database_url()
+
             if database_url:
                 print("🔗 Подключение к PostgreSQL на Railway...")
-                
-                # Railway использует postgres://, но psycopg2 требует postgresql://
-                if database_url.startswith('postgres://'):
-                    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-                
-                self.conn = psycopg2.connect(database_url)
-                self._create_tables()
-                print("✅ Успешно подключено к PostgreSQL на Railway")
-                
+
+                # Все запросы всех методов идут через ProfilingCursor (querystats.py)
+                self.pool = pool.ThreadedConnectionPool(
+                    self.minconn, self.maxconn, database_url, cursor_factory=ProfilingCursor
+                )
+                self._migrate()
+                print(f"✅ Успешно подключено к PostgreSQL на Railway (пул {self.minconn}-{self.maxconn})")
+
                 # Проверка подключения
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT version();")
-                db_version = cursor.fetchone()
+                db_version = self._fetchone("SELECT version();")
                 print(f"🔍 Версия PostgreSQL: {db_version[0]}")
-                cursor.close()
-                
+
             else:
                 print("❌ DATABASE_URL не найден")
-                
+
         except Exception as e:
             print(f"❌ Ошибка подключения к базе: {e}")
-    
-    def _create_tables(self):
-        """Создание таблиц если их нет"""
-        if not self.conn:
-            return
-            
-        cursor = self.conn.cursor()
-        
+
+    def close(self):
+        """Закрыть все соединения пула"""
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
+
+    def _getconn(self):
+        """Взять соединение из пула; если все заняты - ждать свободного до DB_POOL_TIMEOUT секунд"""
+        if not self.pool:
+            # База была недоступна при старте - пробуем подключиться снова
+            self.init_db()
+            if not self.pool:
+                raise psycopg2.OperationalError("Нет подключения к базе")
+
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise pool.PoolError(f"Все {self.maxconn} соединений с базой заняты дольше {DB_POOL_TIMEOUT} с")
         try:
-            # Таблица пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица ежедневных задач
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT,
-                    task_text TEXT NOT NULL,
-                    task_date DATE NOT NULL,
-                    task_time TIME NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    reminded BOOLEAN DEFAULT FALSE,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # Таблица недельных задач
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS weekly_tasks (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT,
-                    task_text TEXT NOT NULL,
-                    week_start DATE NOT NULL,
-                    completed BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-                )
-            ''')
-            
-            self.conn.commit()
-            cursor.close()
-            print("✅ Таблицы созданы/проверены")
-            
+            return self.pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _putconn(self, conn, close: bool = False):
+        self.pool.putconn(conn, close=close)
+        self._slots.release()
+
+    def _run(self, func):
+        """Выполнить func(cursor) в отдельной транзакции на соединении из пула.
+
+        Оборванное соединение выбрасывается из пула, и запрос один раз
+        повторяется на новом соединении.
+        """
+        for attempt in range(2):
+            conn = self._getconn()
+            try:
+                with conn.cursor() as cursor:
+                    result = func(cursor)
+                conn.commit()
+            except CONNECTION_ERRORS as e:
+                DB_ERRORS.inc(type(e).__name__)
+                self._putconn(conn, close=True)
+                if attempt:
+                    raise
+                logger.warning(f"Соединение с базой потеряно, переподключение: {e}")
+                continue
+            except Exception as e:
+                DB_ERRORS.inc(type(e).__name__)
+                conn.rollback()
+                self._putconn(conn)
+                raise
+            self._putconn(conn)
+            return result
+
+    def _stream(self, query: str, params: tuple = None, batch_size: int = 500):
+        """Потоковая выборка серверным курсором: строки читаются пачками по batch_size.
+
+        Соединение занято, пока генератор не исчерпан или не закрыт.
+        """
+        conn = self._getconn()
+        try:
+            with conn.cursor(name='stream') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params or ())
+                yield from cursor
+            conn.commit()
+        except CONNECTION_ERRORS as e:
+            DB_ERRORS.inc(type(e).__name__)
+            self._putconn(conn, close=True)
+            raise
+        except BaseException as e:
+            # В том числе GeneratorExit, если перебор прервали
+            if isinstance(e, Exception):
+                DB_ERRORS.inc(type(e).__name__)
+            conn.rollback()
+            self._putconn(conn)
+            raise
+        self._putconn(conn)
+
+    def _fetchone(self, query: str, params: tuple = None):
+        def fetch(cursor):
+            cursor.execute(query, params or ())
+            return cursor.fetchone()
+        return self._run(fetch)
+
+    def _fetchall(self, query: str, params: tuple = None) -> List[Tuple]:
+        def fetch(cursor):
+            cursor.execute(query, params or ())
+            return cursor.fetchall()
+        return self._run(fetch)
+
+    def _migrate(self):
+        """Создание и обновление схемы базы миграциями"""
+        try:
+            applied = self._run(migrate)
+            if applied:
+                print(f"✅ Применены миграции: {', '.join(map(str, applied))}")
+            print("✅ Схема базы актуальна")
         except Exception as e:
-            print(f"❌ Ошибка создания таблиц: {e}")
-            self.conn.rollback()
-    
+            print(f"❌ Ошибка миграции базы: {e}")
+
     def _execute_query(self, query: str, params: tuple = None, return_result: bool = False):
         """Безопасное выполнение запроса"""
-        if not self.conn:
-            return None
-            
-        cursor = self.conn.cursor()
-        try:
+        def execute(cursor):
             cursor.execute(query, params or ())
             if return_result:
-                result = cursor.fetchone()
-                self.conn.commit()
-                cursor.close()
-                return result
-            else:
-                self.conn.commit()
-                cursor.close()
-                return cursor
+                return cursor.fetchone()
+            return cursor.rowcount
+
+        try:
+            return self._run(execute)
         except Exception as e:
             logger.error(f"Ошибка базы: {e}")
-            self.conn.rollback()
             return None
-    
+
     # === МЕТОДЫ ДЛЯ ЕЖЕДНЕВНЫХ ЗАДАЧ ===
-    
+
     def add_user(self, user_id: int, username: str, first_name: str):
-        cursor = self._execute_query('''
-            INSERT INTO users (user_id, username, first_name)
-            VALUES (%s, %s, %s)
+        self._execute_query('''
+            INSERT INTO users (user_id, username, first_name, timezone, reminder_mask)
+            VALUES (%s, %s, %s, %s, %s)
             ON CONFLICT (user_id) DO NOTHING
-        ''', (user_id, username, first_name))
-        if cursor:
-            cursor.close()
-    
-    def add_task(self, user_id: int, task_text: str, task_date: str, task_time: str) -> int:
+        ''', (user_id, username, first_name, TIMEZONE, DEFAULT_MASK))
+
+    def get_reminder_mask(self, user_id: int) -> int:
+        """Маска смещений напоминаний пользователя (reminders.py)"""
         result = self._execute_query('''
-            INSERT INTO tasks (user_id, task_text, task_date, task_time)
-            VALUES (%s, %s, %s, %s)
+            SELECT reminder_mask FROM users WHERE user_id = %s
+        ''', (user_id,), return_result=True)
+        return result[0] if result else DEFAULT_MASK
+
+    def set_reminder_mask(self, user_id: int, mask: int) -> bool:
+        """Сменить маску пользователя и моменты напоминаний задач без своей маски"""
+        def update(cursor):
+            cursor.execute('''
+                UPDATE users SET reminder_mask = %s WHERE user_id = %s
+            ''', (mask, user_id))
+            if not cursor.rowcount:
+                return False
+            cursor.execute(f'''
+                UPDATE tasks
+                SET next_remind_at = task_next_reminder(due_at, %s, reminded_offsets, {OPTIONS_SQL})
+                WHERE user_id = %s AND reminder_mask IS NULL AND reminded = FALSE
+            ''', (mask, user_id))
+            return True
+
+        try:
+            return self._run(update)
+        except Exception as e:
+            logger.error(f"Ошибка смены напоминаний: {e}")
+            return False
+
+    def get_task_reminders(self, task_id: int, user_id: int) -> Optional[Tuple]:
+        """(текст, due_at, маска задачи или None, маска пользователя) задачи пользователя; None, если её нет"""
+        return self._execute_query('''
+            SELECT t.task_text, t.due_at, t.reminder_mask, u.reminder_mask
+            FROM tasks t
+            JOIN users u ON t.user_id = u.user_id
+            WHERE t.id = %s AND t.user_id = %s
+        ''', (task_id, user_id), return_result=True)
+
+    def set_task_reminder_mask(self, task_id: int, user_id: int, mask: Optional[int]) -> bool:
+        """Своя маска напоминаний задачи; None - как у пользователя"""
+        result = self._execute_query(f'''
+            UPDATE tasks t
+            SET reminder_mask = %s,
+                next_remind_at = task_next_reminder(
+                    t.due_at, COALESCE(%s, u.reminder_mask), t.reminded_offsets, {OPTIONS_SQL}
+                )
+            FROM users u
+            WHERE u.user_id = t.user_id AND t.id = %s AND t.user_id = %s
+        ''', (mask, mask, task_id, user_id))
+        return bool(result)
+
+    def get_user_timezone(self, user_id: int) -> str:
+        result = self._execute_query('''
+            SELECT timezone FROM users WHERE user_id = %s
+        ''', (user_id,), return_result=True)
+        return result[0] if result else TIMEZONE
+
+    def set_user_timezone(self, user_id: int, timezone: str) -> bool:
+        """Сменить часовой пояс и пересчитать моменты задач пользователя"""
+        def update(cursor):
+            cursor.execute('''
+                UPDATE users SET timezone = %s WHERE user_id = %s
+            ''', (timezone, user_id))
+            if not cursor.rowcount:
+                return False
+            cursor.execute(f'''
+                UPDATE tasks t
+                SET due_at = (t.task_date + t.task_time) AT TIME ZONE %s,
+                    next_remind_at = task_next_reminder(
+                        (t.task_date + t.task_time) AT TIME ZONE %s,
+                        COALESCE(t.reminder_mask, u.reminder_mask), t.reminded_offsets, {OPTIONS_SQL}
+                    )
+                FROM users u
+                WHERE u.user_id = t.user_id AND t.user_id = %s
+            ''', (timezone, timezone, user_id))
+            return True
+
+        try:
+            return self._run(update)
+        except Exception as e:
+            logger.error(f"Ошибка смены часового пояса: {e}")
+            return False
+
+    def add_task(self, user_id: int, task_text: str, task_date: str, task_time: str) -> int:
+        # due_at - момент задачи в часовом поясе пользователя
+        result = self._execute_query(f'''
+            INSERT INTO tasks (user_id, task_text, task_date, task_time, due_at, next_remind_at)
+            SELECT %s, %s, %s, %s, m.due_at, task_next_reminder(m.due_at, m.mask, ARRAY[]::int[], {OPTIONS_SQL})
+            FROM (
+                SELECT (%s::date + %s::time) AT TIME ZONE COALESCE(u.timezone, %s) AS due_at,
+                       COALESCE(u.reminder_mask, %s) AS mask
+                FROM (SELECT %s::bigint AS user_id) AS v
+                LEFT JOIN users u ON u.user_id = v.user_id
+            ) AS m
             RETURNING id
-        ''', (user_id, task_text, task_date, task_time), return_result=True)
-        
+        ''', (user_id, task_text, task_date, task_time, task_date, task_time, TIMEZONE, DEFAULT_MASK, user_id),
+            return_result=True)
+
         if result:
             return result[0]
         return 0
-    
-    def get_user_tasks(self, user_id: int, date: str = None) -> List[Tuple]:
-        if not self.conn:
+
+    def add_tasks(self, user_id: int, tasks: List[Tuple[str, str, str]]) -> List[Tuple]:
+        """Добавить много задач [(текст, дата, время), ...] одним запросом в одной транзакции.
+
+        Возвращает (id, task_date, task_time, due_at) добавленных задач; при
+        ошибке не добавляется ни одна.
+        """
+        if not tasks:
+            return []
+
+        def insert(cursor):
+            return execute_values(cursor, f'''
+                INSERT INTO tasks (user_id, task_text, task_date, task_time, due_at, next_remind_at)
+                SELECT v.user_id, v.task_text, v.task_date, v.task_time, m.due_at,
+                       task_next_reminder(m.due_at, u.reminder_mask, ARRAY[]::int[], {OPTIONS_SQL})
+                FROM (VALUES %s) AS v(user_id, task_text, task_date, task_time)
+                JOIN users u ON u.user_id = v.user_id
+                CROSS JOIN LATERAL (SELECT (v.task_date + v.task_time) AT TIME ZONE u.timezone AS due_at) AS m
+                RETURNING id, task_date, task_time, due_at
+            ''', [(user_id, *task) for task in tasks],
+                template='(%s::bigint, %s, %s::date, %s::time)', page_size=len(tasks), fetch=True)
+
+        try:
+            return self._run(insert)
+        except Exception as e:
+            logger.error(f"Ошибка добавления задач: {e}")
             return []
-            
-        cursor = self.conn.cursor()
+
+    def iter_user_tasks(self, user_id: int, batch_size: int = 500):
+        """Все задачи пользователя для выгрузки, включая архив, пачками по batch_size строк.
+
+        Строки (id, task_text, task_date, task_time, due_at) читаются
+        серверным курсором, поэтому история любого размера не загружается в
+        память целиком.
+        """
+        rows = self._stream('''
+            SELECT id, task_text, task_date, task_time, due_at
+            FROM tasks
+            WHERE user_id = %s
+            UNION ALL
+            SELECT id, task_text, task_date, task_time, due_at
+            FROM tasks_history
+            WHERE user_id = %s
+            ORDER BY task_date, task_time, id
+        ''', (user_id, user_id), batch_size)
+
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    return
+                yield batch
+        finally:
+            rows.close()
+
+    def get_user_tasks(self, user_id: int, date: str = None) -> List[Tuple]:
         try:
             if date:
-                cursor.execute('''
-                    SELECT id, task_text, task_time FROM tasks 
-                    WHERE user_id = %s AND task_date = %s 
+                return self._fetchall('''
+                    SELECT id, task_text, task_time FROM tasks
+                    WHERE user_id = %s AND task_date = %s
                     ORDER BY task_time
                 ''', (user_id, date))
-            else:
-                cursor.execute('''
-                    SELECT id, task_text, task_date, task_time FROM tasks 
-                    WHERE user_id = %s 
-                    ORDER BY task_date, task_time
-                ''', (user_id,))
-            
-            tasks = cursor.fetchall()
-            cursor.close()
-            return tasks
-            
+            return self._fetchall('''
+                SELECT id, task_text, task_date, task_time FROM tasks
+                WHERE user_id = %s
+                ORDER BY task_date, task_time
+            ''', (user_id,))
+
         except Exception as e:
             logger.error(f"Ошибка получения задач: {e}")
             return []
-    
-    def delete_task(self, task_id: int, user_id: int):
-        self._execute_query('''
-            DELETE FROM tasks WHERE id = %s AND user_id = %s
-        ''', (task_id, user_id))
-    
-    def get_tasks_for_reminder(self, target_datetime: datetime) -> List[Tuple]:
-        if not self.conn:
+
+    def get_user_tasks_page(self, user_id: int, cursor: Tuple = None, backward: bool = False,
+                            limit: int = TASKS_PAGE_SIZE, since: datetime = None):
+        """Страница задач пользователя по ключу (task_date, task_time, id).
+
+        cursor - ключ последней задачи предыдущей страницы, а при backward -
+        первой задачи следующей. since - показывать задачи не раньше этого
+        момента. Возвращает (задачи, есть ли страница раньше, есть ли позже).
+        """
+        conditions = ['user_id = %s']
+        params = [user_id]
+        if since:
+            # Отдельное условие на task_date отсекает секции прошедших месяцев
+            conditions.append('task_date >= %s AND (task_date, task_time) >= (%s, %s)')
+            params += [since.date(), since.date(), since.time()]
+        where = ' AND '.join(conditions)
+        page_where, page_params = where, list(params)
+        if cursor:
+            page_where += f" AND (task_date, task_time, id) {'<' if backward else '>'} (%s, %s, %s)"
+            page_params += list(cursor)
+        order = 'DESC' if backward else 'ASC'
+
+        try:
+            tasks = self._fetchall(f'''
+                SELECT id, task_text, task_date, task_time FROM tasks
+                WHERE {page_where}
+                ORDER BY task_date {order}, task_time {order}, id {order}
+                LIMIT %s
+            ''', (*page_params, limit + 1))
+            # Есть ли задачи по другую сторону страницы: первая страница может
+            # открыться и по кнопке, а задачи за курсором - быть удалены
+            behind = False
+            if cursor and tasks:
+                task_id, _, task_date, task_time = tasks[0]
+                behind = self._fetchone(f'''
+                    SELECT 1 FROM tasks
+                    WHERE {where} AND (task_date, task_time, id) {'>' if backward else '<'} (%s, %s, %s)
+                    LIMIT 1
+                ''', (*params, task_date, task_time, task_id)) is not None
+        except Exception as e:
+            logger.error(f"Ошибка получения страницы задач: {e}")
+            return [], False, False
+
+        more = len(tasks) > limit
+        tasks = tasks[:limit]
+        if backward:
+            tasks.reverse()
+            return tasks, more, behind
+        return tasks, behind, more
+
+    def delete_task(self, task_id: int, user_id: int) -> bool:
+        """Удалить задачу, если она принадлежит пользователю; True, если удалена"""
+        return bool(self.delete_tasks(user_id, [task_id]))
+
+    def delete_tasks(self, user_id: int, task_ids: List[int]) -> List[Tuple]:
+        """Удалить несколько задач пользователя одним запросом.
+
+        Чужие и несуществующие id пропускаются; возвращает (id, task_date)
+        удалённых задач.
+        """
+        if not task_ids:
             return []
-            
-        cursor = self.conn.cursor()
         try:
-            target_date = target_datetime.strftime('%Y-%m-%d')
-            target_time = target_datetime.strftime('%H:%M')
-            
-            cursor.execute('''
-                SELECT t.id, t.user_id, t.task_text, t.task_date, t.task_time, u.first_name
+            return self._fetchall('''
+                DELETE FROM tasks
+                WHERE user_id = %s AND id = ANY(%s)
+                RETURNING id, task_date
+            ''', (user_id, list(task_ids)))
+        except Exception as e:
+            logger.error(f"Ошибка удаления задач: {e}")
+            return []
+
+    def delete_past_tasks(self, user_id: int, before: datetime) -> int:
+        """Удалить все задачи пользователя раньше before; вернуть их число"""
+        result = self._execute_query('''
+            DELETE FROM tasks
+            WHERE user_id = %s AND (task_date, task_time) < (%s, %s)
+        ''', (user_id, before.date(), before.time()))
+        return result or 0
+
+    def get_upcoming_tasks(self, since: datetime, until: datetime, user_id: int = None) -> List[Tuple]:
+        """Ещё не напомненные задачи с моментом в (since, until] для планировщика.
+
+        Строки (id, user_id, due_at, маска напоминаний); user_id - только задачи
+        этого пользователя.
+        """
+        try:
+            return self._fetchall(f'''
+                SELECT t.id, t.user_id, t.due_at, COALESCE(t.reminder_mask, u.reminder_mask)
                 FROM tasks t
                 JOIN users u ON t.user_id = u.user_id
-                WHERE t.task_date = %s AND t.task_time = %s AND t.reminded = FALSE
-            ''', (target_date, target_time))
-            
-            tasks = cursor.fetchall()
-            cursor.close()
-            return tasks
+                WHERE t.task_date BETWEEN %s AND %s
+                  AND t.due_at > %s AND t.due_at <= %s
+                  AND t.reminded = FALSE
+                  {'AND t.user_id = %s' if user_id else ''}
+            ''', (*_task_dates(since, until), since, until, *([user_id] if user_id else [])))
+        except Exception as e:
+            logger.error(f"Ошибка загрузки задач планировщика: {e}")
+            return []
+
+    def get_due_reminders(self, now: datetime) -> List[Tuple]:
+        """Все пары (задача, за сколько минут), которым пора напомнить, одним запросом.
+
+        Напоминание считается должным, если его момент уже наступил, а сама
+        задача ещё впереди, поэтому пропущенные во время простоя напоминания
+        тоже попадают в выборку. now - момент с часовым поясом; сравниваются
+        только моменты due_at, без разбора даты и времени.
+        """
+        try:
+            return self._fetchall(DUE_REMINDERS_QUERY, _due_reminders_params(now))
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний: {e}")
             return []
-    
-    def mark_as_reminded(self, task_ids: List[int]):
-        if self.conn and task_ids:
-            cursor = self.conn.cursor()
+
+    def claim_due_reminders(self, now: datetime) -> List[Tuple]:
+        """Забрать должные напоминания на отправку; строки как у get_due_reminders.
+
+        Строки блокируются FOR UPDATE SKIP LOCKED и в той же транзакции
+        отмечаются доставленными, поэтому несколько экземпляров бота делят
+        напоминания между собой и каждое забирает ровно один. Если отправить
+        не удалось, напоминание возвращают release_reminders.
+        """
+        def claim(cursor):
+            cursor.execute(DUE_REMINDERS_QUERY + ' FOR UPDATE OF t SKIP LOCKED', _due_reminders_params(now))
+            rows = cursor.fetchall()
+            claimed = {}
+            for row in rows:
+                claimed.setdefault(row[0], (row[-1], []))[1].append(row[-2])
+            # Задача напомнена, когда доставлено последнее (самое близкое к ней) напоминание
+            _mark_reminders(cursor, [
+                (task_id, task_offsets, offsets_of(mask)[0] in task_offsets, mask)
+                for task_id, (mask, task_offsets) in claimed.items()
+            ])
+            return rows
+
+        try:
+            return self._run(claim)
+        except Exception as e:
+            logger.error(f"Ошибка получения напоминаний: {e}")
+            return []
+
+    def release_reminders(self, released: List[Tuple[int, List[int]]]):
+        """Вернуть неотправленные напоминания: [(id задачи, [минуты]), ...]"""
+        if released:
+            def update(cursor):
+                execute_values(cursor, f'''
+                    UPDATE tasks AS t
+                    SET reminded_offsets = ARRAY(
+                            SELECT unnest(t.reminded_offsets) EXCEPT SELECT unnest(v.offsets)
+                        ),
+                        reminded = FALSE,
+                        next_remind_at = task_next_reminder(
+                            t.due_at, COALESCE(t.reminder_mask, u.reminder_mask),
+                            ARRAY(SELECT unnest(t.reminded_offsets) EXCEPT SELECT unnest(v.offsets)),
+                            {OPTIONS_SQL}
+                        )
+                    FROM (VALUES %s) AS v(id, offsets), users u
+                    WHERE t.id = v.id AND u.user_id = t.user_id
+                ''', released, template='(%s, %s::int[])')
+
             try:
-                placeholders = ','.join(['%s'] * len(task_ids))
-                cursor.execute(f'''
-                    UPDATE tasks SET reminded = TRUE 
-                    WHERE id IN ({placeholders})
-                ''', task_ids)
-                self.conn.commit()
-                cursor.close()
+                self._run(update)
             except Exception as e:
-                logger.error(f"Ошибка отметки напоминаний: {e}")
-                self.conn.rollback()
-    
+                logger.error(f"Ошибка возврата напоминаний: {e}")
+
+    def mark_as_reminded(self, task_ids: List[int]):
+        if task_ids:
+            result = self._execute_query('''
+                UPDATE tasks SET reminded = TRUE
+                WHERE id = ANY(%s)
+            ''', (list(task_ids),))
+            if result is None:
+                logger.error("Ошибка отметки напоминаний")
+
+    def claim_job_run(self, job: str, run_key: str, owner: str, lease: int = JOB_LEASE) -> Optional[Tuple]:
+        """Занять запуск периодической задачи; None, если его занял другой экземпляр.
+
+        Незавершённый запуск, который не отмечался дольше lease секунд,
+        забирается себе. Возвращает (progress,): докуда дошёл прошлый
+        владелец, или (None,) для нового запуска.
+        """
+        return self._execute_query('''
+            INSERT INTO job_runs (job, run_key, claimed_by, heartbeat_at)
+            VALUES (%s, %s, %s, now())
+            ON CONFLICT (job, run_key) DO UPDATE
+            SET claimed_by = EXCLUDED.claimed_by, claimed_at = now(), heartbeat_at = now()
+            WHERE job_runs.completed_at IS NULL
+              AND job_runs.heartbeat_at < now() - make_interval(secs => %s)
+            RETURNING progress
+        ''', (job, run_key, owner, lease), return_result=True)
+
+    def update_job_run(self, job: str, run_key: str, owner: str, progress: str = None,
+                       completed: bool = False) -> bool:
+        """Отметить ход запуска (и его завершение); False, если запуск забрал другой экземпляр"""
+        result = self._execute_query('''
+            UPDATE job_runs
+            SET progress = COALESCE(%s, progress), heartbeat_at = now(),
+                completed_at = CASE WHEN %s THEN now() END
+            WHERE job = %s AND run_key = %s AND claimed_by = %s
+        ''', (progress, completed, job, run_key, owner))
+        return bool(result)
+
+    def maintain_task_partitions(self, today: date, months_ahead: int = TASK_PARTITIONS_AHEAD,
+                                 keep_months: int = TASK_RETENTION_MONTHS) -> Optional[Tuple[int, int]]:
+        """Создать секции tasks на months_ahead месяцев вперёд и убрать в архив старые.
+
+        Задачи секций месяцев раньше keep_months последних прошедших
+        копируются в tasks_history, пока секция ещё подключена, затем секция
+        отключается от tasks и удаляется - каждый шаг в своей короткой
+        транзакции: отключение берёт ACCESS EXCLUSIVE на tasks, и копирование
+        под ним остановило бы все запросы к задачам. Туда же уходят старые
+        задачи из секции по умолчанию. Прерванный перенос доделывается при
+        следующем запуске, уже скопированные задачи не дублируются.
+        Возвращает (создано секций, перенесено задач в архив), None при ошибке.
+        """
+        month = today.replace(day=1)
+        cutoff = _add_months(month, -keep_months)
+
+        def create(cursor):
+            created = 0
+            for offset in range(months_ahead + 1):
+                cursor.execute('SELECT create_task_partition(%s)', (_add_months(month, offset),))
+                created += cursor.fetchone()[0]
+            return created
+
+        def archive_default(cursor):
+            cursor.execute('''
+                WITH moved AS (
+                    DELETE FROM tasks_default WHERE task_date < %s
+                    RETURNING id, user_id, task_text, task_date, task_time, due_at
+                )
+                INSERT INTO tasks_history (id, user_id, task_text, task_date, task_time, due_at)
+                SELECT * FROM moved
+            ''', (cutoff,))
+            return cursor.rowcount
+
+        def copy_partition(name):
+            def copy(cursor):
+                cursor.execute(sql.SQL('''
+                    INSERT INTO tasks_history (id, user_id, task_text, task_date, task_time, due_at)
+                    SELECT p.id, p.user_id, p.task_text, p.task_date, p.task_time, p.due_at
+                    FROM {} p
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM tasks_history h
+                        WHERE h.task_date = p.task_date AND h.id = p.id
+                    )
+                ''').format(sql.Identifier(name)))
+                return cursor.rowcount
+            return copy
+
+        def detach_partition(name):
+            def detach(cursor):
+                # Не стоять в очереди за долгими запросами: за ожидающим ACCESS
+                # EXCLUSIVE встали бы все остальные. Не вышло - следующий запуск
+                cursor.execute("SET LOCAL lock_timeout = '5s'")
+                cursor.execute(sql.SQL('ALTER TABLE tasks DETACH PARTITION {}').format(sql.Identifier(name)))
+            return detach
+
+        def drop_partition(name):
+            def drop(cursor):
+                cursor.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier(name)))
+            return drop
+
+        try:
+            created = self._run(create)
+            # Вместе с подключёнными - секции, отключённые прерванным переносом
+            partitions = self._fetchall('''
+                SELECT c.relname, i.inhrelid IS NOT NULL
+                FROM pg_class c
+                LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'tasks'::regclass
+                WHERE c.relkind = 'r' AND c.relname ~ '^tasks_[0-9]{6}$' AND pg_table_is_visible(c.oid)
+                ORDER BY c.relname
+            ''')
+            archived = self._run(archive_default)
+            for name, attached in partitions:
+                if datetime.strptime(name[len('tasks_'):], '%Y%m').date() >= cutoff:
+                    continue
+                archived += self._run(copy_partition(name))
+                if attached:
+                    self._run(detach_partition(name))
+                    # Задачи, изменённые между копированием и отключением
+                    archived += self._run(copy_partition(name))
+                self._run(drop_partition(name))
+            return created, archived
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания секций задач: {e}")
+            return None
+
     # === МЕТОДЫ ДЛЯ НЕДЕЛЬНЫХ ЗАДАЧ ===
-    
+
     def add_weekly_task(self, user_id: int, task_text: str, week_start: str) -> int:
         result = self._execute_query('''
             INSERT INTO weekly_tasks (user_id, task_text, week_start)
             VALUES (%s, %s, %s)
             RETURNING id
         ''', (user_id, task_text, week_start), return_result=True)
-        
+
         if result:
             return result[0]
         return 0
-    
+
     def get_weekly_tasks(self, user_id: int, week_start: str) -> List[Tuple]:
-        if not self.conn:
-            return []
-            
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('''
-                SELECT id, task_text, completed 
-                FROM weekly_tasks 
-                WHERE user_id = %s AND week_start = %s 
+            return self._fetchall('''
+                SELECT id, task_text, completed
+                FROM weekly_tasks
+                WHERE user_id = %s AND week_start = %s
                 ORDER BY created_at
             ''', (user_id, week_start))
-            
-            tasks = cursor.fetchall()
-            cursor.close()
-            return tasks
         except Exception as e:
             logger.error(f"Ошибка получения недельных задач: {e}")
             return []
-    
-    def complete_weekly_task(self, task_id: int, user_id: int):
-        self._execute_query('''
-            UPDATE weekly_tasks 
-            SET completed = TRUE 
-            WHERE id = %s AND user_id = %s
-        ''', (task_id, user_id))
-    
-    def delete_weekly_task(self, task_id: int, user_id: int):
-        self._execute_query('''
-            DELETE FROM weekly_tasks 
+
+    def complete_weekly_task(self, task_id: int, user_id: int) -> Optional[str]:
+        """Отметить задачу пользователя выполненной; вернуть её неделю или None"""
+        result = self._execute_query('''
+            UPDATE weekly_tasks
+            SET completed = TRUE
             WHERE id = %s AND user_id = %s
-        ''', (task_id, user_id))
-    
-    def move_uncompleted_weekly_tasks(self, from_week: str, to_week: str):
-        self._execute_query('''
-            UPDATE weekly_tasks 
-            SET week_start = %s, completed = FALSE
-            WHERE week_start = %s AND completed = FALSE
-        ''', (to_week, from_week))
-    
-    def get_users_for_weekly_reminder(self):
-        if not self.conn:
+            RETURNING week_start
+        ''', (task_id, user_id), return_result=True)
+        return result[0] if result else None
+
+    def delete_weekly_task(self, task_id: int, user_id: int) -> bool:
+        """Удалить недельную задачу, если она принадлежит пользователю; True, если удалена"""
+        return bool(self.delete_weekly_tasks(user_id, [task_id]))
+
+    def delete_weekly_tasks(self, user_id: int, task_ids: List[int]) -> List[Tuple]:
+        """Удалить несколько недельных задач пользователя; вернуть (id, week_start) удалённых"""
+        if not task_ids:
             return []
-            
-        cursor = self.conn.cursor()
         try:
+            return self._fetchall('''
+                DELETE FROM weekly_tasks
+                WHERE user_id = %s AND id = ANY(%s)
+                RETURNING id, week_start
+            ''', (user_id, list(task_ids)))
+        except Exception as e:
+            logger.error(f"Ошибка удаления недельных задач: {e}")
+            return []
+
+    def roll_over_weekly_tasks(self, to_week: str, batch_size: int = 1000) -> Optional[int]:
+        """Перенести на неделю to_week все невыполненные задачи прошлых недель.
+
+        Переносит за один проход сколько угодно пропущенных недель, пачками по
+        batch_size строк в отдельных транзакциях, чтобы не держать долгих
+        блокировок. Последняя перенесённая неделя запоминается в app_state:
+        повторный запуск ничего не делает, а прерванный - доделывает.
+        Возвращает число перенесённых задач, None при ошибке.
+        """
+        def move_batch(cursor):
             cursor.execute('''
-                SELECT DISTINCT user_id 
-                FROM weekly_tasks 
-                WHERE completed = FALSE
-            ''')
-            
-            users = [row[0] for row in cursor.fetchall()]
-            cursor.close()
-            return users
+                UPDATE weekly_tasks SET week_start = %s
+                WHERE id IN (
+                    SELECT id FROM weekly_tasks
+                    WHERE completed = FALSE AND week_start < %s
+                    LIMIT %s
+                    FOR UPDATE
+                )
+            ''', (to_week, to_week, batch_size))
+            return cursor.rowcount
+
+        try:
+            watermark = self._fetchone('''
+                SELECT value FROM app_state WHERE key = %s
+            ''', (LAST_ROLLED_WEEK,))
+            if watermark and watermark[0] >= to_week:
+                return 0
+
+            moved = 0
+            while True:
+                count = self._run(move_batch)
+                if not count:
+                    break
+                moved += count
+
+            self._execute_query('''
+                INSERT INTO app_state (key, value) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE
+                SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+                WHERE app_state.value < EXCLUDED.value
+            ''', (LAST_ROLLED_WEEK, to_week))
+            return moved
+        except Exception as e:
+            logger.error(f"Ошибка переноса недельных задач: {e}")
+            return None
+
+    def iter_weekly_tasks_by_user(self, week_start: str, after_user_id: int = 0, batch_size: int = 500):
+        """Недельные задачи пользователей с невыполненными задачами на неделе.
+
+        Выдаёт (user_id, [(id, task_text, completed), ...]) по одному
+        пользователю в порядке user_id, начиная после after_user_id. Задачи
+        читаются пачками по batch_size пользователей, каждая - отдельным
+        коротким запросом от последнего user_id прошлой пачки: пока
+        потребитель ждёт (очередь отправки), ни соединение, ни транзакция не
+        держатся, а память не растёт с числом пользователей.
+        """
+        while True:
+            rows = self._fetchall('''
+                SELECT w.user_id, w.id, w.task_text, w.completed
+                FROM weekly_tasks w
+                WHERE w.week_start = %s
+                  AND w.user_id IN (
+                      SELECT DISTINCT o.user_id
+                      FROM weekly_tasks o
+                      WHERE o.week_start = %s AND o.completed = FALSE AND o.user_id > %s
+                      ORDER BY o.user_id
+                      LIMIT %s
+                  )
+                ORDER BY w.user_id, w.created_at
+            ''', (week_start, week_start, after_user_id, batch_size))
+
+            users = 0
+            for user_id, user_rows in itertools.groupby(rows, key=lambda row: row[0]):
+                users += 1
+                after_user_id = user_id
+                yield user_id, [row[1:] for row in user_rows]
+            if users < batch_size:
+                return
+
+    # === МЕТОДЫ ДЛЯ ПОВТОРЯЮЩИХСЯ ЗАДАЧ ===
+
+    def add_recurring_task(self, user_id: int, task_text: str, rrule: str, dtstart: datetime) -> int:
+        result = self._execute_query('''
+            INSERT INTO recurring_tasks (user_id, task_text, rrule, dtstart)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        ''', (user_id, task_text, rrule, dtstart), return_result=True)
+
+        if result:
+            return result[0]
+        return 0
+
+    def get_recurring_tasks(self, user_id: int) -> List[Tuple]:
+        """Серии пользователя: (id, task_text, rrule, dtstart)"""
+        try:
+            return self._fetchall('''
+                SELECT id, task_text, rrule, dtstart
+                FROM recurring_tasks
+                WHERE user_id = %s
+                ORDER BY id
+            ''', (user_id,))
+        except Exception as e:
+            logger.error(f"Ошибка получения повторяющихся задач: {e}")
+            return []
+
+    def get_all_recurring_tasks(self, user_id: int = None) -> List[Tuple]:
+        """Серии для планировщика: (id, user_id, task_text, rrule, dtstart, timezone, first_name, маска напоминаний).
+
+        Все серии или только серии пользователя user_id.
+        """
+        try:
+            return self._fetchall(f'''
+                SELECT r.id, r.user_id, r.task_text, r.rrule, r.dtstart, u.timezone, u.first_name, u.reminder_mask
+                FROM recurring_tasks r
+                JOIN users u ON r.user_id = u.user_id
+                {'WHERE r.user_id = %s' if user_id else ''}
+            ''', (user_id,) if user_id else None)
         except Exception as e:
-            logger.error(f"Ошибка получения пользователей: {e}")
+            logger.error(f"Ошибка получения повторяющихся задач: {e}")
             return []
+
+    def delete_recurring_task(self, series_id: int, user_id: int) -> bool:
+        """Удалить серию, если она принадлежит пользователю; True, если удалена"""
+        result = self._execute_query('''
+            DELETE FROM recurring_tasks WHERE id = %s AND user_id = %s
+        ''', (series_id, user_id))
+        return bool(result)
+
+    def claim_recurring_reminders(self, candidates: List[Tuple[int, int, datetime]]) -> List[Tuple]:
+        """Забрать напоминания о повторениях: [(id серии, минуты, момент повторения), ...].
+
+        Возвращает только те, о которых ещё не напоминали: отметка в
+        recurring_deliveries сдвигается вперёд атомарно, поэтому при
+        нескольких экземплярах бота каждое напоминание забирает один.
+        """
+        if not candidates:
+            return []
+
+        def claim(cursor):
+            return execute_values(cursor, '''
+                INSERT INTO recurring_deliveries AS d (series_id, offset_min, occurrence_at)
+                VALUES %s
+                ON CONFLICT (series_id, offset_min) DO UPDATE
+                SET occurrence_at = EXCLUDED.occurrence_at
+                WHERE d.occurrence_at < EXCLUDED.occurrence_at
+                RETURNING d.series_id, d.offset_min, d.occurrence_at
+            ''', candidates, fetch=True)
+
+        try:
+            return self._run(claim)
+        except Exception as e:
+            logger.error(f"Ошибка получения напоминаний: {e}")
+            return []
+
+    def release_recurring_reminders(self, released: List[Tuple[int, int, datetime]]):
+        """Вернуть неотправленные напоминания о повторениях.
+
+        Отметка просто удаляется: прошедшие повторения в выборку напоминаний
+        всё равно не попадают.
+        """
+        if released:
+            def delete(cursor):
+                execute_values(cursor, '''
+                    DELETE FROM recurring_deliveries AS d
+                    USING (VALUES %s) AS v(series_id, offset_min, occurrence_at)
+                    WHERE d.series_id = v.series_id
+                      AND d.offset_min = v.offset_min
+                      AND d.occurrence_at = v.occurrence_at
+                ''', released, template='(%s, %s, %s::timestamptz)')
+
+            try:
+                self._run(delete)
+            except Exception as e:
+                logger.error(f"Ошибка возврата напоминаний: {e}")
+
+    # === СОСТОЯНИЕ БОТА ===
+
+    def get_persistent_state(self, kind: str) -> List[Tuple]:
+        """Все сохранённые записи вида kind: [(key, data), ...]"""
+        try:
+            return self._fetchall('''
+                SELECT key, data FROM bot_persistence WHERE kind = %s
+            ''', (kind,))
+        except Exception as e:
+            logger.error(f"Ошибка загрузки состояния бота: {e}")
+            return []
+
+    def save_persistent_state(self, upserts: List[Tuple[str, str, str]], deletes: List[Tuple[str, str]]):
+        """Записать пачку изменений одной транзакцией.
+
+        upserts - [(kind, key, data в JSON)], deletes - [(kind, key)].
+        Ошибка пробрасывается, чтобы вызывающий мог повторить запись.
+        """
+        def save(cursor):
+            if upserts:
+                execute_values(cursor, '''
+                    INSERT INTO bot_persistence (kind, key, data)
+                    VALUES %s
+                    ON CONFLICT (kind, key)
+                    DO UPDATE SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+                ''', upserts, template='(%s, %s, %s::jsonb)')
+            if deletes:
+                cursor.execute('''
+                    DELETE FROM bot_persistence
+                    WHERE (kind, key) IN (SELECT * FROM unnest(%s::text[], %s::text[]))
+                ''', ([kind for kind, _ in deletes], [key for _, key in deletes]))
+
+        self._run(save)
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к Database для обработчиков бота.
+
+    Запросы выполняются в пуле потоков размером с пул соединений, поэтому
+    медленный запрос одного пользователя не блокирует event loop. Публичные
+    методы Database доступны под теми же именами как корутины; списки задач
+    читаются через кэш, который сбрасывают методы изменения задач.
+    """
+
+    def __init__(self, db: Optional[Database] = None, cache: Optional[TaskCache] = None):
+        self.db = db or Database()
+        self.cache = cache or TaskCache()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.db.maxconn,
+            thread_name_prefix='db'
+        )
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить синхронную функцию в потоке пула базы.
+
+        Время вызова вместе с ожиданием свободного потока идёт в
+        metrics.DB_SECONDS с именем метода.
+        """
+        return await self._timed(getattr(func, '__name__', 'call'), func, *args, **kwargs)
+
+    async def _timed(self, name: str, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - started, name)
+
+    async def iterate(self, iterator):
+        """Асинхронно перебрать синхронный итератор Database (потоковую выборку)"""
+        # В metrics.DB_SECONDS - под именем метода, породившего итератор
+        name = getattr(iterator, '__name__', 'iterate')
+        done = object()
+        try:
+            while True:
+                item = await self._timed(name, next, iterator, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            # Закрытие генератора возвращает его соединение в пул
+            await self._timed(name, iterator.close)
+
+    async def iter_weekly_tasks_by_user(self, week_start: str, after_user_id: int = 0):
+        async for item in self.iterate(self.db.iter_weekly_tasks_by_user(week_start, after_user_id)):
+            yield item
+
+    async def iter_user_tasks(self, user_id: int):
+        async for batch in self.iterate(self.db.iter_user_tasks(user_id)):
+            yield batch
+
+    # === КЭШИРУЕМЫЕ СПИСКИ ===
+
+    async def _cached(self, user_id: int, view: str, key, func, *args):
+        """Список из кэша, а при промахе - из базы с сохранением в кэш"""
+        found, value = self.cache.get(user_id, view, key)
+        if found:
+            return value
+
+        generation = self.cache.generation(user_id)
+        value = await self.run(func, *args)
+        self.cache.put(user_id, view, key, value, generation)
+        return value
+
+    async def get_user_tasks(self, user_id: int, date: str = None) -> List[Tuple]:
+        if date:
+            return await self._cached(user_id, VIEW_DAY, str(date), self.db.get_user_tasks, user_id, date)
+        return await self._cached(user_id, VIEW_ALL, None, self.db.get_user_tasks, user_id)
+
+    async def get_user_tasks_page(self, user_id: int, cursor: Tuple = None, backward: bool = False,
+                                  limit: int = TASKS_PAGE_SIZE, since: datetime = None):
+        # Ключ кэша не учитывает since: страница может показывать только что
+        # прошедшие задачи не дольше TTL кэша
+        return await self._cached(
+            user_id, VIEW_ALL, (cursor, backward, limit, since is not None),
+            self.db.get_user_tasks_page, user_id, cursor, backward, limit, since
+        )
+
+    async def get_weekly_tasks(self, user_id: int, week_start: str) -> List[Tuple]:
+        return await self._cached(
+            user_id, VIEW_WEEK, str(week_start), self.db.get_weekly_tasks, user_id, week_start
+        )
+
+    async def get_user_timezone(self, user_id: int) -> str:
+        return await self._cached(user_id, VIEW_SETTINGS, 'timezone', self.db.get_user_timezone, user_id)
+
+    async def get_reminder_mask(self, user_id: int) -> int:
+        return await self._cached(user_id, VIEW_SETTINGS, 'reminder_mask', self.db.get_reminder_mask, user_id)
+
+    async def set_reminder_mask(self, user_id: int, mask: int) -> bool:
+        updated = await self.run(self.db.set_reminder_mask, user_id, mask)
+        self.cache.invalidate(user_id, VIEW_SETTINGS, 'reminder_mask')
+        return updated
+
+    async def set_user_timezone(self, user_id: int, timezone: str) -> bool:
+        updated = await self.run(self.db.set_user_timezone, user_id, timezone)
+        self.cache.invalidate(user_id, VIEW_SETTINGS, 'timezone')
+        return updated
+
+    async def add_task(self, user_id: int, task_text: str, task_date: str, task_time: str) -> int:
+        task_id = await self.run(self.db.add_task, user_id, task_text, task_date, task_time)
+        self.cache.invalidate(user_id, VIEW_DAY, str(task_date))
+        self.cache.invalidate(user_id, VIEW_ALL, any_key=True)
+        return task_id
+
+    async def add_tasks(self, user_id: int, tasks: List[Tuple[str, str, str]]) -> List[Tuple]:
+        added = await self.run(self.db.add_tasks, user_id, tasks)
+        for task_date in {task_date for _, task_date, _, _ in added}:
+            self.cache.invalidate(user_id, VIEW_DAY, str(task_date))
+        if added:
+            self.cache.invalidate(user_id, VIEW_ALL, any_key=True)
+        return added
+
+    async def delete_task(self, task_id: int, user_id: int) -> bool:
+        return bool(await self.delete_tasks(user_id, [task_id]))
+
+    async def delete_tasks(self, user_id: int, task_ids: List[int]) -> List[Tuple]:
+        deleted = await self.run(self.db.delete_tasks, user_id, task_ids)
+        for task_date in {task_date for _, task_date in deleted}:
+            self.cache.invalidate(user_id, VIEW_DAY, str(task_date))
+        if deleted:
+            self.cache.invalidate(user_id, VIEW_ALL, any_key=True)
+        return deleted
+
+    async def delete_past_tasks(self, user_id: int, before: datetime) -> int:
+        count = await self.run(self.db.delete_past_tasks, user_id, before)
+        if count:
+            self.cache.invalidate(user_id, VIEW_DAY, any_key=True)
+            self.cache.invalidate(user_id, VIEW_ALL, any_key=True)
+        return count
+
+    async def add_weekly_task(self, user_id: int, task_text: str, week_start: str) -> int:
+        task_id = await self.run(self.db.add_weekly_task, user_id, task_text, week_start)
+        self.cache.invalidate(user_id, VIEW_WEEK, str(week_start))
+        return task_id
+
+    async def complete_weekly_task(self, task_id: int, user_id: int) -> Optional[str]:
+        week_start = await self.run(self.db.complete_weekly_task, task_id, user_id)
+        if week_start:
+            self.cache.invalidate(user_id, VIEW_WEEK, str(week_start))
+        return week_start
+
+    async def delete_weekly_task(self, task_id: int, user_id: int) -> bool:
+        return bool(await self.delete_weekly_tasks(user_id, [task_id]))
+
+    async def delete_weekly_tasks(self, user_id: int, task_ids: List[int]) -> List[Tuple]:
+        deleted = await self.run(self.db.delete_weekly_tasks, user_id, task_ids)
+        for week_start in {week_start for _, week_start in deleted}:
+            self.cache.invalidate(user_id, VIEW_WEEK, str(week_start))
+        return deleted
+
+    async def get_recurring_tasks(self, user_id: int) -> List[Tuple]:
+        return await self._cached(user_id, VIEW_RECURRING, None, self.db.get_recurring_tasks, user_id)
+
+    async def add_recurring_task(self, user_id: int, task_text: str, rrule: str, dtstart: datetime) -> int:
+        series_id = await self.run(self.db.add_recurring_task, user_id, task_text, rrule, dtstart)
+        self.cache.invalidate(user_id, VIEW_RECURRING)
+        return series_id
+
+    async def delete_recurring_task(self, series_id: int, user_id: int) -> bool:
+        deleted = await self.run(self.db.delete_recurring_task, series_id, user_id)
+        if deleted:
+            self.cache.invalidate(user_id, VIEW_RECURRING)
+        return deleted
+
+    async def maintain_task_partitions(self, today: date) -> Optional[Tuple[int, int]]:
+        result = await self.run(self.db.maintain_task_partitions, today)
+        if result and result[1]:
+            # Из списков пропадают задачи, ушедшие в архив
+            self.cache.invalidate_view(VIEW_DAY)
+            self.cache.invalidate_view(VIEW_ALL)
+        return result
+
+    async def roll_over_weekly_tasks(self, to_week: str) -> Optional[int]:
+        moved = await self.run(self.db.roll_over_weekly_tasks, to_week)
+        if moved:
+            self.cache.invalidate_view(VIEW_WEEK)
+        return moved
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        # Кэшируем обёртку, чтобы не создавать её на каждый вызов
+        setattr(self, name, method)
+        return method
+
+    def close(self):
+        """Дождаться выполняющихся запросов и закрыть пул"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,134 @@
+"""Клавиатуры бота: готовые reply-клавиатуры меню и inline-кнопки списков задач.
+
+Reply-клавиатуры не меняются, поэтому собираются один раз при импорте
+вместе со своим JSON. callback_data inline-кнопок - "<префикс>:<данные>"
+не длиннее 64 байт; по префиксу PlannerBot.callback_router выбирает обработчик.
+"""
+import functools
+from datetime import date, timedelta
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+from config import REMINDER_OPTIONS
+from reminders import format_offset
+
+# Префиксы callback_data
+PAGE = 'tp'             # листание списка: tp:<n|p>:<ключ задачи>
+DELETE_TASK = 'td'      # удаление задачи: td:<id>:<вид списка>
+COMPLETE_WEEKLY = 'wc'  # выполнение недельной задачи: wc:<id>
+REMINDER_USER = 'ru'    # смещение напоминаний пользователя: ru:<минуты>
+REMINDER_TASK = 'rt'    # смещение напоминаний задачи: rt:<id>:<минуты|default>
+
+# Значение в rt:<id>:... - вернуть задаче напоминания пользователя
+REMINDER_DEFAULT = 'default'
+
+# Виды списков, которые перерисовываются на месте после удаления;
+# страница списка - 'p:<ключ задачи перед первой на странице>'
+VIEW_TODAY = 'd'
+VIEW_TOMORROW = 'm'
+VIEW_DELETE = 'x'
+VIEW_PAGE = 'p'
+
+BUTTON_TEXT_LENGTH = 28
+
+class PrebuiltKeyboard(ReplyKeyboardMarkup):
+    """Reply-клавиатура, сериализованная один раз.
+
+    PTB превращает reply_markup в словарь через to_dict() при каждой отправке,
+    заново обходя все кнопки; здесь словарь и JSON готовы заранее. Объект
+    неизменяемый (как и любой TelegramObject), поэтому его можно отдавать
+    во все ответы.
+    """
+
+    __slots__ = ('_prebuilt_dict', '_prebuilt_json')
+
+    def __init__(self, keyboard):
+        super().__init__(keyboard, resize_keyboard=True)
+        # TelegramObject заморожен после __init__ - служебные поля в обход __setattr__
+        object.__setattr__(self, '_prebuilt_dict', super().to_dict())
+        object.__setattr__(self, '_prebuilt_json', super().to_json())
+
+    def to_dict(self, recursive: bool = True):
+        return self._prebuilt_dict
+
+    def to_json(self, *args, **kwargs):
+        return self._prebuilt_json
+
+MAIN_KEYBOARD = PrebuiltKeyboard([
+    ["📝 Добавить задачу", "📋 Мои задачи"],
+    ["🗑 Удалить задачу", "📅 Сегодня"],
+    ["📆 Завтра", "🗓 Недельные задачи"],
+    ["⚙️ Напоминания", "ℹ️ Помощь"]
+])
+CANCEL_KEYBOARD = PrebuiltKeyboard([["❌ Отмена"]])
+QUICK_DATES_KEYBOARD = PrebuiltKeyboard([
+    ["📅 Сегодня", "📆 Завтра"],
+    ["🗓 Послезавтра", "❌ Отмена"]
+])
+TIME_KEYBOARD = PrebuiltKeyboard([
+    ["⏰ Сейчас", "🕐 Через 1 час"],
+    ["🕑 Через 2 часа", "❌ Отмена"]
+])
+BACK_KEYBOARD = PrebuiltKeyboard([["⬅️ Назад"]])
+WEEKLY_KEYBOARD = PrebuiltKeyboard([
+    ["📋 Мои недельные задачи", "➕ Добавить недельную задачу"],
+    ["⬅️ Назад"]
+])
+
+@functools.lru_cache(maxsize=16)
+def week_choice_keyboard(today: date) -> PrebuiltKeyboard:
+    """Выбор текущей или следующей недели; одна клавиатура на день"""
+    current_week_start = today - timedelta(days=today.weekday())
+    next_week_start = current_week_start + timedelta(days=7)
+    return PrebuiltKeyboard([
+        [f"📅 Текущая неделя ({current_week_start.strftime('%d.%m')})"],
+        [f"📅 Следующая неделя ({next_week_start.strftime('%d.%m')})"],
+        ["❌ Отмена"]
+    ])
+
+def task_key(task_date, task_time, task_id) -> str:
+    """Ключ пагинации в callback_data: ГГГГММДД:ЧЧММСС:id"""
+    return f"{task_date.strftime('%Y%m%d')}:{task_time.strftime('%H%M%S')}:{task_id}"
+
+def page_view(first_task) -> str:
+    """Вид "страница, начиная с first_task": ключ сразу перед этой задачей"""
+    task_id, _, task_date, task_time = first_task
+    return f"{VIEW_PAGE}:{task_key(task_date, task_time, task_id - 1)}"
+
+def task_buttons(tasks, view: str) -> list:
+    """По кнопке удаления на задачу (id, текст, ...)"""
+    return [
+        [InlineKeyboardButton(f"🗑 {task[0]}: {_short(task[1])}", callback_data=f"{DELETE_TASK}:{task[0]}:{view}")]
+        for task in tasks
+    ]
+
+def weekly_buttons(tasks) -> list:
+    """По кнопке выполнения на невыполненную недельную задачу (id, текст, выполнена)"""
+    return [
+        [InlineKeyboardButton(f"✓ {_short(task_text)}", callback_data=f"{COMPLETE_WEEKLY}:{task_id}")]
+        for task_id, task_text, completed in tasks if not completed
+    ]
+
+def reminder_buttons(mask: int, prefix: str) -> list:
+    """Переключатели смещений напоминаний по возрастанию, по 4 в ряд.
+
+    prefix - "ru" для настроек пользователя или "rt:<id>" для задачи.
+    """
+    buttons = [
+        InlineKeyboardButton(
+            f"{'✅' if mask >> bit & 1 else '▫️'} {format_offset(minutes)}",
+            callback_data=f"{prefix}:{minutes}"
+        )
+        for bit, minutes in sorted(enumerate(REMINDER_OPTIONS), key=lambda option: option[1])
+    ]
+    rows = [buttons[i:i + 4] for i in range(0, len(buttons), 4)]
+    if prefix != REMINDER_USER:
+        rows.append([InlineKeyboardButton("↩️ Как в настройках", callback_data=f"{prefix}:{REMINDER_DEFAULT}")])
+    return rows
+
+def inline_markup(rows):
+    rows = [row for row in rows if row]
+    return InlineKeyboardMarkup(rows) if rows else None
+
+def _short(text):
+    return text if len(text) <= BUTTON_TEXT_LENGTH else text[:BUTTON_TEXT_LENGTH - 1] + '…'
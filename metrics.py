@@ -0,0 +1,209 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Счётчики, гистограммы и показатели живут в памяти процесса и отдаются по
+HTTP на /metrics (serve). Запись - несколько сложений под блокировкой,
+поэтому метрики включены всегда. Обновлять их можно из любого потока:
+ошибки базы считаются в потоках пула AsyncDatabase.
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм времени, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # значения меток -> значение
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _label_text(self, values, extra=''):
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            lines.extend(self._samples(label_values, value))
+        return lines
+
+    def _samples(self, label_values, value):
+        return [f"{self.name}{self._label_text(label_values)} {_number(value)}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+class Gauge(_Metric):
+    """Показатель; set_function - значение считается при каждом чтении /metrics"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels=()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def render(self) -> list:
+        if self._function is not None:
+            self.set(self._function())
+        return super().render()
+
+class Collected(_Metric):
+    """Метрика, значения которой при каждом чтении /metrics отдаёт collect():
+    {значения меток: значение}; для накоплений, которые и так ведутся в другом месте"""
+
+    def __init__(self, name: str, help: str, kind: str, labels, collect):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self._collect = collect
+
+    def render(self) -> list:
+        values = self._collect()
+        with self._lock:
+            self._values = dict(values)
+        return super().render()
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # Счётчики по корзинам (последняя - больше всех границ), сумма
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def _samples(self, label_values, state):
+        counts, total = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else _number(bound)
+            labels = self._label_text(label_values, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(label_values)} {_number(total)}")
+        lines.append(f"{self.name}_count{self._label_text(label_values)} {cumulative}")
+        return lines
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# === МЕТРИКИ БОТА ===
+
+HANDLER_SECONDS = Histogram('planner_handler_seconds', 'Время обработчика обновления', ['handler'])
+HANDLER_ERRORS = Counter('planner_handler_errors_total', 'Исключения в обработчиках', ['handler', 'error'])
+DB_SECONDS = Histogram('planner_db_call_seconds', 'Время вызова метода Database из бота', ['method'])
+DB_ERRORS = Counter('planner_db_errors_total', 'Ошибки запросов к базе', ['error'])
+REMINDER_LAG = Histogram(
+    'planner_reminder_lag_seconds', 'Отправка напоминания минус момент, на который оно запланировано',
+    buckets=LAG_BUCKETS
+)
+SEND_QUEUE_DEPTH = Gauge('planner_send_queue_depth', 'Сообщений в очереди отправки')
+TELEGRAM_ERRORS = Counter('planner_telegram_errors_total', 'Ошибки Telegram Bot API', ['error'])
+
+# Замеряемый сейчас обработчик: вызванные из него обработчики не замеряются
+_current_handler = contextvars.ContextVar('current_handler', default=None)
+
+def timed_handler(name: str, handler):
+    """Обработчик обновления с замером времени и подсчётом исключений.
+
+    Если обработчик вызван из другого (кнопка меню передаёт обновление
+    команде), время и ошибка считаются один раз - у внешнего.
+    """
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        if _current_handler.get() is not None:
+            return await handler(*args, **kwargs)
+        token = _current_handler.set(name)
+        started = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            if isinstance(e, TelegramError):
+                TELEGRAM_ERRORS.inc(type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+            _current_handler.reset(token)
+    return wrapper
+
+# === HTTP ===
+
+async def serve(host: str, port: int):
+    """Запустить HTTP-сервер /metrics в текущем event loop; вернуть asyncio.Server"""
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info(f"📈 Метрики на http://{host}:{port}/metrics")
+    return server
+
+async def _handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        # Заголовки запроса не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), 5)).strip():
+            pass
+        parts = request.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', render().encode()
+        else:
+            status, body = '404 Not Found', b'Not Found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
@@ -0,0 +1,380 @@
+"""Версионированные миграции схемы базы.
+
+Каждая миграция - (версия, описание, [SQL]). Применённые версии хранятся в
+таблице schema_version, поэтому при старте выполняются только новые.
+Сами запросы тоже идемпотентны (IF NOT EXISTS): базы, созданные до
+появления миграций, проходят их без ошибок. Настройки из config в запросы
+не подставляются: значения на момент написания миграции вписаны в текст,
+иначе одна и та же версия давала бы разные схемы при разных настройках.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки, чтобы два экземпляра бота не мигрировали одновременно
+MIGRATION_LOCK_KEY = 4242001
+
+MIGRATIONS = [
+    (1, "Базовые таблицы", [
+        # Таблица пользователей
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица ежедневных задач
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            task_text TEXT NOT NULL,
+            task_date DATE NOT NULL,
+            task_time TIME NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            reminded BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+        )
+        ''',
+        # Таблица недельных задач
+        '''
+        CREATE TABLE IF NOT EXISTS weekly_tasks (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            task_text TEXT NOT NULL,
+            week_start DATE NOT NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+        )
+        ''',
+    ]),
+    (2, "Доставка напоминаний по каждому смещению", [
+        # Какие напоминания (за сколько минут) уже доставлены;
+        # reminded = TRUE, когда доставлено последнее из них
+        '''
+        ALTER TABLE tasks
+        ADD COLUMN IF NOT EXISTS reminded_offsets INTEGER[] NOT NULL DEFAULT '{}'
+        ''',
+    ]),
+    (3, "Индексы для списков задач и планировщика", [
+        # Сегодня / Завтра / Мои задачи: фильтр по пользователю и дате, сортировка по времени
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_user_date_time_idx
+        ON tasks (user_id, task_date, task_time)
+        ''',
+        # Планировщик: только задачи, о которых ещё нужно напомнить
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_due_idx
+        ON tasks (task_date, task_time)
+        WHERE reminded = FALSE
+        ''',
+        # Недельные задачи пользователя в порядке добавления
+        '''
+        CREATE INDEX IF NOT EXISTS weekly_tasks_user_week_idx
+        ON weekly_tasks (user_id, week_start, created_at)
+        ''',
+        # Напоминание в 10:00 и перенос недели: только невыполненные задачи
+        '''
+        CREATE INDEX IF NOT EXISTS weekly_tasks_open_idx
+        ON weekly_tasks (week_start, user_id)
+        WHERE completed = FALSE
+        ''',
+    ]),
+    (4, "Индекс для постраничного списка задач", [
+        # Ключ пагинации (task_date, task_time, id) целиком в индексе;
+        # он же обслуживает списки на день, поэтому старый индекс не нужен
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_user_due_idx
+        ON tasks (user_id, task_date, task_time, id)
+        ''',
+        'DROP INDEX IF EXISTS tasks_user_date_time_idx',
+    ]),
+    (5, "Состояние диалогов бота", [
+        # user_data и состояния ConversationHandler (PostgresPersistence)
+        '''
+        CREATE TABLE IF NOT EXISTS bot_persistence (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data JSONB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, key)
+        )
+        ''',
+    ]),
+    (6, "Часовые пояса пользователей и момент задачи due_at", [
+        # config.TIMEZONE на момент миграции; новых пользователей Database.add_user
+        # создаёт с текущим config.TIMEZONE, так что default - только для старых строк
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS timezone TEXT NOT NULL DEFAULT 'Europe/Moscow'",
+        'ALTER TABLE tasks ADD COLUMN IF NOT EXISTS due_at TIMESTAMPTZ',
+        # Дата и время задачи - локальные для её владельца
+        '''
+        UPDATE tasks t
+        SET due_at = (t.task_date + t.task_time) AT TIME ZONE u.timezone
+        FROM users u
+        WHERE u.user_id = t.user_id AND t.due_at IS NULL
+        ''',
+        '''
+        UPDATE tasks
+        SET due_at = (task_date + task_time) AT TIME ZONE 'Europe/Moscow'
+        WHERE due_at IS NULL
+        ''',
+        'ALTER TABLE tasks ALTER COLUMN due_at SET NOT NULL',
+        # Планировщик сравнивает только моменты времени
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_due_at_idx
+        ON tasks (due_at)
+        WHERE reminded = FALSE
+        ''',
+        'DROP INDEX IF EXISTS tasks_due_idx',
+    ]),
+    (7, "Запуски периодических задач для нескольких экземпляров бота", [
+        # Напоминание в 10:00 и перенос недели выполняет тот экземпляр,
+        # который первым вставил строку своего запуска
+        '''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job TEXT NOT NULL,
+            run_key TEXT NOT NULL,
+            claimed_by TEXT NOT NULL,
+            claimed_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job, run_key)
+        )
+        ''',
+    ]),
+    (8, "Служебное состояние бота", [
+        # Например, неделя последнего переноса недельных задач
+        '''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (9, "Повторяющиеся задачи", [
+        # Одна строка на серию; повторения вычисляются из RRULE, а не хранятся.
+        # dtstart - локальные дата и время первого повторения владельца
+        '''
+        CREATE TABLE IF NOT EXISTS recurring_tasks (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            task_text TEXT NOT NULL,
+            rrule TEXT NOT NULL,
+            dtstart TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS recurring_tasks_user_idx
+        ON recurring_tasks (user_id, id)
+        ''',
+        # Последнее повторение, о котором напомнили за offset_min минут:
+        # не больше строки на смещение, сколько бы повторений ни прошло
+        '''
+        CREATE TABLE IF NOT EXISTS recurring_deliveries (
+            series_id INTEGER NOT NULL REFERENCES recurring_tasks (id) ON DELETE CASCADE,
+            offset_min INTEGER NOT NULL,
+            occurrence_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (series_id, offset_min)
+        )
+        ''',
+    ]),
+    (10, "Помесячные секции задач и архив прошедших задач", [
+        # Прошедшие месяцы переезжают сюда из секций tasks (Database.maintain_task_partitions)
+        '''
+        CREATE TABLE IF NOT EXISTS tasks_history (
+            id INTEGER NOT NULL,
+            user_id BIGINT NOT NULL,
+            task_text TEXT NOT NULL,
+            task_date DATE NOT NULL,
+            task_time TIME NOT NULL,
+            due_at TIMESTAMPTZ NOT NULL,
+            archived_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_history_user_idx
+        ON tasks_history (user_id, task_date)
+        ''',
+        # Секция tasks_ГГГГММ за месяц month. Задачи этого месяца могли попасть
+        # в секцию по умолчанию - они переносятся в новую до её подключения
+        '''
+        CREATE OR REPLACE FUNCTION create_task_partition(month DATE) RETURNS BOOLEAN AS $$
+        DECLARE
+            first_day DATE := date_trunc('month', month)::date;
+            next_month DATE := (date_trunc('month', month) + INTERVAL '1 month')::date;
+            partition_name TEXT := 'tasks_' || to_char(month, 'YYYYMM');
+        BEGIN
+            IF to_regclass(partition_name) IS NOT NULL THEN
+                RETURN FALSE;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE tasks INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM tasks_default WHERE task_date >= %L AND task_date < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                first_day, next_month, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE tasks ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, first_day, next_month
+            );
+            RETURN TRUE;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        # tasks пересоздаётся секционированной по task_date; id сохраняются,
+        # последовательность переходит к новой таблице
+        '''
+        DO $$
+        DECLARE
+            month DATE;
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'tasks'::regclass) THEN
+                RETURN;
+            END IF;
+
+            ALTER TABLE tasks RENAME TO tasks_unpartitioned;
+            ALTER INDEX tasks_pkey RENAME TO tasks_unpartitioned_pkey;
+            ALTER INDEX IF EXISTS tasks_user_due_idx RENAME TO tasks_unpartitioned_user_due_idx;
+            ALTER INDEX IF EXISTS tasks_due_at_idx RENAME TO tasks_unpartitioned_due_at_idx;
+
+            CREATE TABLE tasks (
+                id INTEGER NOT NULL DEFAULT nextval('tasks_id_seq'),
+                user_id BIGINT REFERENCES users (user_id) ON DELETE CASCADE,
+                task_text TEXT NOT NULL,
+                task_date DATE NOT NULL,
+                task_time TIME NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reminded BOOLEAN DEFAULT FALSE,
+                reminded_offsets INTEGER[] NOT NULL DEFAULT '{}',
+                due_at TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (id, task_date)
+            ) PARTITION BY RANGE (task_date);
+            CREATE TABLE tasks_default PARTITION OF tasks DEFAULT;
+
+            FOR month IN
+                SELECT m::date FROM generate_series(
+                    (SELECT date_trunc('month', LEAST(COALESCE(MIN(task_date), CURRENT_DATE), CURRENT_DATE))
+                     FROM tasks_unpartitioned),
+                    date_trunc('month', CURRENT_DATE) + INTERVAL '3 months',
+                    INTERVAL '1 month'
+                ) AS m
+            LOOP
+                PERFORM create_task_partition(month);
+            END LOOP;
+
+            INSERT INTO tasks (id, user_id, task_text, task_date, task_time, created_at,
+                               reminded, reminded_offsets, due_at)
+            SELECT id, user_id, task_text, task_date, task_time, created_at,
+                   reminded, reminded_offsets, due_at
+            FROM tasks_unpartitioned;
+
+            ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id;
+            DROP TABLE tasks_unpartitioned;
+        END
+        $$
+        ''',
+        # Индексы создаются на всех секциях, в том числе будущих
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_user_due_idx
+        ON tasks (user_id, task_date, task_time, id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_due_at_idx
+        ON tasks (due_at)
+        WHERE reminded = FALSE
+        ''',
+    ]),
+    (11, "Смещения напоминаний пользователя и задачи битовой маской", [
+        # Бит i - config.REMINDER_OPTIONS[i]; 15 - за 5, 15, 30 и 60 минут, как было у всех
+        'ALTER TABLE users ADD COLUMN IF NOT EXISTS reminder_mask INTEGER NOT NULL DEFAULT 15',
+        # NULL - как у пользователя
+        'ALTER TABLE tasks ADD COLUMN IF NOT EXISTS reminder_mask INTEGER',
+    ]),
+    (12, "Индекс архива по дате для повторного переноса секции", [
+        # Перенос секции в архив проверяет, какие её задачи уже скопированы
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_history_date_idx
+        ON tasks_history (task_date, id)
+        ''',
+    ]),
+    (13, "Момент ближайшего напоминания задачи next_remind_at", [
+        # Обход напоминаний берёт задачи по индексу next_remind_at <= now, а не
+        # все задачи на сутки вперёд (самое раннее смещение) с каждым смещением.
+        # NULL - напоминать больше нечего
+        'ALTER TABLE tasks ADD COLUMN IF NOT EXISTS next_remind_at TIMESTAMPTZ',
+        # Самое раннее из включённых в маске и ещё не доставленных напоминаний;
+        # options - config.REMINDER_OPTIONS, бит i маски - options[i]
+        '''
+        CREATE OR REPLACE FUNCTION task_next_reminder(
+            due_at TIMESTAMPTZ, mask INTEGER, reminded INTEGER[], options INTEGER[]
+        ) RETURNS TIMESTAMPTZ AS $$
+            SELECT due_at - make_interval(mins => max(o.offset_min))
+            FROM unnest(options) WITH ORDINALITY AS o(offset_min, bit)
+            WHERE mask & (1 << (o.bit::int - 1)) <> 0
+              AND NOT o.offset_min = ANY(reminded)
+        $$ LANGUAGE sql IMMUTABLE
+        ''',
+        # Прошедшим задачам напоминать уже нечего, им остаётся NULL.
+        # Варианты - config.REMINDER_OPTIONS на момент миграции
+        '''
+        UPDATE tasks t
+        SET next_remind_at = task_next_reminder(
+            t.due_at, COALESCE(t.reminder_mask, u.reminder_mask), t.reminded_offsets,
+            ARRAY[5, 15, 30, 60, 10, 120, 180, 1440]
+        )
+        FROM users u
+        WHERE u.user_id = t.user_id AND t.reminded = FALSE AND t.due_at > now()
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS tasks_next_remind_at_idx
+        ON tasks (next_remind_at)
+        WHERE reminded = FALSE
+        ''',
+    ]),
+    (14, "Ход и завершение запусков job_runs", [
+        # progress - докуда дошёл запуск, heartbeat_at - когда он отмечался в
+        # последний раз, completed_at - когда закончился. Незавершённый запуск
+        # без отметок дольше config.JOB_LEASE подхватывает другой экземпляр
+        'ALTER TABLE job_runs ADD COLUMN IF NOT EXISTS progress TEXT',
+        'ALTER TABLE job_runs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ',
+        'ALTER TABLE job_runs ADD COLUMN IF NOT EXISTS completed_at TIMESTAMPTZ',
+        # Прошлые запуски считаются завершёнными: доделывать их поздно
+        '''
+        UPDATE job_runs
+        SET heartbeat_at = claimed_at, completed_at = claimed_at
+        WHERE completed_at IS NULL
+        ''',
+    ]),
+]
+
+
+def migrate(cursor) -> list:
+    """Применить недостающие миграции в текущей транзакции; вернуть их версии"""
+    cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_KEY,))
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    current_version = cursor.fetchone()[0]
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            'INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+            (version, description)
+        )
+        logger.info(f"Миграция {version} применена: {description}")
+        applied.append(version)
+    return applied
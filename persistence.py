@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import PERSISTENCE_INTERVAL, PERSISTENCE_DEBOUNCE
+
+logger = logging.getLogger(__name__)
+
+# Виды записей в таблице bot_persistence
+USER_DATA = 'user_data'
+CONVERSATION = 'conversation:'
+
+class PostgresPersistence(BasePersistence):
+    """Хранение состояния диалогов и context.user_data в PostgreSQL.
+
+    Бот хранит только user_data и состояния ConversationHandler, поэтому
+    данные чатов, бота и callback_data не сохраняются. Изменения копятся в
+    памяти и записываются пачкой одним запросом: PTB сообщает о них раз в
+    update_interval секунд, а запись откладывается ещё на debounce секунд,
+    чтобы собрать в неё все изменения этого прохода.
+    """
+
+    def __init__(self, db, update_interval: float = PERSISTENCE_INTERVAL,
+                 debounce: float = PERSISTENCE_DEBOUNCE):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = db
+        self.debounce = debounce
+        self._pending = {}  # (kind, key) -> данные в JSON или None для удаления
+        self._write_task = None
+
+    # === ЗАГРУЗКА ПРИ СТАРТЕ ===
+
+    async def get_user_data(self):
+        rows = await self.db.get_persistent_state(USER_DATA)
+        return {int(key): data for key, data in rows}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = await self.db.get_persistent_state(CONVERSATION + name)
+        return {tuple(json.loads(key)): state for key, state in rows}
+
+    # === ИЗМЕНЕНИЯ ===
+
+    async def update_conversation(self, name, key, new_state):
+        # Завершённый диалог (None) удаляется из таблицы
+        self._schedule(CONVERSATION + name, json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._schedule(USER_DATA, str(user_id), dict(data) or None)
+
+    async def drop_user_data(self, user_id):
+        self._schedule(USER_DATA, str(user_id), None)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Записать всё накопленное сразу (при остановке бота)"""
+        if self._write_task:
+            self._write_task.cancel()
+            self._write_task = None
+        await self._write()
+
+    def _schedule(self, kind, key, data):
+        self._pending[(kind, key)] = None if data is None else json.dumps(data, ensure_ascii=False)
+        if not self._write_task:
+            self._write_task = asyncio.create_task(self._write_later())
+
+    async def _write_later(self):
+        await asyncio.sleep(self.debounce)
+        self._write_task = None
+        await self._write()
+
+    async def _write(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        upserts = [(kind, key, data) for (kind, key), data in batch.items() if data is not None]
+        deletes = [(kind, key) for (kind, key), data in batch.items() if data is None]
+        try:
+            await self.db.save_persistent_state(upserts, deletes)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения состояния бота: {e}")
+            # Вернуть несохранённое, не затирая более свежие изменения
+            for entry_key, data in batch.items():
+                self._pending.setdefault(entry_key, data)
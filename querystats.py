@@ -0,0 +1,183 @@
+"""Статистика запросов к базе и журнал медленных запросов.
+
+Соединения пула Database создаются с курсором ProfilingCursor, поэтому
+через него проходит каждый запрос: из _execute_query, _fetchall, _stream
+и собственных блоков методов с cursor.execute и execute_values. Запросы
+группируются по тексту без значений, для каждого копятся число вызовов,
+суммарное время, строки и ошибки, а p99 считается по последним вызовам.
+Запросы дольше DB_SLOW_QUERY_MS пишутся в журнал вместе с планом EXPLAIN.
+Накопления по запросам отдаются и в /metrics (planner_db_statement_*).
+"""
+import functools
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import cursor as plain_cursor
+
+from config import DB_SLOW_QUERY_MS
+from metrics import Collected, Counter
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних длительностей хранить на запрос для p99
+SAMPLES_PER_STATEMENT = 1000
+# Больше разных запросов не бывает; всё сверх - в одну строку, чтобы память не росла
+MAX_STATEMENTS = 500
+OTHER_STATEMENTS = '<другие запросы>'
+# Длина текста запроса в метке метрик
+STATEMENT_LABEL_WIDTH = 200
+# План строится только для запросов, которые EXPLAIN умеет разбирать
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+SLOW_QUERIES = Counter('planner_db_slow_queries_total', 'Запросы дольше DB_SLOW_QUERY_MS')
+
+_SPACES = re.compile(r'\s+')
+# Значения, которые execute_values и запросы без параметров подставляют в текст
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\bARRAY\[[^\]]*\]|\b(?:\d+(?:\.\d+)?|TRUE|FALSE|NULL)\b", re.IGNORECASE)
+_ROWS = re.compile(r'\((?:\s*\?(?:::[\w\[\]]+)?\s*,?)+\)(?:\s*,\s*\((?:\s*\?(?:::[\w\[\]]+)?\s*,?)+\))*')
+
+@functools.lru_cache(maxsize=1024)
+def _template_key(query: str) -> str:
+    return _SPACES.sub(' ', query).strip()
+
+def statement_key(query, params) -> str:
+    """Текст запроса без значений: одинаковые запросы с разными данными - одна строка статистики"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    if params is not None:
+        # Шаблон с %s: значения приходят отдельно, шаблонов в коде немного
+        return _template_key(query)
+    key = _LITERALS.sub('?', _SPACES.sub(' ', query).strip())
+    return _ROWS.sub('(...)', key)
+
+class _Statement:
+    __slots__ = ('calls', 'total', 'rows', 'errors', 'samples')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.samples = deque(maxlen=SAMPLES_PER_STATEMENT)
+
+class QueryStats:
+    def __init__(self):
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float, rows: int, error: bool = False):
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is None:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    key = OTHER_STATEMENTS
+                statement = self._statements.setdefault(key, _Statement())
+            statement.calls += 1
+            statement.total += seconds
+            statement.rows += rows
+            statement.errors += error
+            statement.samples.append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+    def top(self, limit: int = 10) -> list:
+        """[(запрос, вызовы, всего мс, среднее мс, p99 мс, строки, ошибки)] по убыванию общего времени"""
+        with self._lock:
+            snapshot = [
+                (key, s.calls, s.total, s.rows, s.errors, sorted(s.samples))
+                for key, s in self._statements.items()
+            ]
+        snapshot.sort(key=lambda item: item[2], reverse=True)
+        return [
+            (key, calls, total * 1000, total * 1000 / calls,
+             samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, rows, errors)
+            for key, calls, total, rows, errors, samples in snapshot[:limit]
+        ]
+
+    def totals(self) -> list:
+        """[(запрос, вызовы, всего с, строки, ошибки)] без сортировки"""
+        with self._lock:
+            return [(key, s.calls, s.total, s.rows, s.errors) for key, s in self._statements.items()]
+
+    def report(self, limit: int = 10, query_width: int = 100) -> str:
+        """Самые затратные запросы текстом для /dbstats и журнала"""
+        top = self.top(limit)
+        if not top:
+            return "📭 Запросов к базе ещё не было"
+        lines = []
+        for number, (key, calls, total, average, p99, rows, errors) in enumerate(top, 1):
+            query = key if len(key) <= query_width else key[:query_width - 1] + '…'
+            lines.append(
+                f"{number}. {query}\n"
+                f"   вызовов {calls}, всего {total:.0f} мс, среднее {average:.1f} мс, "
+                f"p99 {p99:.1f} мс, строк {rows}" + (f", ошибок {errors}" if errors else "")
+            )
+        return "\n\n".join(lines)
+
+STATS = QueryStats()
+
+def _collect(field):
+    """collect() для metrics.Collected: поле totals по запросам; обрезанные
+    до одинакового текста запросы складываются"""
+    def collect():
+        values = {}
+        for total in STATS.totals():
+            label = (total[0][:STATEMENT_LABEL_WIDTH],)
+            values[label] = values.get(label, 0) + total[field]
+        return values
+    return collect
+
+Collected('planner_db_statement_calls_total', 'Вызовы запроса к базе', 'counter', ['statement'], _collect(1))
+Collected('planner_db_statement_seconds_total', 'Суммарное время запроса к базе', 'counter', ['statement'], _collect(2))
+Collected('planner_db_statement_rows_total', 'Строки запроса к базе', 'counter', ['statement'], _collect(3))
+Collected('planner_db_statement_errors_total', 'Ошибки запроса к базе', 'counter', ['statement'], _collect(4))
+
+class ProfilingCursor(plain_cursor):
+    """Курсор, который замеряет каждый execute и пишет медленные запросы с планом"""
+
+    def execute(self, query, params=None):
+        key = statement_key(query.as_string(self) if isinstance(query, sql.Composable) else query, params)
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, params)
+        except Exception:
+            STATS.record(key, time.perf_counter() - started, 0, error=True)
+            raise
+        elapsed = time.perf_counter() - started
+        STATS.record(key, elapsed, max(self.rowcount, 0))
+        if DB_SLOW_QUERY_MS and elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            SLOW_QUERIES.inc()
+            logger.warning(
+                f"🐢 Медленный запрос {elapsed * 1000:.0f} мс: {key}\n{self._explain(query, params)}"
+            )
+        return result
+
+    def _explain(self, query, params) -> str:
+        """План запроса в той же транзакции; ошибка EXPLAIN не ломает транзакцию вызывающего"""
+        text = query.as_string(self) if isinstance(query, sql.Composable) else query
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', 'replace')
+        if not text.lstrip().upper().startswith(EXPLAINABLE):
+            return "(план не строится для этого запроса)"
+        # Вне транзакции точка сохранения не нужна (и невозможна)
+        savepoint = not self.connection.autocommit
+        with self.connection.cursor(cursor_factory=plain_cursor) as cursor:
+            try:
+                if savepoint:
+                    cursor.execute('SAVEPOINT explain_slow_query')
+                cursor.execute('EXPLAIN ' + text, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if savepoint:
+                    cursor.execute('RELEASE SAVEPOINT explain_slow_query')
+                return plan
+            except psycopg2.Error as e:
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+                return f"(план не получен: {e})"
@@ -0,0 +1,167 @@
+"""Разбор задачи одной строкой: "/add завтра 15:30 позвонить маме", "в пятницу в 9 отчёт".
+
+Из строки по очереди вырезаются дата и время, остаток считается описанием.
+Все выражения компилируются один раз при импорте.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+# Время ЧЧ:ММ - та же проверка, что и при пошаговом добавлении
+TIME_RE = re.compile(r'^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$')
+
+# Быстрые даты: кнопки пошагового добавления и слова в строке -> через сколько дней
+QUICK_DATES = {
+    "📅 Сегодня": 0,
+    "📆 Завтра": 1,
+    "🗓 Послезавтра": 2,
+}
+DAY_WORDS = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+
+WEEKDAYS = {
+    'понедельник': 0, 'пн': 0,
+    'вторник': 1, 'вт': 1,
+    'среду': 2, 'среда': 2, 'ср': 2,
+    'четверг': 3, 'чт': 3,
+    'пятницу': 4, 'пятница': 4, 'пт': 4,
+    'субботу': 5, 'суббота': 5, 'сб': 5,
+    'воскресенье': 6, 'вс': 6,
+}
+
+MONTHS = {
+    'января': 1, 'февраля': 2, 'марта': 3, 'апреля': 4, 'мая': 5, 'июня': 6,
+    'июля': 7, 'августа': 8, 'сентября': 9, 'октября': 10, 'ноября': 11, 'декабря': 12,
+}
+
+RELATIVE_RE = re.compile(
+    r'\bчерез\s+(?:(\d{1,3})\s+)?(минут[уы]?|час(?:а|ов)?|д(?:ень|ня|ней)|недел[юиь])\b'
+)
+# ДД.ММ или ДД.ММ.ГГГГ; месяц одной цифрой - только с годом, чтобы "2.5 кг" не стало
+# 2 мая. Рядом с датой не должно быть других цифр, точек и запятых числа ("1.10.2", "3,25")
+NUMERIC_DATE_RE = re.compile(r'(?<![\d.,])\b(\d{1,2})\.(\d{2}|\d(?=\.\d{4}))(?:\.(\d{4}))?(?![.,]?\d)')
+MONTH_DATE_RE = re.compile(r'\b(\d{1,2})\s+(' + '|'.join(MONTHS) + r')\b')
+DAY_WORD_RE = re.compile(r'\b(' + '|'.join(DAY_WORDS) + r')\b')
+# Сокращения дней недели - только после "в" или первым словом строки, чтобы не путать
+# их со словами описания
+WEEKDAY_RE = re.compile(
+    r'(?:\bво?\s+)?\b(понедельник|вторник|среду|среда|четверг|пятницу|пятница|субботу|суббота|воскресенье)\b'
+    r'|\bво?\s+(пн|вт|ср|чт|пт|сб|вс)\b'
+    r'|^\s*(пн|вт|ср|чт|пт|сб|вс)\b'
+)
+CLOCK_RE = re.compile(r'(?:\bв\s+)?\b([0-1]?[0-9]|2[0-3]):([0-5][0-9])\b')
+HOUR_RE = re.compile(
+    r'\bв\s+([0-1]?[0-9]|2[0-3])(?:\s*ч(?:ас(?:а|ов)?)?\.?)?(?:\s+(утра|дня|вечера|ночи))?(?!\S)'
+)
+NOON_RE = re.compile(r'\bв\s+полдень\b')
+SPACES_RE = re.compile(r'\s+')
+# Предлоги, оставшиеся по краям описания после вырезания даты и времени
+EDGE_WORDS_RE = re.compile(r'^(?:(?:в|во|на)\s+)+|(?:\s+(?:в|во|на))+$')
+
+def parse_quick_add(text: str, now: datetime) -> Tuple[Optional[str], Optional[date], Optional[str]]:
+    """(описание, дата, время ЧЧ:ММ) из строки; чего нет в строке - None.
+
+    now - текущее время пользователя без tzinfo. Если указано только время,
+    дата - сегодня или, если это время уже прошло, завтра.
+    """
+    rest = text.strip()
+    task_date, task_time = None, None
+
+    match = RELATIVE_RE.search(rest.lower())
+    if match:
+        amount = int(match.group(1) or 1)
+        unit = match.group(2)
+        if unit.startswith('минут'):
+            moment = now + timedelta(minutes=amount)
+            task_date, task_time = moment.date(), moment.strftime('%H:%M')
+        elif unit.startswith('час'):
+            moment = now + timedelta(hours=amount)
+            task_date, task_time = moment.date(), moment.strftime('%H:%M')
+        elif unit.startswith('недел'):
+            task_date = (now + timedelta(weeks=amount)).date()
+        else:
+            task_date = (now + timedelta(days=amount)).date()
+        rest = _cut(rest, match)
+
+    weekday = None
+    if task_date is None:
+        task_date, rest = _find_date(rest, now)
+        if task_date is None:
+            match = WEEKDAY_RE.search(rest.lower())
+            if match:
+                weekday = WEEKDAYS[match.group(1) or match.group(2) or match.group(3)]
+                rest = _cut(rest, match)
+
+    if task_time is None:
+        task_time, rest = _find_time(rest)
+
+    if weekday is not None:
+        days_ahead = (weekday - now.weekday()) % 7
+        if days_ahead == 0 and (task_time is None or task_time <= now.strftime('%H:%M')):
+            days_ahead = 7
+        task_date = now.date() + timedelta(days=days_ahead)
+    elif task_date is None and task_time is not None:
+        task_date = now.date()
+        if task_time <= now.strftime('%H:%M'):
+            task_date += timedelta(days=1)
+
+    task_text = EDGE_WORDS_RE.sub('', SPACES_RE.sub(' ', rest).strip()).strip()
+    return task_text or None, task_date, task_time
+
+def _find_date(rest, now):
+    lowered = rest.lower()
+
+    match = DAY_WORD_RE.search(lowered)
+    if match:
+        return now.date() + timedelta(days=DAY_WORDS[match.group(1)]), _cut(rest, match)
+
+    match = NUMERIC_DATE_RE.search(lowered)
+    if match:
+        day, month, year = match.groups()
+        found = _date_ahead(now, int(day), int(month), int(year) if year else None)
+        if found:
+            return found, _cut(rest, match)
+
+    match = MONTH_DATE_RE.search(lowered)
+    if match:
+        found = _date_ahead(now, int(match.group(1)), MONTHS[match.group(2)], None)
+        if found:
+            return found, _cut(rest, match)
+
+    return None, rest
+
+def _find_time(rest):
+    lowered = rest.lower()
+
+    match = CLOCK_RE.search(lowered)
+    if match:
+        return f"{int(match.group(1)):02d}:{match.group(2)}", _cut(rest, match)
+
+    match = HOUR_RE.search(lowered)
+    if match:
+        hour = int(match.group(1))
+        part_of_day = match.group(2)
+        if part_of_day in ('дня', 'вечера') and hour < 12:
+            hour += 12
+        elif part_of_day == 'ночи' and hour == 12:
+            hour = 0
+        return f"{hour:02d}:00", _cut(rest, match)
+
+    match = NOON_RE.search(lowered)
+    if match:
+        return "12:00", _cut(rest, match)
+
+    return None, rest
+
+def _date_ahead(now, day, month, year):
+    """Дата из дня и месяца; без года - ближайшая такая дата не раньше сегодня"""
+    try:
+        found = date(year or now.year, month, day)
+        if year is None and found < now.date():
+            found = date(now.year + 1, month, day)
+    except ValueError:
+        return None
+    return found
+
+def _cut(rest, match):
+    """Вырезать найденное (позиции в строке в нижнем регистре совпадают с исходной)"""
+    return rest[:match.start()] + ' ' + rest[match.end():]
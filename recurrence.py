@@ -0,0 +1,64 @@
+import functools
+from datetime import datetime
+from typing import List, Optional
+
+from dateutil.rrule import rrulestr
+
+# Готовые правила повторения: название -> RRULE
+PRESETS = {
+    'ежедневно': 'FREQ=DAILY',
+    'будни': 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR',
+    'еженедельно': 'FREQ=WEEKLY',
+    'daily': 'FREQ=DAILY',
+    'weekdays': 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR',
+    'weekly': 'FREQ=WEEKLY',
+}
+
+# Частоты не чаще раза в день
+ALLOWED_FREQS = {'DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY'}
+# Части правила, несколько значений которых дают несколько повторений в день
+TIME_PARTS = ('BYHOUR', 'BYMINUTE', 'BYSECOND')
+
+RULE_NAMES = {
+    'FREQ=DAILY': 'ежедневно',
+    'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR': 'по будням',
+    'FREQ=WEEKLY': 'еженедельно',
+}
+
+def parse_rule(text: str) -> Optional[str]:
+    """RRULE из названия (будни, ежедневно, ...) или строки RRULE; None, если правило неверное.
+
+    Повторения чаще раза в день не поддерживаются: напоминания о соседних
+    повторениях пересекались бы. Поэтому кроме FREQ не чаще DAILY в BYHOUR,
+    BYMINUTE и BYSECOND допускается только одно значение.
+    """
+    text = text.strip()
+    rule = PRESETS.get(text.lower())
+    if rule is None:
+        rule = text.upper()
+        if rule.startswith('RRULE:'):
+            rule = rule[len('RRULE:'):]
+    try:
+        rrulestr(rule, dtstart=datetime(2000, 1, 1))
+    except (ValueError, TypeError):
+        return None
+    parts = dict(part.partition('=')[::2] for part in rule.split(';') if part)
+    if parts.get('FREQ') not in ALLOWED_FREQS:
+        return None
+    if any(len(parts[name].split(',')) > 1 for name in TIME_PARTS if name in parts):
+        return None
+    return rule
+
+def describe_rule(rule: str) -> str:
+    return RULE_NAMES.get(rule, rule)
+
+@functools.lru_cache(maxsize=4096)
+def _rrule(rule: str, dtstart: datetime):
+    return rrulestr(rule, dtstart=dtstart)
+
+def occurrences(rule: str, dtstart: datetime, start: datetime, end: datetime) -> List[datetime]:
+    """Повторения серии в промежутке [start, end]; все времена - локальные, без tzinfo"""
+    return _rrule(rule, dtstart).between(start, end, inc=True)
+
+def next_occurrence(rule: str, dtstart: datetime, after: datetime) -> Optional[datetime]:
+    return _rrule(rule, dtstart).after(after)
@@ -0,0 +1,49 @@
+"""Смещения напоминаний в виде битовой маски.
+
+Бит i маски означает "напомнить за REMINDER_OPTIONS[i] минут". Маска
+пользователя (users.reminder_mask) действует на все его задачи, маска задачи
+(tasks.reminder_mask) её заменяет; NULL у задачи - как у пользователя.
+"""
+from typing import List, Optional
+
+from config import REMINDER_OPTIONS, REMINDER_TIMES
+
+# Самое раннее напоминание среди всех вариантов: насколько вперёд смотреть планировщику
+MAX_OFFSET = max(REMINDER_OPTIONS)
+
+def to_mask(offsets) -> int:
+    """Маска из списка минут; минуты не из REMINDER_OPTIONS пропускаются"""
+    mask = 0
+    for bit, option in enumerate(REMINDER_OPTIONS):
+        if option in offsets:
+            mask |= 1 << bit
+    return mask
+
+DEFAULT_MASK = to_mask(REMINDER_TIMES)
+
+def offsets_of(mask: int) -> List[int]:
+    """Минуты из маски по возрастанию"""
+    return sorted(option for bit, option in enumerate(REMINDER_OPTIONS) if mask >> bit & 1)
+
+def parse_offset(text: str) -> Optional[int]:
+    """Минуты из данных кнопки; None, если это не вариант из REMINDER_OPTIONS"""
+    if not text.isdigit() or int(text) not in REMINDER_OPTIONS:
+        return None
+    return int(text)
+
+def toggle(mask: int, offset: int) -> int:
+    return mask ^ (1 << REMINDER_OPTIONS.index(offset))
+
+def format_offset(minutes: int) -> str:
+    if minutes % 1440 == 0:
+        return f"{minutes // 1440} д"
+    if minutes % 60 == 0:
+        return f"{minutes // 60} ч"
+    return f"{minutes} мин"
+
+def describe_mask(mask: int) -> str:
+    """"за 5 мин, 1 ч" или "без напоминаний" """
+    offsets = offsets_of(mask)
+    if not offsets:
+        return "без напоминаний"
+    return "за " + ", ".join(format_offset(minutes) for minutes in offsets)
@@ -0,0 +1,42 @@
+"""Маршрутизация сообщений вне диалогов добавления задачи.
+
+Вместо цепочки MessageHandler/CommandHandler, где фильтры проверяются по
+очереди, - два обработчика: известные команды распознаются одним регулярным
+выражением (до диалогов, как раньше CommandHandler), кнопки меню и прочий
+текст - поиском в словаре (после диалогов).
+"""
+import re
+
+# Удаление по ID: "12", "12, 15 17"
+TASK_IDS_RE = re.compile(r'^\d+(?:[\s,]+\d+)*$')
+
+class Router:
+    def __init__(self, texts, commands, task_ids, unknown_command, default):
+        self.texts = dict(texts)
+        self.commands = {name.lower(): handler for name, handler in commands.items()}
+        self.task_ids = task_ids
+        self.unknown_command = unknown_command
+        self.default = default
+        # /команда[@бот] [аргументы] - только известные команды
+        self.command_re = re.compile(
+            r'^/(' + '|'.join(map(re.escape, self.commands)) + r')(?:@(\w+))?(?:\s+(.*))?$',
+            re.IGNORECASE | re.DOTALL
+        )
+
+    def resolve_command(self, match, bot_username=None):
+        """(обработчик, аргументы) для совпадения command_re; (None, None) - команда другому боту"""
+        name, mention, payload = match.groups()
+        if mention and bot_username and mention.lower() != bot_username.lower():
+            return None, None
+        return self.commands[name.lower()], payload.split() if payload else []
+
+    def resolve_text(self, text):
+        """Обработчик для кнопки меню, неизвестной команды, списка ID или любого текста"""
+        handler = self.texts.get(text)
+        if handler is not None:
+            return handler
+        if text.startswith('/'):
+            return self.unknown_command
+        if TASK_IDS_RE.match(text):
+            return self.task_ids
+        return self.default
@@ -1,135 +1,461 @@
-import threading
-import time
+import asyncio
+import functools
+import heapq
 import datetime
-from database import Database
 import logging
-from config import REMINDER_TIMES
+from config import INSTANCE_ID, JOB_LEASE
+from keyboards import inline_markup, weekly_buttons
+from recurrence import occurrences
+from reminders import DEFAULT_MASK, MAX_OFFSET, offsets_of
+from templates import render_weekly
+from timezones import local_now, to_local, to_utc, utc_now
 
 logger = logging.getLogger(__name__)
 
+# На сколько вперёд держать напоминания в памяти; дальние задачи догружаются из базы
+REMINDER_HORIZON = datetime.timedelta(hours=24)
+# Самое раннее напоминание: на столько дальше горизонта смотрят задачи и серии
+MAX_REMINDER = datetime.timedelta(minutes=MAX_OFFSET)
+# Как часто догружать задачи, попавшие в горизонт
+RELOAD_INTERVAL = datetime.timedelta(hours=1)
+# Через сколько недельных напоминаний отмечать ход рассылки в job_runs
+WEEKLY_PROGRESS_EVERY = 100
+
+# Виды записей в куче
+TASK = 0
+SERIES = 1
+
 class Scheduler:
-    def __init__(self, bot):
-        self.bot = bot
-        self.db = Database()
-        self.is_running = False
-        self.thread = None
-    
-    def start(self):
-        """Запуск планировщика в отдельном потоке"""
-        self.is_running = True
-        self.thread = threading.Thread(target=self._run)
-        self.thread.daemon = True
-        self.thread.start()
+    """Планировщик напоминаний, работающий в event loop приложения.
+
+    Ближайшие моменты напоминаний хранятся в min-куче, и планировщик
+    просыпается ровно к каждому из них. Проснувшись, он одним запросом
+    выбирает из базы все должные напоминания, так что пропущенные во время
+    простоя или медленной итерации тоже будут отправлены. Добавление и
+    удаление задач обновляет кучу сразу, без обращения к базе.
+
+    Повторяющиеся задачи хранятся в памяти по одной записи на серию, а их
+    повторения вычисляются из RRULE только в пределах горизонта. Какие
+    повторения уже напомнены, знает база (recurring_deliveries).
+
+    За сколько минут напоминать, задаёт маска (reminders.py): своя у задачи
+    или общая у пользователя. Маска серии - маска её владельца.
+
+    Напоминания работают с моментами due_at в UTC, поэтому не зависят от
+    часовых поясов пользователей и переходов на летнее время. Недельные
+    задачи по-прежнему идут по часам config.TIMEZONE.
+
+    Можно запускать несколько экземпляров бота на одной базе: напоминания
+    забираются из базы атомарно, напоминание в 10:00 отправляет только
+    экземпляр, первым занявший его в job_runs (рассылку упавшего экземпляра
+    доделывает другой), а перенос недели идемпотентен.
+    """
+
+    def __init__(self, sender, db):
+        self.sender = sender
+        self.db = db
+        self._heap = []  # (момент напоминания, TASK или SERIES, id задачи или серии)
+        self._tasks = {}  # id задачи -> (user_id, сколько её напоминаний ещё в куче)
+        self._series = {}  # id серии -> (user_id, текст, rrule, dtstart, часовой пояс, имя, маска)
+        self._series_scheduled = set()  # (момент напоминания, id серии), уже лежащие в куче
+        self._wakeup = None
+        self._sweep_lock = None
+        self._jobs = []
+
+    async def start(self):
+        """Загрузка ближайших задач из базы, досылка пропущенного и запуск фоновых корутин"""
+        self._wakeup = asyncio.Event()
+        self._sweep_lock = asyncio.Lock()
+        await self.load()
+        # Догнать перенос недельных задач и обслуживание секций, пропущенные, пока бот не работал
+        for job in (self._check_week_transition, self._maintain_partitions):
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"❌ Ошибка в планировщике: {e}")
+        self._jobs = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._run_job(self._next_reload, self.load)),
+            asyncio.create_task(self._run_job(self._next_weekly_reminder, self._check_weekly_reminders)),
+            asyncio.create_task(self._run_job(self._next_week_transition, self._check_week_transition)),
+            asyncio.create_task(self._run_job(self._next_partition_maintenance, self._maintain_partitions)),
+        ]
         logger.info("✅ Планировщик запущен")
-    
-    def stop(self):
+
+    async def stop(self):
         """Остановка планировщика"""
-        self.is_running = False
-        if self.thread:
-            self.thread.join()
+        for job in self._jobs:
+            job.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        self._jobs = []
         logger.info("🛑 Планировщик остановлен")
-    
-    def _run(self):
-        """Основной цикл планировщика"""
-        while self.is_running:
+
+    async def load(self):
+        """Загрузить в кучу задачи из горизонта и отправить уже должные напоминания"""
+        now = utc_now()
+        until = now + REMINDER_HORIZON + MAX_REMINDER
+        tasks = await self.db.get_upcoming_tasks(now, until)
+
+        for task_id, user_id, due_at, mask in tasks:
+            if task_id not in self._tasks:
+                self.add_task(task_id, user_id, due_at, mask)
+
+        series = await self.db.get_all_recurring_tasks()
+        self._series = {series_id: rest for series_id, *rest in series}
+        for series_id in self._series:
+            self._schedule_series(series_id, now, until)
+        logger.info(
+            f"🔄 В планировщике {len(self._tasks)} задач, {len(self._series)} серий, "
+            f"{len(self._heap)} напоминаний"
+        )
+
+        await self.sweep()
+
+    def add_task(self, task_id, user_id, due_at, mask=DEFAULT_MASK):
+        """Запланировать напоминания о новой задаче; due_at - момент задачи с часовым поясом"""
+        now = utc_now()
+        offsets = offsets_of(mask)
+        if not offsets or due_at - datetime.timedelta(minutes=offsets[-1]) > now + REMINDER_HORIZON:
+            return  # Без напоминаний или догрузится из базы, когда попадёт в горизонт
+
+        pending = 0
+        for minutes_before in offsets:
+            remind_at = due_at - datetime.timedelta(minutes=minutes_before)
+            if remind_at > now:
+                heapq.heappush(self._heap, (remind_at, TASK, task_id))
+                pending += 1
+        if not pending and due_at > now:
+            # Задача создана ближе к своему моменту, чем все её напоминания: напомнить сразу
+            heapq.heappush(self._heap, (now, TASK, task_id))
+            pending = 1
+
+        if pending:
+            self._tasks[task_id] = (user_id, pending)
+            if self._wakeup:
+                self._wakeup.set()
+
+    def remove_task(self, task_id, user_id):
+        """Отменить напоминания об удалённой задаче.
+
+        Записи в куче удаляются лениво: они пропускаются при срабатывании.
+        """
+        task = self._tasks.get(task_id)
+        if task and task[0] == user_id:
+            del self._tasks[task_id]
+
+    def reschedule_task(self, task_id, user_id, due_at, mask):
+        """Перепланировать задачу после смены её напоминаний"""
+        self._forget_tasks({task_id})
+        self.add_task(task_id, user_id, due_at, mask)
+
+    def _forget_tasks(self, task_ids):
+        """Убрать задачи из кучи сразу, а не лениво.
+
+        Иначе старые моменты собьют счётчик заново добавленной задачи.
+        """
+        for task_id in task_ids:
+            self._tasks.pop(task_id, None)
+        self._heap = [entry for entry in self._heap if not (entry[1] == TASK and entry[2] in task_ids)]
+        heapq.heapify(self._heap)
+
+    def add_series(self, series_id, user_id, task_text, rrule, dtstart, timezone, first_name=None, mask=DEFAULT_MASK):
+        """Запланировать напоминания о новой повторяющейся задаче"""
+        self._series[series_id] = (user_id, task_text, rrule, dtstart, timezone, first_name, mask)
+        now = utc_now()
+        self._schedule_series(series_id, now, now + REMINDER_HORIZON + MAX_REMINDER)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def remove_series(self, series_id, user_id):
+        """Отменить напоминания об удалённой серии; записи в куче удаляются лениво"""
+        series = self._series.get(series_id)
+        if series and series[0] == user_id:
+            del self._series[series_id]
+
+    def _schedule_series(self, series_id, now, until):
+        """Положить в кучу напоминания о повторениях серии в промежутке (now, until]"""
+        series = self._series[series_id]
+        for occurrence_at in self._series_occurrences(series, now, until):
+            for minutes_before in offsets_of(series[-1]):
+                remind_at = occurrence_at - datetime.timedelta(minutes=minutes_before)
+                if remind_at > now and (remind_at, series_id) not in self._series_scheduled:
+                    heapq.heappush(self._heap, (remind_at, SERIES, series_id))
+                    self._series_scheduled.add((remind_at, series_id))
+
+    def _series_occurrences(self, series, start, end):
+        """Моменты повторений серии в (start, end] с часовым поясом"""
+        user_id, task_text, rrule, dtstart, timezone, first_name, mask = series
+        local = occurrences(rrule, dtstart, to_local(start, timezone), to_local(end, timezone))
+        return [moment for moment in (to_utc(occurrence, timezone) for occurrence in local) if moment > start]
+
+    async def reschedule_user(self, user_id):
+        """Перепланировать задачи и серии пользователя после смены часового пояса или напоминаний"""
+        self._forget_tasks({task_id for task_id, (owner, _) in self._tasks.items() if owner == user_id})
+        now = utc_now()
+        until = now + REMINDER_HORIZON + MAX_REMINDER
+        for task_id, owner, due_at, mask in await self.db.get_upcoming_tasks(now, until, user_id):
+            self.add_task(task_id, owner, due_at, mask)
+        # Лишние моменты серий в куче пропускаются при срабатывании: по ним ничего не окажется должным
+        for series_id, *rest in await self.db.get_all_recurring_tasks(user_id):
+            self._series[series_id] = tuple(rest)
+            self._schedule_series(series_id, now, until)
+        if self._wakeup:
+            self._wakeup.set()
+        await self.sweep()
+
+    async def _run(self):
+        """Основной цикл: спим до ближайшего напоминания или до изменения кучи"""
+        while True:
+            now = utc_now()
+            due = False
+            due_series = set()
+            while self._heap and self._heap[0][0] <= now:
+                remind_at, kind, task_id = heapq.heappop(self._heap)
+                if kind == SERIES:
+                    self._series_scheduled.discard((remind_at, task_id))
+                    if task_id in self._series:
+                        due_series.add(task_id)
+                        due = True
+                    continue
+                task = self._tasks.get(task_id)
+                if task is None:
+                    continue
+                user_id, pending = task
+                if pending > 1:
+                    self._tasks[task_id] = (user_id, pending - 1)
+                else:
+                    del self._tasks[task_id]
+                due = True
+
+            if due:
+                try:
+                    await self.sweep(due_series)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка в планировщике: {e}")
+
+            timeout = None
+            if self._heap:
+                timeout = max((self._heap[0][0] - utc_now()).total_seconds(), 0)
+            self._wakeup.clear()
             try:
-                self._check_daily_reminders()
-                self._check_weekly_reminders()
-                self._check_week_transition()
-                time.sleep(60)  # Проверяем каждую минуту
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_job(self, next_run, job):
+        """Выполнять job в моменты, которые возвращает next_run(now); время - по config.TIMEZONE"""
+        while True:
+            now = local_now()
+            await asyncio.sleep((next_run(now) - now).total_seconds())
+            try:
+                await job()
             except Exception as e:
                 logger.error(f"❌ Ошибка в планировщике: {e}")
-                time.sleep(300)
-    
-    def _check_daily_reminders(self):
-        """Проверка ежедневных напоминаний"""
-        now = datetime.datetime.now()
-        
-        for minutes_before in REMINDER_TIMES:
-            reminder_time = now + datetime.timedelta(minutes=minutes_before)
-            tasks = self.db.get_tasks_for_reminder(reminder_time)
-            
-            if tasks:
-                task_ids = []
-                for task in tasks:
-                    task_id, user_id, task_text, task_date, task_time, first_name = task
-                    task_ids.append(task_id)
-                    
-                    message = (
-                        f"🔔 Напоминание, {first_name}!\n"
-                        f"Через {minutes_before} минут:\n"
-                        f"📝 {task_text}\n"
-                        f"🕐 {task_time}\n"
-                        f"📅 {task_date}"
-                    )
-                    
-                    try:
-                        self.bot.send_message(chat_id=user_id, text=message)
-                        logger.info(f"📨 Напоминание отправлено пользователю {user_id}")
-                    except Exception as e:
-                        logger.error(f"❌ Не удалось отправить напоминание: {e}")
-                
-                if task_ids:
-                    self.db.mark_as_reminded(task_ids)
-    
-    def _check_weekly_reminders(self):
-        """Проверка ежедневных напоминаний о недельных задачах в 10:00"""
-        now = datetime.datetime.now()
-        
-        if now.hour == 10 and now.minute == 0:
-            today = datetime.date.today()
-            week_start = self._get_week_start(today)
-            
-            users = self.db.get_users_for_weekly_reminder()
-            
-            for user_id in users:
+
+    async def sweep(self, series_ids=None):
+        """Отправить все должные напоминания одним запросом к базе.
+
+        Если к задаче накопилось несколько должных напоминаний (например,
+        после простоя), отправляется одно - с реальным остатком времени, а
+        доставленными отмечаются все. Напоминания отмечаются в момент, когда
+        экземпляр их забирает; не поставленные в очередь возвращаются в базу,
+        как и те, что очередь не доставила после всех повторов или не успела
+        отправить до остановки (on_failure очереди). Из серий проверяются series_ids, по умолчанию - все.
+        """
+        async with self._sweep_lock:
+            now = utc_now()
+            rows = await self.db.claim_due_reminders(now)
+
+            due = {}
+            for task_id, user_id, task_text, task_date, task_time, first_name, due_at, offset, mask in rows:
+                if task_id not in due:
+                    due[task_id] = ((user_id, task_text, task_date, task_time, first_name, due_at), [])
+                due[task_id][1].append(offset)
+
+            released = []
+            for task_id, (task, offsets) in due.items():
                 try:
-                    tasks = self.db.get_weekly_tasks(user_id, week_start.strftime('%Y-%m-%d'))
-                    if tasks:
-                        message = self._format_weekly_reminder(tasks, week_start)
-                        self.bot.send_message(chat_id=user_id, text=message)
-                        logger.info(f"📨 Недельное напоминание отправлено пользователю {user_id}")
+                    # Запланировано на самое позднее из накопившихся напоминаний
+                    await self._send_reminder(
+                        task, now, task[-1] - datetime.timedelta(minutes=min(offsets)),
+                        functools.partial(self.db.release_reminders, [(task_id, offsets)])
+                    )
                 except Exception as e:
-                    logger.error(f"❌ Ошибка отправки недельного напоминания: {e}")
-    
-    def _check_week_transition(self):
-        """Проверка перехода на новую неделю (в понедельник в 00:01)"""
-        now = datetime.datetime.now()
-        
-        if now.weekday() == 0 and now.hour == 0 and now.minute == 1:
-            last_week = self._get_week_start(datetime.date.today() - datetime.timedelta(days=7))
-            current_week = self._get_week_start(datetime.date.today())
-            
-            self.db.move_uncompleted_weekly_tasks(
-                last_week.strftime('%Y-%m-%d'), 
-                current_week.strftime('%Y-%m-%d')
-            )
-            logger.info(f"🔄 Задачи перенесены с {last_week} на {current_week}")
-    
+                    logger.error(f"❌ Напоминание о задаче {task_id} не отправлено: {e}")
+                    released.append((task_id, offsets))
+
+            await self.db.release_reminders(released)
+            await self._sweep_series(now, self._series if series_ids is None else series_ids)
+
+    async def _sweep_series(self, now, series_ids):
+        """Отправить должные напоминания о повторениях серий series_ids"""
+        candidates = {}  # (id серии, минуты) -> ближайшее повторение
+        until = now + MAX_REMINDER
+        for series_id in series_ids:
+            series = self._series.get(series_id)
+            if series is None:
+                continue
+            for occurrence_at in self._series_occurrences(series, now, until):
+                for minutes_before in offsets_of(series[-1]):
+                    if occurrence_at - datetime.timedelta(minutes=minutes_before) <= now:
+                        candidates.setdefault((series_id, minutes_before), occurrence_at)
+        if not candidates:
+            return
+
+        claimed = await self.db.claim_recurring_reminders([
+            (series_id, minutes_before, occurrence_at)
+            for (series_id, minutes_before), occurrence_at in candidates.items()
+        ])
+
+        due = {}
+        for series_id, minutes_before, occurrence_at in claimed:
+            due.setdefault((series_id, occurrence_at), []).append(minutes_before)
+
+        released = []
+        for (series_id, occurrence_at), offsets in due.items():
+            user_id, task_text, rrule, dtstart, timezone, first_name, mask = self._series[series_id]
+            local = to_local(occurrence_at, timezone)
+            occurrence_reminders = [(series_id, minutes_before, occurrence_at) for minutes_before in offsets]
+            try:
+                await self._send_reminder(
+                    (user_id, task_text, local.date(), local.time(), first_name, occurrence_at), now,
+                    occurrence_at - datetime.timedelta(minutes=min(offsets)),
+                    functools.partial(self.db.release_recurring_reminders, occurrence_reminders)
+                )
+            except Exception as e:
+                logger.error(f"❌ Напоминание о серии {series_id} не отправлено: {e}")
+                released.extend(occurrence_reminders)
+
+        await self.db.release_recurring_reminders(released)
+
+    async def _send_reminder(self, task, now, scheduled_at, on_failure=None):
+        """Постановка в очередь отправки напоминания, запланированного на scheduled_at.
+
+        on_failure возвращает напоминание в базу, если очередь его не доставит.
+        """
+        user_id, task_text, task_date, task_time, first_name, due_at = task
+        minutes_left = round((due_at - now).total_seconds() / 60)
+        message = (
+            f"🔔 Напоминание, {first_name}!\n"
+            f"Через {max(minutes_left, 1)} минут:\n"
+            f"📝 {task_text}\n"
+            f"🕐 {task_time}\n"
+            f"📅 {task_date}"
+        )
+
+        await self.sender.send(user_id, message, scheduled_at=scheduled_at, on_failure=on_failure)
+        logger.info(f"📨 Напоминание поставлено в очередь для пользователя {user_id}")
+
+    def _next_reload(self, now):
+        return now + RELOAD_INTERVAL
+
+    def _next_weekly_reminder(self, now):
+        """Ближайшие 10:00, но после 10:00 не позже чем через JOB_LEASE.
+
+        Промежуточные запуски ничего не делают, если рассылка за сегодня
+        закончена или идёт, и доделывают её, если занявший её экземпляр упал.
+        """
+        run_at = now.replace(hour=10, minute=0, second=0, microsecond=0)
+        if run_at > now:
+            return run_at
+        return min(run_at + datetime.timedelta(days=1), now + datetime.timedelta(seconds=JOB_LEASE))
+
+    def _next_week_transition(self, now):
+        """Ближайший понедельник 00:01, но не позже чем через RELOAD_INTERVAL.
+
+        Промежуточные запуски ничего не делают, если неделя уже перенесена,
+        и доделывают перенос, если в понедельник он не удался.
+        """
+        run_at = now.replace(hour=0, minute=1, second=0, microsecond=0)
+        run_at += datetime.timedelta(days=-now.weekday() % 7)
+        if run_at <= now:
+            run_at += datetime.timedelta(days=7)
+        return min(run_at, now + RELOAD_INTERVAL)
+
+    def _next_partition_maintenance(self, now):
+        """Ближайшие 03:00"""
+        run_at = now.replace(hour=3, minute=0, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += datetime.timedelta(days=1)
+        return run_at
+
+    async def _check_weekly_reminders(self):
+        """Ежедневные напоминания о недельных задачах в 10:00.
+
+        Задачи всех пользователей читаются пачками коротких запросов, и каждое
+        сообщение сразу уходит в очередь отправки; заполненная очередь
+        притормаживает чтение, поэтому память не растёт с числом пользователей,
+        а транзакция не висит открытой, пока очередь ждёт лимита Telegram.
+        Пользователи перебираются по возрастанию user_id, и последний
+        отправленный отмечается в job_runs: рассылку, прерванную падением,
+        другой запуск продолжает с него.
+        """
+        today = local_now().date()
+        run = await self._claim_run('weekly_reminder', today)
+        if not run:
+            return
+        run_key = today.isoformat()
+        last_user_id = int(run[0] or 0)
+        if last_user_id:
+            logger.info(f"▶️ Недельные напоминания продолжаются после пользователя {last_user_id}")
+        week_start = self._get_week_start(today)
+
+        sent = 0
+        async for user_id, tasks in self.db.iter_weekly_tasks_by_user(week_start.strftime('%Y-%m-%d'), last_user_id):
+            message = self._format_weekly_reminder(tasks, week_start)
+            await self.sender.send(user_id, message, reply_markup=inline_markup(weekly_buttons(tasks)))
+            last_user_id = user_id
+            sent += 1
+            if sent % WEEKLY_PROGRESS_EVERY == 0 and not await self.db.update_job_run(
+                    'weekly_reminder', run_key, INSTANCE_ID, str(last_user_id)):
+                logger.warning(f"⚠️ Недельные напоминания забрал другой экземпляр, отправлено: {sent}")
+                return
+        await self.db.update_job_run('weekly_reminder', run_key, INSTANCE_ID, str(last_user_id), completed=True)
+        logger.info(f"📨 Недельные напоминания поставлены в очередь: {sent}")
+
+    async def _check_week_transition(self):
+        """Перенос невыполненных задач всех прошлых недель на текущую.
+
+        Перенос идемпотентен, поэтому его можно запускать на нескольких
+        экземплярах бота и сколько угодно раз.
+        """
+        current_week = self._get_week_start(local_now().date())
+        moved = await self.db.roll_over_weekly_tasks(current_week.strftime('%Y-%m-%d'))
+        if moved:
+            logger.info(f"🔄 На неделю {current_week} перенесено задач: {moved}")
+
+    async def _maintain_partitions(self):
+        """Секции задач на месяцы вперёд и перенос прошедших месяцев в tasks_history.
+
+        Обслуживание идемпотентно; job_runs не даёт нескольким экземплярам
+        бота менять секции одновременно.
+        """
+        today = local_now().date()
+        if not await self._claim_run('task_partitions', today):
+            return
+        result = await self.db.maintain_task_partitions(today)
+        if result is None:
+            return  # Не завершён: после JOB_LEASE его повторит следующий запуск
+        await self.db.update_job_run('task_partitions', today.isoformat(), INSTANCE_ID, completed=True)
+        if any(result):
+            created, archived = result
+            logger.info(f"🗄 Секций задач создано: {created}, задач перенесено в архив: {archived}")
+
+    async def _claim_run(self, job, run_date):
+        """Занять запуск job за дату run_date: (progress,) как у Database.claim_job_run
+        или None, если его выполняет или уже выполнил другой экземпляр"""
+        run = await self.db.claim_job_run(job, run_date.isoformat(), INSTANCE_ID)
+        if run is None:
+            logger.info(f"⏭ {job} за {run_date} выполнен или выполняется")
+        return run
+
     def _get_week_start(self, date):
         """Получить дату начала недели (понедельник)"""
         return date - datetime.timedelta(days=date.weekday())
-    
+
     def _format_weekly_reminder(self, tasks, week_start):
         """Форматирование напоминания о недельных задачах"""
-        week_end = week_start + datetime.timedelta(days=6)
-        week_range = f"{week_start.strftime('%d.%m')} - {week_end.strftime('%d.%m.%Y')}"
-        
-        message = f"🗓 Задачи на неделю ({week_range}):\n\n"
-        
-        completed_count = 0
-        for task_id, task_text, completed in tasks:
-            if completed:
-                message += f"✅ {task_text}\n"
-                completed_count += 1
-            else:
-                message += f"📝 {task_text}\n"
-                message += f"   ✓ Выполнить_{task_id}\n\n"
-        
-        total_count = len(tasks)
-        message += f"\n📊 Прогресс: {completed_count}/{total_count} выполнено"
-        
-        if completed_count < total_count:
+        message = render_weekly(tasks, week_start)
+        if not all(completed for _, _, completed in tasks):
             message += "\n\nНе забудьте выполнить оставшиеся задачи! 💪"
-        
         return message
@@ -0,0 +1,223 @@
+import asyncio
+import time
+import logging
+from datetime import timedelta
+
+from telegram.error import RetryAfter, NetworkError, Forbidden, BadRequest, TelegramError
+
+from metrics import REMINDER_LAG, SEND_QUEUE_DEPTH, TELEGRAM_ERRORS
+from timezones import utc_now
+
+from config import (
+    SEND_RATE, SEND_CHAT_INTERVAL, SEND_CONCURRENCY,
+    SEND_MAX_RETRIES, SEND_QUEUE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором после сетевой ошибки: 1, 2, 4, ... секунд, но не больше минуты
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate операций в секунду, всплески до capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        """Остановить выдачу на seconds секунд (flood control от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class OutboundQueue:
+    """Общая очередь исходящих сообщений с ограничением частоты.
+
+    Сообщения отправляют несколько воркеров, соблюдая общий лимит бота и
+    интервал между сообщениями в один чат. При RetryAfter вся очередь
+    ждёт указанное Telegram время, при сетевых ошибках сообщение
+    повторяется с экспоненциальной паузой. Отбрасываются только сообщения,
+    которые доставить невозможно (бот заблокирован, неверный запрос).
+
+    Если сообщение не доставлено после всех повторов или не успело уйти до
+    остановки очереди, вызывается его on_failure: так планировщик
+    возвращает в базу напоминания, которые уже отметил доставленными.
+    """
+
+    def __init__(self, bot, rate: float = SEND_RATE, concurrency: int = SEND_CONCURRENCY,
+                 chat_interval: float = SEND_CHAT_INTERVAL, max_retries: int = SEND_MAX_RETRIES,
+                 maxsize: int = SEND_QUEUE_SIZE):
+        self.bot = bot
+        self.rate = rate
+        self.concurrency = concurrency
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.maxsize = maxsize
+        self.sent = 0
+        self.failed = 0
+        self._queue = None
+        self._bucket = None
+        self._chat_next = {}  # chat_id -> когда можно писать в чат снова
+        self._workers = []
+        self._retrying = {}  # отложенный повтор -> его сообщение
+        self._interrupted = []  # сообщения, на отправке которых остановили воркер
+
+    async def start(self):
+        """Запуск воркеров отправки"""
+        self._queue = asyncio.Queue(self.maxsize)
+        self._bucket = TokenBucket(self.rate)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        SEND_QUEUE_DEPTH.set_function(self.qsize)
+        logger.info(f"✅ Очередь отправки запущена ({self.concurrency} воркеров, {self.rate} сообщений/с)")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дослать накопленное (не дольше timeout секунд) и остановить воркеры"""
+        if self._queue:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Не отправлено сообщений: {self._queue.qsize()}")
+        if self._retrying:
+            logger.warning(f"⚠️ Отменены отложенные повторы: {len(self._retrying)}")
+        undelivered = list(self._retrying.values())
+        tasks = self._workers + list(self._retrying)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._retrying.clear()
+
+        undelivered += self._interrupted
+        self._interrupted = []
+        while self._queue and not self._queue.empty():
+            undelivered.append(self._queue.get_nowait())
+            self._queue.task_done()
+        for item in undelivered:
+            await self._give_up(item[-1])
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def send(self, chat_id: int, text: str, scheduled_at=None, on_failure=None, **kwargs):
+        """Поставить сообщение в очередь; ждёт, если очередь заполнена.
+
+        scheduled_at - момент (UTC), на который запланировано напоминание:
+        по нему при отправке считается задержка (metrics.REMINDER_LAG).
+        on_failure - корутинная функция без аргументов, которая вызывается,
+        если сообщение так и не ушло из-за повторяемых ошибок или остановки.
+        """
+        await self._queue.put((chat_id, text, kwargs, 0, scheduled_at, on_failure))
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(*item)
+            except asyncio.CancelledError:
+                # Остановка посреди отправки: ушло ли сообщение, неизвестно - считаем, что нет
+                self._interrupted.append(item)
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка очереди отправки: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, chat_id, text, kwargs, attempt, scheduled_at, on_failure):
+        await self._wait_for_chat(chat_id)
+        await self._bucket.acquire()
+
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            self.sent += 1
+            if scheduled_at:
+                REMINDER_LAG.observe((utc_now() - scheduled_at).total_seconds())
+        except RetryAfter as e:
+            TELEGRAM_ERRORS.inc(type(e).__name__)
+            delay = _seconds(e.retry_after)
+            logger.warning(f"⏳ Flood control: пауза {delay} с")
+            self._bucket.pause(delay)
+            await self._retry(chat_id, text, kwargs, attempt, 0, scheduled_at, on_failure)
+        except (Forbidden, BadRequest) as e:
+            # Повтор не поможет: напоминание не возвращается, иначе каждый
+            # обход отправлял бы его заново в тот же заблокированный чат
+            TELEGRAM_ERRORS.inc(type(e).__name__)
+            self.failed += 1
+            logger.error(f"❌ Сообщение пользователю {chat_id} не доставлено: {e}")
+        except NetworkError as e:
+            TELEGRAM_ERRORS.inc(type(e).__name__)
+            delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+            logger.warning(f"⚠️ Ошибка сети при отправке пользователю {chat_id}: {e}, повтор через {delay} с")
+            await self._retry(chat_id, text, kwargs, attempt, delay, scheduled_at, on_failure)
+        except TelegramError as e:
+            # Прочие ошибки API (ChatMigrated, EndPointNotFound, ...): не отправлено,
+            # но не навсегда - напоминание возвращается в базу
+            TELEGRAM_ERRORS.inc(type(e).__name__)
+            self.failed += 1
+            logger.error(f"❌ Сообщение пользователю {chat_id} не доставлено: {e}")
+            await self._give_up(on_failure)
+
+    async def _wait_for_chat(self, chat_id):
+        """Соблюсти интервал между сообщениями в один чат"""
+        now = time.monotonic()
+        next_allowed = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, next_allowed) + self.chat_interval
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+
+        # Не держим в памяти чаты, в которые давно не писали
+        if len(self._chat_next) > 10 * self.maxsize:
+            self._chat_next = {
+                chat: until for chat, until in self._chat_next.items() if until > now
+            }
+
+    async def _retry(self, chat_id, text, kwargs, attempt, delay, scheduled_at, on_failure):
+        if attempt + 1 > self.max_retries:
+            self.failed += 1
+            logger.error(f"❌ Сообщение пользователю {chat_id} не доставлено после {attempt + 1} попыток")
+            await self._give_up(on_failure)
+            return
+
+        # Повтор ставится в очередь отложенно, чтобы не занимать воркер паузой
+        item = (chat_id, text, kwargs, attempt + 1, scheduled_at, on_failure)
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self._queue.put(item)
+
+        task = asyncio.create_task(requeue())
+        self._retrying[task] = item
+        task.add_done_callback(lambda done: self._retrying.pop(done, None))
+
+    async def _give_up(self, on_failure):
+        """Сообщить отправителю, что сообщение не будет доставлено"""
+        if on_failure is None:
+            return
+        try:
+            await on_failure()
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки недоставленного сообщения: {e}")
+
+
+def _seconds(value) -> float:
+    """retry_after приходит числом секунд или timedelta в зависимости от версии PTB"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
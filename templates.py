@@ -0,0 +1,37 @@
+"""Шаблоны текстов списков задач и напоминаний.
+
+Строка списка - шаблон str.format, даты и время форматируются в нём же
+("{2:%d.%m.%Y}"). Текст собирается одним join, без промежуточных строк
+от повторных +=.
+"""
+from datetime import timedelta
+
+TASK_LINE = "🆔 {0}: {1}\n   📅 {2:%d.%m.%Y} 🕐 {3:%H:%M}\n\n"   # (id, текст, дата, время)
+DAY_TASK_LINE = "🆔 {0}: {1}\n   🕐 {2}\n\n"                     # (id, текст, время)
+RECURRING_LINE = "🔁 R{0}: {1}\n   🕐 {2:%H:%M}\n\n"              # (id серии, текст, время)
+WEEKLY_DONE_LINE = "✅ {0}\n"
+WEEKLY_TODO_LINE = "📝 {0}\n"
+
+def render(template: str, rows) -> str:
+    """Шаблон, заполненный каждой строкой rows, одним текстом"""
+    fill = template.format
+    return ''.join([fill(*row) for row in rows])
+
+def render_tasks(tasks) -> str:
+    """Список задач (id, текст, дата, время) или на день (id, текст, время)"""
+    if not tasks:
+        return "📭 Задач нет!"
+    return render(TASK_LINE if len(tasks[0]) == 4 else DAY_TASK_LINE, tasks)
+
+def render_recurring(recurring) -> str:
+    return render(RECURRING_LINE, recurring)
+
+def render_weekly(tasks, week_start) -> str:
+    """Недельные задачи (id, текст, выполнена) с заголовком недели и прогрессом"""
+    week_end = week_start + timedelta(days=6)
+    completed_count = sum(1 for _, _, completed in tasks if completed)
+    return ''.join([
+        f"🗓 Задачи на неделю ({week_start:%d.%m} - {week_end:%d.%m.%Y}):\n\n",
+        *[(WEEKLY_DONE_LINE if completed else WEEKLY_TODO_LINE).format(task_text) for _, task_text, completed in tasks],
+        f"\n📊 Прогресс: {completed_count}/{len(tasks)} выполнено",
+    ])
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+import pytz
+
+from config import TIMEZONE
+
+def is_valid_timezone(tz_name: str) -> bool:
+    return tz_name in pytz.all_timezones_set
+
+def local_now(tz_name: str = TIMEZONE) -> datetime:
+    """Текущее время в часовом поясе tz_name, без tzinfo (как даты и время задач)"""
+    return datetime.now(pytz.timezone(tz_name)).replace(tzinfo=None)
+
+def to_utc(local_dt: datetime, tz_name: str = TIMEZONE) -> datetime:
+    """Момент времени для локальных даты и времени в часовом поясе tz_name"""
+    return pytz.timezone(tz_name).localize(local_dt).astimezone(pytz.utc)
+
+def to_local(moment: datetime, tz_name: str = TIMEZONE) -> datetime:
+    """Локальные дата и время момента moment в часовом поясе tz_name, без tzinfo"""
+    return moment.astimezone(pytz.timezone(tz_name)).replace(tzinfo=None)
+
+def utc_now() -> datetime:
+    return datetime.now(pytz.utc)
@@ -0,0 +1,57 @@
+"""Параллельная обработка обновлений без гонок внутри одного пользователя.
+
+Диалог добавления задачи (ConversationHandler с persistence) и user_data
+рассчитаны на то, что обновления одного пользователя приходят по очереди:
+два одновременных нажатия иначе читают и пишут одно состояние диалога.
+Поэтому обновления разных пользователей обрабатываются параллельно, а одного
+пользователя - строго в порядке поступления, и в polling, и в webhook.
+"""
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Не больше max_concurrent_updates обновлений одновременно, от одного пользователя - по одному"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # пользователь или чат -> [asyncio.Lock, сколько обновлений его держат или ждут]
+
+    async def process_update(self, update, coroutine):
+        """Сначала очередь пользователя, потом общий слот: ждущие своей очереди
+        обновления одного пользователя не занимают слоты остальных"""
+        key = _update_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            # Не держим в памяти блокировки пользователей, от которых ничего не ждём
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def _update_key(update):
+    """Чьё это обновление: пользователь, а без него - чат; None - ничьё"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return 'user', update.effective_user.id
+    if update.effective_chat:
+        return 'chat', update.effective_chat.id
+    return None